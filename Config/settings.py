@@ -49,11 +49,13 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'account_app.metrics.MetricsMiddleware',  # first, so its latency covers the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'account_app.routers.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -90,7 +92,7 @@ SIMPLE_JWT = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'account_app.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -127,6 +129,65 @@ DATABASES = {
     }
 }
 
+# Read replicas of `default`, e.g. DATABASE_REPLICAS=/data/replica1.sqlite3,/data/replica2.sqlite3
+# They are opened read-only and only serve views marked with account_app.routers.use_replica.
+REPLICA_DATABASES = []
+for index, replica_name in enumerate(filter(None, os.getenv('DATABASE_REPLICAS', '').split(',')), start=1):
+    REPLICA_DATABASES.append(f'replica{index}')
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'NAME': f'file:{replica_name.strip()}?mode=ro',
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['account_app.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = 5  # how long a user who wrote keeps reading from the primary
+REPLICA_RETRY_SECONDS = 30  # how long an unreachable replica is skipped
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'friendsbook-metro'),
+    }
+}
+
+LAST_JOINED_USER_CACHE_TIMEOUT = 60  # seconds; saves to User/UserProfile invalidate it sooner
+
+# Per-process cache of JWT-authenticated users (see account_app.authentication). Cache hits run no
+# query. User saves invalidate entries at once in every worker sharing CACHE_BACKEND. With the default
+# LocMemCache that is only the worker that made the save: in the others a deactivation or password
+# change takes effect after JWT_USER_CACHE_TTL. Run several workers with a shared CACHE_BACKEND (Redis/Memcached).
+JWT_USER_CACHE_SIZE = 10000
+JWT_USER_CACHE_TTL = 60  # seconds; also bounds writes that skip post_save (queryset.update())
+
+# Logout revocation list (see account_app.revocation)
+TOKEN_REVOCATION_CAPACITY = 100000  # Bloom filter size before it is rebuilt larger
+TOKEN_REVOCATION_FP_RATE = 0.001
+TOKEN_REVOCATION_SYNC_SECONDS = 5  # pick up logouts from other processes
+TOKEN_REVOCATION_PRUNE_SECONDS = 3600  # delete expired rows
+
+# Request metrics (see account_app.metrics), scraped from /metrics
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']  # direct (unproxied) scrapes only
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # when set, scrapes must send "Authorization: Bearer <token>" instead
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS')) if os.getenv('SLOW_REQUEST_MS') else None  # log slower requests with their SQL
+
+# MatchHistory refreshes queued by profile/preference saves (see account_app.matching)
+MATCH_REFRESH_DELAY = 1.0  # seconds a queued match refresh waits to batch with later saves
+MATCH_REFRESH_EAGER = False  # refresh inline instead of on the background queue
+
+# Shared k-d tree of profile coordinates (see account_app.geo_index), rebuilt by manage.py build_geo_index
+GEO_INDEX_PATH = os.getenv('GEO_INDEX_PATH', os.path.join(BASE_DIR, 'geo_index.kdtree'))
+GEO_INDEX_REFRESH_SECONDS = 5  # pick up a rebuilt file and recent profile changes
+
+
+AUTHENTICATION_BACKENDS = [
+    'account_app.backends.EmailBackend',  # API login (email + password)
+    'django.contrib.auth.backends.ModelBackend',  # admin login (username + password)
+]
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -0,0 +1,19 @@
+"""
+Settings for the test suite: Config.settings plus what tests need changed.
+
+manage.py test picks this module by default; other runners should set
+DJANGO_SETTINGS_MODULE=Config.test_settings.
+"""
+import os
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+
+# Background work runs inline, against the test database
+MATCH_REFRESH_EAGER = True
+
+# Stand-in replica (a mirror of the test database); tests route to it with override_settings(REPLICA_DATABASES=[...])
+DATABASES.setdefault('replica1', {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}})  # noqa: F405
+
+# Never the real index: its user ids belong to another database. Tests that need one build it here.
+GEO_INDEX_PATH = os.path.join(tempfile.gettempdir(), f'friendsbook-test-{os.getpid()}.kdtree')
@@ -1,18 +1,31 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.utils.html import format_html
+from .bulk_import import import_file
+from .matching import queue_match_refresh
 from .models import UserProfile, UserPreference
 
+
+class UserImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV with a header row, or NDJSON with one user per line.")
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('ndjson', 'NDJSON')])
+
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('name', 'email', 'gender', 'phone_number', 'created_by', 'date_of_birth', 'profile_picture_preview')
     list_filter = ('gender', 'created_by', 'country', 'religion')
     search_fields = ('name', 'email', 'phone_number', 'country')
     ordering = ('name',)
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('age', 'created_at', 'updated_at')  # age follows date_of_birth, see refresh_ages
+    change_list_template = 'admin/account_app/userprofile/change_list.html'
 
     fieldsets = (
         ('Personal Information', {
-            'fields': ('user', 'profile_picture', 'name', 'gender', 'date_of_birth', 'email', 'phone_number', 'hide_phone_number')
+            'fields': ('user', 'profile_pic', 'name', 'gender', 'date_of_birth', 'email', 'phone_number', 'hide_phone_number')
         }),
         ('Physical Attributes', {
             'fields': ('height', 'weight', 'age'),
@@ -28,11 +41,42 @@ class UserProfileAdmin(admin.ModelAdmin):
     def profile_picture_preview(self, obj):
         """Displays the user's profile picture as a thumbnail in the admin panel."""
         if obj.profile_pic:
-            return format_html('<img src="{}" width="50" height="50" style="border-radius:5px"/>', obj.profile_pic.url)
+            return format_html('<img src="{}" width="50" height="50" style="border-radius:5px"/>', obj.profile_pic_url('thumb'))
         return "No Image"
 
     profile_picture_preview.short_description = "Profile Picture"  # Set column title in admin panel
 
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_users_view), name='account_app_userprofile_import'),
+        ] + super().get_urls()
+
+    def import_users_view(self, request):
+        """Bulk-creates users from an uploaded CSV/NDJSON file (see bulk_import)."""
+        if not self.has_add_permission(request):
+            return redirect('admin:account_app_userprofile_changelist')
+
+        form = UserImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            # Matches are materialized in the background, not while the upload request waits
+            result = import_file(form.cleaned_data['file'], form.cleaned_data['format'], materialize=False)
+            queue_match_refresh(result.user_ids, result.user_ids)
+            self.message_user(request, f"Created {result.created} users.", messages.SUCCESS)
+            for number, errors in sorted(result.errors, key=lambda error: error[0])[:50]:
+                details = "; ".join(f"{name}: {' '.join(map(str, problems))}" for name, problems in errors.items())
+                self.message_user(request, f"Row {number}: {details}", messages.ERROR)
+            if len(result.errors) > 50:
+                self.message_user(request, f"...and {len(result.errors) - 50} more rejected rows.", messages.ERROR)
+            return redirect('admin:account_app_userprofile_changelist')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Import users",
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/account_app/userprofile/import.html', context)
+
 
 @admin.register(UserPreference)
 class UserPreferenceAdmin(admin.ModelAdmin):
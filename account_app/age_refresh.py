@@ -0,0 +1,62 @@
+"""
+Bulk refresh of the denormalized UserProfile.age column (manage.py refresh_ages).
+
+Everyone who turned N between the last run and today was born in the
+date_of_birth range (years_before(last run, N), years_before(today, N)].
+A run therefore issues one narrow, index-served UPDATE per age (and a SELECT of
+the same rows' ids when their matches are re-materialized) and only touches
+people whose birthday has passed since the last run. If there is no
+earlier run, or it was a year or more ago, each age's full birth range is
+checked instead, and still only rows with a wrong age are written.
+"""
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .ages import age_on, years_before
+from .matching import refresh_matches
+from .models import AgeRefreshRun, UserProfile
+
+
+def birthday_windows(last_run, today, ages):
+    """Yields `(age, born_after, born_on_or_before)` for everyone whose age may have moved on since `last_run`."""
+    incremental = last_run is not None and last_run > years_before(today, 1)
+    for age in ages:
+        if incremental:
+            yield age, years_before(last_run, age), years_before(today, age)
+        else:
+            yield age, years_before(today, age + 1), years_before(today, age)
+
+
+def refresh_stored_ages(today=None, materialize=True):
+    """
+    Brings UserProfile.age up to date for `today` and records the run. Returns the number of rows updated.
+
+    Updated rows get a new updated_at, so the snapshot, geo index delta and ETags
+    pick them up. Their matches are re-materialized in one batch (`materialize=False`
+    leaves that to rebuild_matches).
+    """
+    today = today or date.today()
+    last_run = AgeRefreshRun.objects.filter(ran_on__lte=today).aggregate(latest=Max('ran_on'))['latest']
+    if last_run == today:
+        return 0
+
+    bounds = UserProfile.objects.aggregate(oldest=Min('date_of_birth'), youngest=Max('date_of_birth'))
+    started = timezone.now()
+    updated = 0
+    updated_user_ids = []
+    with transaction.atomic():
+        if bounds['oldest'] is not None:
+            ages = range(max(age_on(bounds['youngest'], today), 0), age_on(bounds['oldest'], today) + 1)
+            for age, born_after, born_by in birthday_windows(last_run, today, ages):
+                stale = UserProfile.objects.filter(date_of_birth__gt=born_after, date_of_birth__lte=born_by).exclude(age=age)
+                if materialize:
+                    updated_user_ids += stale.values_list('user_id', flat=True)
+                updated += stale.update(age=age, updated_at=started)
+        AgeRefreshRun.objects.update_or_create(ran_on=today, defaults={'updated': updated})
+
+    if updated_user_ids:
+        refresh_matches(profile_user_ids=updated_user_ids)
+    return updated
@@ -0,0 +1,49 @@
+"""
+Ages derived from date_of_birth.
+
+UserProfile.age is a denormalized copy for display (kept current by
+manage.py refresh_ages). Anything that compares ages, such as preference
+filters and scoring, works from date_of_birth as of today instead. That value
+never goes stale, and an age range becomes a date_of_birth range that the index can serve.
+"""
+from datetime import date
+
+from django.db.models import Q
+
+
+def age_on(date_of_birth, today):
+    """Age in whole years on `today`; a 29 February birthday counts from 1 March in other years."""
+    return today.year - date_of_birth.year - ((today.month, today.day) < (date_of_birth.month, date_of_birth.day))
+
+
+def years_before(day, years):
+    """The same calendar day `years` earlier, falling back to 28 February for the 29th."""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+def birth_date_range(age_min, age_max, today=None):
+    """
+    Returns `(born_after, born_on_or_before)` for ages `age_min`..`age_max` (inclusive) on `today`.
+
+    Either bound is None when the matching age is not given. age >= N exactly
+    when date_of_birth <= years_before(today, N), so age <= M exactly when
+    date_of_birth > years_before(today, M + 1).
+    """
+    today = today or date.today()
+    born_after = None if age_max is None else years_before(today, age_max + 1)
+    born_by = None if age_min is None else years_before(today, age_min)
+    return born_after, born_by
+
+
+def age_range_q(age_min, age_max, today=None, field='date_of_birth'):
+    """The birth_date_range predicate on `field` (e.g. 'profile__date_of_birth' from User)."""
+    born_after, born_by = birth_date_range(age_min, age_max, today)
+    query = Q()
+    if born_after is not None:
+        query &= Q(**{f'{field}__gt': born_after})
+    if born_by is not None:
+        query &= Q(**{f'{field}__lte': born_by})
+    return query
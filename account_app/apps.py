@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AccountAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'account_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (connects the receivers)
+        from .metrics import instrument_serializers
+        instrument_serializers()
@@ -0,0 +1,199 @@
+"""
+Async (ASGI) versions of the matching endpoints.
+
+DRF function views are synchronous, so these are plain Django async views: they
+authenticate the JWT themselves, read with the async ORM and hand the CPU-bound
+work (vectorized scoring, serialization) to a thread pool, which keeps the event
+loop free to serve other requests in the meantime.
+"""
+import asyncio
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from .authentication import CachedJWTAuthentication
+from .distance import haversine_km
+from .models import UserProfile
+from .pagination import KeysetPagination
+from .routers import replica_reads
+from .fast_serializers import ValuesSerializer
+from .geo_index import get_geo_index, near_in, profiles_within
+from .serializers import Explore_UserSerializer, MatchSerializer, UserProfileSerializer, parse_fieldset
+from .views import (
+    closest_distances, nearest_inputs, nearest_results, pick_match_fields, preferred_age_q, ranked_matches_inputs,
+    score_ranked_matches, stored_match_entry, stored_matches,
+)
+
+# NumPy releases the GIL, so threads are enough to take scoring off the event loop
+scoring_pool = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'MATCHING_POOL_WORKERS', 4),
+    thread_name_prefix='matching',
+)
+
+
+async def run_in_pool(func, *args):
+    # Carry the request's context (metrics, replica routing) into the pool thread
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(scoring_pool, context.run, func, *args)
+
+
+async def geo_index():
+    """get_geo_index() off the event loop, since its refresh may query the database."""
+    return await sync_to_async(get_geo_index)()
+
+
+def api_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+
+async def authenticate(request):
+    """Returns the JWT-authenticated user, or an error response to send back."""
+    try:
+        result = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+    except APIException as exc:
+        detail = exc.detail if isinstance(exc.detail, dict) else {"detail": exc.detail}
+        return None, api_response(detail, status=exc.status_code)
+    if result is None:
+        return None, api_response({"detail": "Authentication credentials were not provided."}, status=401)
+    request.user = result[0]
+    return result[0], None
+
+
+def fieldset(request, serializer_class):
+    """parse_fieldset for the query string; returns (fields, error response to send back)."""
+    try:
+        return parse_fieldset(request.GET, serializer_class), None
+    except ValidationError as exc:
+        return None, api_response(exc.detail, status=400)
+
+
+def request_data(request):
+    """Parsed request body (JSON or form), like DRF's request.data."""
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+    return request.POST
+
+
+@csrf_exempt
+@require_POST
+async def find_matches(request):
+    """Async version of views.find_matches."""
+    user, error = await authenticate(request)
+    if error:
+        return error
+
+    with replica_reads(request, user):
+        try:
+            user_profile = await UserProfile.objects.aget(user=user)
+        except UserProfile.DoesNotExist:
+            return api_response({"error": "Profile not found."}, status=404)
+
+        max_distance = float(request.GET.get("radius", 50))
+
+        if user_profile.latitude is None or user_profile.longitude is None:
+            return api_response({"error": "Your profile has no location set."}, status=400)
+
+        fields, error = fieldset(request, UserProfileSerializer)
+        if error:
+            return error
+        fast = ValuesSerializer(UserProfileSerializer, fields=fields)
+        if 'nearest' in request.GET:
+            inputs, error = await sync_to_async(nearest_inputs)(request.GET['nearest'])
+            if error:
+                return api_response(error[0], status=error[1])
+            index, k = inputs
+            latitude, longitude = float(user_profile.latitude), float(user_profile.longitude)
+            user_ids, distances = await run_in_pool(index.nearest, latitude, longitude, k + 1)  # +1: yourself
+            body = await sync_to_async(nearest_results)(user_profile, user_ids, distances, k, fast)
+            return api_response(body)
+
+        paginator = KeysetPagination()
+        age_filter = await sync_to_async(preferred_age_q)(user, request.GET)
+        index = await geo_index()
+        nearby = await run_in_pool(
+            near_in, index, UserProfile.objects.exclude(user=user).filter(age_filter),
+            user_profile.latitude, user_profile.longitude, max_distance,
+        )
+        users = fast.values(nearby, 'latitude', 'longitude', *paginator.ordering)
+
+        def within_radius(batch):
+            distances = haversine_km(
+                user_profile.latitude, user_profile.longitude,
+                [u['latitude'] for u in batch], [u['longitude'] for u in batch],
+            )
+            return [u for u, distance in zip(batch, distances) if distance <= max_distance]
+
+        matched_users = await paginator.apaginate_queryset(
+            users, Request(request), keep=lambda batch: run_in_pool(within_radius, batch)
+        )
+        data = await run_in_pool(fast.serialize, matched_users)
+        return api_response({'next': paginator.get_next_link(), 'results': data})
+
+
+@csrf_exempt
+@require_POST
+async def start_matching(request):
+    """Async version of views.start_matching."""
+    user, error = await authenticate(request)
+    if error:
+        return error
+
+    with replica_reads(request, user):
+        data = request_data(request)
+        latitude = data.get('latitude')
+        longitude = data.get('longitude')
+
+        if not latitude or not longitude:
+            return api_response({"error": "Latitude and Longitude are required."}, status=400)
+        fields, error = fieldset(request, Explore_UserSerializer)
+        if error:
+            return error
+
+        index = await geo_index()
+        if index is None:
+            # The grid-cell fallback is a query first and foremost
+            within = await sync_to_async(profiles_within)(float(latitude), float(longitude), 10)
+        else:
+            within = await run_in_pool(index.radius, float(latitude), float(longitude), 10)
+        nearby = await run_in_pool(closest_distances, *within)
+        users = [u async for u in Explore_UserSerializer.restrict(User.objects.filter(id__in=nearby, profile__isnull=False), fields)]
+
+        context = {'reference_location': (latitude, longitude), 'distances': nearby}
+        data = await run_in_pool(lambda: Explore_UserSerializer(users, many=True, fields=fields, context=context).data)
+        return api_response(data)
+
+
+@require_GET
+async def find_matches_allDetails(request):
+    """Async version of views.find_matches_allDetails."""
+    user, error = await authenticate(request)
+    if error:
+        return error
+
+    with replica_reads(request, user):
+        fields, error = fieldset(request, MatchSerializer)
+        if error:
+            return error
+        if 'limit' in request.GET:
+            inputs, error = await sync_to_async(ranked_matches_inputs)(user, request.GET)
+            if error:
+                return api_response(error[0], status=error[1])
+            return api_response(pick_match_fields(await run_in_pool(score_ranked_matches, *inputs), fields))
+
+        rows, keys = stored_matches(user, fields)
+        paginator = KeysetPagination(ordering=('-match_percentage', 'id'))
+        matches = [stored_match_entry(row, keys) for row in await paginator.apaginate_queryset(rows, Request(request))]
+        return api_response({"matches": matches, "next": paginator.get_next_link()})
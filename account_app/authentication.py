@@ -0,0 +1,129 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .revocation import get_revocation_store
+
+USER_VERSION_CACHE_KEY = 'auth-user-version:{}'
+
+
+class LRUCache:
+    """A small thread-safe LRU map whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_users = LRUCache(
+    maxsize=getattr(settings, 'JWT_USER_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'JWT_USER_CACHE_TTL', 60),
+)
+
+
+def cache_is_shared():
+    """Whether the default cache is seen by every worker process (LocMemCache and DummyCache are not)."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def user_version(user_id):
+    """
+    The user's current version stamp, kept in the default cache.
+
+    Only a shared cache (Redis, Memcached, database) makes the stamp common to
+    every worker; with LocMemCache each process has its own. A missing stamp
+    (never set, or evicted) is replaced by a fresh one, so it can never match a
+    user cached under an older stamp.
+    """
+    return cache.get_or_set(USER_VERSION_CACHE_KEY.format(user_id), time.time_ns, timeout=None)
+
+
+def invalidate_cached_user(user_id):
+    """Called when a User is saved or deleted; with a shared cache, stale copies in other processes stop matching."""
+    cache.set(USER_VERSION_CACHE_KEY.format(user_id), time.time_ns(), timeout=None)
+    _users.discard(user_id)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that rejects revoked tokens and resolves the token's user
+    through an in-process LRU cache.
+
+    Entries are keyed by user id and checked against the version stamp, so a
+    cache hit costs no query. A save or deactivation is picked up on the next
+    request by every worker that shares the stamp (all of them with a shared
+    cache, only this one with LocMemCache). Anything else, i.e. saves in other
+    processes under a process-local cache and writes that bypass post_save
+    (queryset.update()), takes effect within JWT_USER_CACHE_TTL.
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if get_revocation_store().is_revoked(validated_token.get(api_settings.JTI_CLAIM)):
+            raise InvalidToken(_("Token has been revoked"))
+        return validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        version = user_version(user_id)
+        cached = _users.get(user_id)
+        user = cached[1] if cached is not None and cached[0] == version else None
+        if user is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            _users.set(user_id, (version, user))
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        # Each request gets its own copy, so related objects it loads are not shared across threads
+        return copy.copy(user)
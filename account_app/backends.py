@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models.functions import Lower
+
+UserModel = get_user_model()
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+class EmailBackend(ModelBackend):
+    """
+    Authenticates with email + password in a single query.
+
+    The lookup is `LOWER(email) = ?`, which the auth_user_email_lower_idx
+    expression index (migration 0010) serves without a table scan.
+    """
+
+    def authenticate(self, request, email=None, password=None, **kwargs):
+        if email is None or password is None:
+            return None
+        # Two rows are enough to tell an ambiguous address from a unique one
+        users = list(
+            UserModel._default_manager.annotate(email_lower=Lower('email'))
+            .filter(email_lower=normalize_email(email))[:2]
+        )
+        if len(users) != 1:
+            # Hash anyway so unknown addresses take as long as wrong passwords
+            UserModel().set_password(password)
+            return None
+        user = users[0]
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,292 @@
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from itertools import count
+from tempfile import TemporaryDirectory
+
+import django
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .geo_index import build_geo_index
+from .matching import refresh_outgoing_matches
+from .models import UserProfile
+from .population import generate_population
+
+BENCH_PASSWORD = "bench-password-123"
+
+_sequence = count()
+
+
+def _registration_body(ctx):
+    n = next(_sequence)
+    return {
+        "username": f"bench_signup_{ctx['run']}_{n}",
+        "email": f"bench_signup_{ctx['run']}_{n}@example.com",
+        "password": BENCH_PASSWORD,
+        "first_name": "Bench",
+        "last_name": "Signup",
+        "created_by": "self",
+        "gender": "female",
+        "name": "Bench Signup",
+        "date_of_birth": "1996-04-12",
+        "height": 162.5,
+        "weight": 55,
+        "education": "Bachelor's",
+        "country": "Bangladesh",
+        "address": "Road 1",
+        "phone_number": f"+88017{n:08d}",
+        "language": "Bangla",
+        "religion": "Islam",
+        "preferred_height_min": 165,
+        "preferred_height_max": 185,
+        "preferred_age_min": 25,
+        "preferred_age_max": 35,
+        "preferred_weight_min": 55,
+        "preferred_weight_max": 85,
+        "preferred_education": "Bachelor's",
+        "preferred_location": "Bangladesh",
+    }
+
+
+# url name -> (method, build(ctx) -> (url kwargs, body), iterations override or None)
+ENDPOINTS = {
+    'user-registration': ('post', lambda ctx: ({}, _registration_body(ctx)), None),
+    'user-login': ('post', lambda ctx: ({}, {"email": ctx['user'].email, "password": BENCH_PASSWORD}), None),
+    'list-other-users': ('get', lambda ctx: ({}, None), None),
+    'user-profile-list': ('get', lambda ctx: ({}, None), None),
+    'user-profile-detail': ('get', lambda ctx: ({'pk': ctx['profile_pk']}, None), None),
+    'user-profile-export': ('get', lambda ctx: ({}, None), 3),
+    'user-preferences': ('get', lambda ctx: ({}, None), None),
+    'find_matches': ('post', lambda ctx: ({}, None), None),
+    'start_matching': ('post', lambda ctx: ({}, {"latitude": 23.8103, "longitude": 90.4125}), None),
+    'async_find_matches': ('post', lambda ctx: ({}, None), None),
+    'async_start_matching': ('post', lambda ctx: ({}, {"latitude": 23.8103, "longitude": 90.4125}), None),
+    'async_find_matches_with_all_percentise': ('get', lambda ctx: ({}, None), None),
+    'last_joined_user': ('get', lambda ctx: ({}, None), None),
+    'find_matches_with_all_percentise': ('get', lambda ctx: ({}, None), None),
+    'update_preferred_education': ('put', lambda ctx: ({}, {"preferred_education": "Master's"}), None),
+    'update_preferred_location': ('put', lambda ctx: ({}, {"preferred_location": "Bangladesh"}), None),
+    'logout': ('post', lambda ctx: ({}, {"refresh_token": ctx['refresh_token']}), None),
+}
+
+# Endpoints that revoke the tokens they are called with; every request gets its own pair and client
+SESSION_ENDING = {'logout'}
+
+
+class BenchmarkError(RuntimeError):
+    pass
+
+
+def _session(user):
+    refresh = RefreshToken.for_user(user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+    return client, str(refresh)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(samples)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _request(client, method, url, body):
+    response = getattr(client, method)(url, body, format='json')
+    if response.status_code >= 400:
+        # A failing endpoint would be timed on its error path, not the work it is meant to do
+        raise BenchmarkError(f"{method.upper()} {url} returned {response.status_code}")
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def bench_endpoint(client, ctx, name, iterations):
+    method, build, override = ENDPOINTS[name]
+    iterations = override or iterations
+
+    def prepare():
+        if name not in SESSION_ENDING:
+            return client, *build(ctx)
+        session_client, ctx['refresh_token'] = _session(ctx['user'])
+        return session_client, *build(ctx)
+
+    timings, query_counts, status_code = [], [], None
+    for _ in range(iterations):
+        request_client, kwargs, body = prepare()
+        url = reverse(name, kwargs=kwargs)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = _request(request_client, method, url, body)
+            timings.append((time.perf_counter() - started) * 1000)
+        query_counts.append(len(queries))
+        status_code = response.status_code
+
+    # One extra pass under tracemalloc, which is too slow to leave on while timing
+    request_client, kwargs, body = prepare()
+    tracemalloc.start()
+    _request(request_client, method, reverse(name, kwargs=kwargs), body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "endpoint": name,
+        "method": method.upper(),
+        "status": status_code,
+        "iterations": iterations,
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "queries": int(statistics.median(query_counts)),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(sizes, iterations=20, endpoints=None, seed=0, stdout=None):
+    """
+    Grows a synthetic population through `sizes` and times each endpoint at every size.
+
+    Meant to run against a throwaway database (see the benchmark_endpoints command).
+    Any 4xx/5xx response raises BenchmarkError. The geo index is rebuilt for each size in a temporary file, never GEO_INDEX_PATH.
+    """
+    endpoints = endpoints or list(ENDPOINTS)
+    requester = generate_population(1, seed=seed, password=BENCH_PASSWORD)[0]
+    requester.is_staff = True  # the export endpoint is staff-only
+    requester.save(update_fields=['is_staff'])
+    ctx = {
+        'run': datetime.now().strftime('%H%M%S'),
+        'user': requester,
+        'profile_pk': UserProfile.objects.get(user=requester).pk,
+    }
+    client, _ = _session(requester)
+
+    results = []
+    with TemporaryDirectory(prefix='bench-geo-') as index_dir, \
+            override_settings(GEO_INDEX_PATH=os.path.join(index_dir, 'geo_index.kdtree')):
+        for size in sorted(sizes):
+            population = UserProfile.objects.count()  # registrations add a few users per round
+            if size > population:
+                generate_population(size - population, seed=seed + size)
+            build_geo_index()
+            refresh_outgoing_matches(requester)
+            for name in endpoints:
+                row = bench_endpoint(client, ctx, name, iterations)
+                row["users"] = size
+                results.append(row)
+                if stdout is not None:
+                    stdout.write(
+                        f"{size:>7} users  {name:<42} p50 {row['p50_ms']:>9.2f} ms  p95 {row['p95_ms']:>9.2f} ms  "
+                        f"{row['queries']:>4} queries  {row['peak_memory_kb']:>10.1f} KiB  [{row['status']}]"
+                    )
+
+    return {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "iterations": iterations,
+            "sizes": sorted(sizes),
+        },
+        "results": results,
+    }
+
+
+def _legacy_login(email, password):
+    # The flow LoginSerializer used before EmailBackend: unindexed email lookup, then a second fetch by username
+    try:
+        user = User.objects.get(email=email)
+    except User.DoesNotExist:
+        return None
+    return authenticate(username=user.username, password=password)
+
+
+LOGIN_STRATEGIES = {
+    'legacy': _legacy_login,
+    'email_backend': lambda email, password: authenticate(email=email, password=password),
+}
+
+
+def bench_login(strategy, emails):
+    login = LOGIN_STRATEGIES[strategy]
+    timings, query_counts, failures = [], [], 0
+    for email in emails:
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            user = login(email, BENCH_PASSWORD)
+            timings.append((time.perf_counter() - started) * 1000)
+        query_counts.append(len(queries))
+        failures += user is None
+    return {
+        "strategy": strategy,
+        "logins": len(emails),
+        "failures": failures,
+        "logins_per_sec": round(len(emails) / (sum(timings) / 1000), 1),
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "queries": int(statistics.median(query_counts)),
+    }
+
+
+def run_login_benchmark(sizes, iterations=200, seed=0, fast_hasher=False, stdout=None):
+    """
+    Compares login throughput of the legacy two-step lookup and EmailBackend as the user table grows.
+
+    With `fast_hasher`, passwords use MD5 so the database lookup is not hidden behind PBKDF2.
+    Meant to run against a throwaway database (see the benchmark_login command).
+    """
+    hashers = ['django.contrib.auth.hashers.MD5PasswordHasher'] if fast_hasher else settings.PASSWORD_HASHERS
+    rng = random.Random(seed)
+    results = []
+    with override_settings(PASSWORD_HASHERS=hashers):
+        users = []
+        for size in sorted(sizes):
+            if size > len(users):
+                users += generate_population(size - len(users), seed=seed + size, password=BENCH_PASSWORD)
+            emails = [user.email for user in rng.choices(users, k=iterations)]
+            for strategy in LOGIN_STRATEGIES:
+                row = bench_login(strategy, emails)
+                row["users"] = size
+                results.append(row)
+                if stdout is not None:
+                    stdout.write(
+                        f"{size:>7} users  {strategy:<14} {row['logins_per_sec']:>9.1f} logins/s  "
+                        f"p50 {row['p50_ms']:>8.2f} ms  p95 {row['p95_ms']:>8.2f} ms  {row['queries']} queries"
+                    )
+
+    return {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "database": connection.vendor,
+            "iterations": iterations,
+            "fast_hasher": fast_hasher,
+            "sizes": sorted(sizes),
+        },
+        "results": results,
+    }
@@ -0,0 +1,197 @@
+import csv
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+from rest_framework import serializers
+
+from .ages import age_on
+from .backends import normalize_email
+from .geo import grid_cell
+from .matching import refresh_matches
+from .models import UserPreference, UserProfile
+from .serializers import UserProfileRegistrationSerializer, invalidate_last_joined_user
+
+BATCH_SIZE = 500
+
+PROFILE_FIELDS = [
+    'created_by', 'gender', 'name', 'date_of_birth', 'height', 'weight', 'education', 'country',
+    'address', 'phone_number', 'hide_phone_number', 'language', 'religion', 'latitude', 'longitude',
+]
+PREFERENCE_FIELDS = [
+    'preferred_height_min', 'preferred_height_max', 'preferred_age_min', 'preferred_age_max',
+    'preferred_weight_min', 'preferred_weight_max', 'preferred_education', 'preferred_location',
+]
+
+
+class ImportRowSerializer(UserProfileRegistrationSerializer):
+    """
+    Validates one import row with the registration rules.
+
+    Uniqueness is checked for the whole batch in bulk instead of one query per
+    row, and pictures are not accepted in bulk files.
+    """
+    username = serializers.CharField(max_length=150)
+    email = serializers.EmailField()
+    height = serializers.DecimalField(max_digits=5, decimal_places=2)  # NOT NULL on UserProfile
+    profile_pic = None
+    latitude = serializers.DecimalField(max_digits=9, decimal_places=6, required=False, allow_null=True)
+    longitude = serializers.DecimalField(max_digits=9, decimal_places=6, required=False, allow_null=True)
+
+    class Meta(UserProfileRegistrationSerializer.Meta):
+        fields = [name for name in UserProfileRegistrationSerializer.Meta.fields if name != 'profile_pic'] + ['latitude', 'longitude']
+
+    def validate_email(self, value):
+        return value  # checked per batch in _reject_duplicates
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    errors: list = field(default_factory=list)  # [(row number, {field: [messages]})]
+    user_ids: list = field(default_factory=list)  # ids of the created users
+
+
+def read_rows(fh, fmt):
+    """Yields (row number, dict) from a CSV (with header) or NDJSON text stream."""
+    if fmt == 'csv':
+        for number, row in enumerate(csv.DictReader(fh), start=2):
+            # Empty CSV cells mean "not given", not an empty string
+            yield number, {key: value for key, value in row.items() if key and value not in ('', None)}
+    elif fmt == 'ndjson':
+        for number, line in enumerate(fh, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError as exc:
+                yield number, {'__error__': f"Invalid JSON: {exc}"}
+    else:
+        raise ValueError(f"Unsupported format {fmt!r}; use 'csv' or 'ndjson'.")
+
+
+def _init_worker():
+    # Spawned (non-forked) workers start with an unconfigured Django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Config.settings')
+    django.setup()
+
+
+def _reject_duplicates(batch, result):
+    """Drops rows whose username/email/phone is already taken (in the DB or earlier in the file)."""
+    usernames = {data['username'] for _, data in batch}
+    emails = {normalize_email(data['email']) for _, data in batch}
+    phones = {data['phone_number'] for _, data in batch if data.get('phone_number')}
+    taken = {
+        'username': set(User.objects.filter(username__in=usernames).values_list('username', flat=True)),
+        'email': set(
+            User.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=emails).values_list('email_lower', flat=True)
+        ),
+        'phone_number': set(UserProfile.objects.filter(phone_number__in=phones).values_list('phone_number', flat=True)),
+    }
+    kept = []
+    for number, data in batch:
+        # Emails clash ignoring case, like EmailBackend looks them up
+        keys = {name: normalize_email(data['email']) if name == 'email' else data.get(name) for name in taken}
+        clashes = {name: ["Already in use."] for name, values in taken.items() if keys[name] and keys[name] in values}
+        if clashes:
+            result.errors.append((number, clashes))
+            continue
+        for name, values in taken.items():
+            if keys[name]:
+                values.add(keys[name])
+        kept.append((number, data))
+    return kept
+
+
+def _insert(batch, hashes, today):
+    users = User.objects.bulk_create([
+        User(
+            username=data['username'], email=data['email'], password=password,
+            first_name=data.get('first_name', ''), last_name=data.get('last_name', ''),
+        )
+        for (_, data), password in zip(batch, hashes)
+    ])
+    profiles, preferences = [], []
+    for user, (_, data) in zip(users, batch):
+        profile = {name: data.get(name) for name in PROFILE_FIELDS}
+        profile['hide_phone_number'] = data.get('hide_phone_number', True)
+        profile['geo_cell_lat'], profile['geo_cell_lon'] = grid_cell(profile['latitude'], profile['longitude'])
+        profiles.append(UserProfile(user=user, email=data['email'], age=age_on(data['date_of_birth'], today), **profile))
+        preferences.append(UserPreference(user=user, email=data['email'], **{name: data.get(name) for name in PREFERENCE_FIELDS}))
+    UserProfile.objects.bulk_create(profiles)
+    UserPreference.objects.bulk_create(preferences)
+    return [user.pk for user in users]
+
+
+def import_users(rows, batch_size=BATCH_SIZE, workers=None, materialize=True):
+    """
+    Creates users from (row number, dict) pairs, e.g. from read_rows().
+
+    Rows are validated with the registration rules and bad rows are reported in
+    the result instead of aborting the import. Passwords are hashed in a process
+    pool, and every batch is inserted with bulk_create in its own transaction.
+    bulk_create skips post_save, so the follow-up work the signals would do runs
+    once at the end: the imported users' matches are materialized in one batched
+    pass. With `materialize=False` that is left to the caller (see
+    queue_match_refresh) or to rebuild_matches.
+    """
+    result = ImportResult()
+    today = date.today()
+    workers = workers or getattr(settings, 'BULK_IMPORT_WORKERS', None) or os.cpu_count()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        batch = []
+        for number, raw in rows:
+            if '__error__' in raw:
+                result.errors.append((number, {'non_field_errors': [raw['__error__']]}))
+                continue
+            serializer = ImportRowSerializer(data=raw)
+            if not serializer.is_valid():
+                result.errors.append((number, serializer.errors))
+                continue
+            batch.append((number, serializer.validated_data))
+            if len(batch) >= batch_size:
+                _import_batch(batch, pool, workers, today, result)
+                batch = []
+        if batch:
+            _import_batch(batch, pool, workers, today, result)
+
+    if result.created:
+        invalidate_last_joined_user()
+        if materialize:
+            refresh_matches(result.user_ids, result.user_ids)
+    return result
+
+
+def _import_batch(batch, pool, workers, today, result):
+    batch = _reject_duplicates(batch, result)
+    if not batch:
+        return
+    chunksize = max(1, len(batch) // (workers * 4))
+    hashes = list(pool.map(make_password, [data['password'] for _, data in batch], chunksize=chunksize))
+    try:
+        with transaction.atomic():
+            user_ids = _insert(batch, hashes, today)
+    except IntegrityError as exc:
+        # Lost a race with a concurrent signup; report the batch rather than abort the import
+        for number, _ in batch:
+            result.errors.append((number, {'non_field_errors': [f"Batch rejected by the database: {exc}"]}))
+        return
+    result.created += len(user_ids)
+    result.user_ids.extend(user_ids)
+
+
+def import_file(fh, fmt, **kwargs):
+    """Convenience wrapper for binary or text file objects (e.g. admin uploads)."""
+    if isinstance(fh.read(0), bytes):
+        fh = io.TextIOWrapper(fh, encoding='utf-8-sig', newline='')
+    return import_users(read_rows(fh, fmt), **kwargs)
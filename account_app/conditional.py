@@ -0,0 +1,49 @@
+"""
+Conditional GET (ETag / Last-Modified) for views whose body only changes with BaseModel.updated_at.
+
+A client sending If-None-Match / If-Modified-Since for an unchanged resource
+gets a 304 after one aggregate query, before the view reads or serializes the
+rows themselves.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+
+
+def updated_at_condition(rows, collection=False):
+    """
+    condition() for a view rendering the rows `rows(request, *args, **kwargs)` selects.
+
+    The validators are max(updated_at) and the row count (so deletes change the
+    ETag too), read in one query shared by both functions. The ETag also covers
+    the URL (query string: cursor, ?fields=...), the requesting user and the
+    renderer, since each of those changes the body. Only GET/HEAD are checked.
+    Must sit below @api_view, where request.user and the renderer are known.
+
+    A `collection` (a list whose rows can be deleted) sends no Last-Modified:
+    deleting a row leaves max(updated_at) where it was, so If-Modified-Since
+    would keep answering 304. Its clients revalidate with the ETag.
+    """
+    def state(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        if not hasattr(request, '_updated_at_state'):
+            request._updated_at_state = rows(request, *args, **kwargs).aggregate(
+                latest=Max('updated_at'), count=Count('pk'),
+            )
+        return request._updated_at_state
+
+    def etag(request, *args, **kwargs):
+        current = state(request, *args, **kwargs)
+        if current is None or current['latest'] is None:
+            return None
+        renderer = getattr(getattr(request, 'accepted_renderer', None), 'format', '')
+        key = f"{current['latest'].isoformat()}|{current['count']}|{request.user.pk}|{renderer}|{request.build_absolute_uri()}"
+        return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+    def last_modified(request, *args, **kwargs):
+        current = state(request, *args, **kwargs)
+        return current and current['latest']
+
+    return condition(etag_func=etag, last_modified_func=None if collection else last_modified)
@@ -0,0 +1,19 @@
+import numpy as np
+
+from .geo import EARTH_RADIUS_KM
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """
+    Returns great-circle distances in km from one origin to many points in a single pass.
+
+    `latitudes`/`longitudes` may be any sequence (Decimal, float or None values);
+    points with a missing coordinate come back as NaN.
+    """
+    lat1 = np.radians(float(latitude))
+    lon1 = np.radians(float(longitude))
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon2 = np.radians(np.asarray(longitudes, dtype=np.float64))
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
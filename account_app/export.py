@@ -0,0 +1,26 @@
+from rest_framework.utils.encoders import JSONEncoder
+
+# Rows fetched per DB round trip, and lines joined per chunk written to the socket
+CHUNK_SIZE = 1000
+LINES_PER_WRITE = 200
+
+
+def iter_ndjson(queryset, serializer):
+    """
+    Yields `queryset` as newline-delimited JSON, one serialized row per line.
+
+    `serializer` only needs to_representation(), so a ValuesSerializer over a
+    `.values()` queryset works as well as a DRF serializer over instances.
+
+    The query is read with `.iterator()` and one serializer instance is reused
+    for every row, so memory stays flat whatever the table size.
+    """
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    lines = []
+    for instance in queryset.iterator(chunk_size=CHUNK_SIZE):
+        lines.append(encoder.encode(serializer.to_representation(instance)))
+        if len(lines) >= LINES_PER_WRITE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
@@ -0,0 +1,192 @@
+"""
+Read-only fast path for the list, export and last-joined-user endpoints.
+
+ValuesSerializer mirrors a DRF serializer class: it reads only the columns that
+serializer outputs, with .values(), and converts each one with a converter
+picked once per field, instead of building model instances and running every
+DRF field's get_attribute/to_representation per row. The output is identical
+to the mirrored serializer (FastSerializerParityTests keep it that way).
+
+SerializerMethodFields cannot be derived, so a mirrored serializer declares them
+in `values_methods`: {field name: (source columns, function(url, *values))},
+where `url(name)` is the memoized default-storage URL of a file name, or None.
+Fields it cannot reproduce exactly raise ImproperlyConfigured up front.
+"""
+import decimal
+from functools import lru_cache
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.settings import ISO_8601, api_settings
+
+URL_MEMO_SIZE = 4096
+
+# Fields whose representation of a plain DB value is the value itself
+_PASSTHROUGH = (
+    serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+    serializers.FloatField, PrimaryKeyRelatedField,
+)
+
+
+def _decimal_converter(field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if field.decimal_places is None or not coerce_to_string or field.localize or field.normalize_output:
+        return field.to_representation
+    # What DecimalField.quantize rebuilds on every call
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+    return lambda value: '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+
+
+def _date_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATE_FORMAT)
+    if output_format is not None and output_format.lower() == ISO_8601:
+        return lambda value: value.isoformat()
+    return field.to_representation
+
+
+def _converter(field):
+    """Converter for the raw value .values() returns for `field`, or None when it needs the request."""
+    if isinstance(field, serializers.ChoiceField):
+        choices = field.choice_strings_to_values
+        return lambda value: value if value == '' else choices.get(str(value), value)
+    if isinstance(field, serializers.DecimalField):
+        return _decimal_converter(field)
+    if isinstance(field, serializers.DateTimeField):
+        return field.to_representation  # timezone conversion depends on the active timezone
+    if isinstance(field, serializers.DateField):
+        return _date_converter(field)
+    if isinstance(field, serializers.CharField) and type(field).to_representation is serializers.CharField.to_representation:
+        return str
+    if isinstance(field, _PASSTHROUGH):
+        return lambda value: value
+    if isinstance(field, serializers.FileField):
+        return None
+    if isinstance(field, serializers.JSONField):
+        return field.to_representation
+    raise ImproperlyConfigured(f"ValuesSerializer cannot mirror {type(field).__name__} {field.field_name!r}")
+
+
+def _file_step(column, storage, use_url):
+    def step(row, fast):
+        name = row[column]
+        if not name:
+            return None
+        if not use_url:
+            return name
+        url = fast.url(name, storage)
+        return fast.request.build_absolute_uri(url) if fast.request is not None else url
+    return step
+
+
+def _method_step(columns, function):
+    def step(row, fast):
+        return function(fast.url, *(row[column] for column in columns))
+    return step
+
+
+def _field_step(column, convert):
+    def step(row, fast):
+        value = row[column]
+        return None if value is None else convert(value)
+    return step
+
+
+def _nested_step(presence_column, steps):
+    def step(row, fast):
+        if row[presence_column] is None:  # no related row (LEFT JOIN)
+            return None
+        return {name: field_step(row, fast) for name, field_step in steps}
+    return step
+
+
+def _compile(serializer, model, prefix=''):
+    """Returns (columns, [(output name, step(row, ValuesSerializer))]) for a serializer instance."""
+    columns, steps = [], []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+
+        if isinstance(field, serializers.SerializerMethodField):
+            try:
+                sources, function = serializer.values_methods[name]
+            except (AttributeError, KeyError):
+                raise ImproperlyConfigured(f"{type(serializer).__name__}.values_methods has no entry for {name!r}")
+            source_columns = [prefix + source for source in sources]
+            columns.extend(source_columns)
+            steps.append((name, _method_step(source_columns, function)))
+            continue
+
+        model_field = model._meta.get_field(field.source)
+        if isinstance(field, serializers.BaseSerializer):
+            if getattr(field, 'many', False):
+                raise ImproperlyConfigured(f"ValuesSerializer cannot mirror nested many=True field {name!r}")
+            related = model_field.related_model
+            nested_prefix = f"{prefix}{field.source}__"
+            nested_columns, nested_steps = _compile(field, related, nested_prefix)
+            presence = f"{nested_prefix}{related._meta.pk.attname}"
+            columns.extend([presence, *nested_columns])
+            steps.append((name, _nested_step(presence, nested_steps)))
+            continue
+
+        column = prefix + model_field.attname
+        columns.append(column)
+        convert = _converter(field)
+        if convert is None:
+            use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+            steps.append((name, _file_step(column, model_field.storage, use_url)))
+        else:
+            steps.append((name, _field_step(column, convert)))
+    return columns, steps
+
+
+@lru_cache(maxsize=None)
+def _plan(serializer_class, fields):
+    serializer = serializer_class() if fields is None else serializer_class(fields=fields)
+    columns, steps = _compile(serializer, serializer.Meta.model)
+    return tuple(dict.fromkeys(columns)), tuple(steps)
+
+
+class ValuesSerializer:
+    """
+    Serializes `.values(*columns)` rows exactly like `serializer_class` serializes instances.
+
+        fast = ValuesSerializer(UserProfileSerializer)
+        data = fast.serialize(fast.values(UserProfile.objects.all()))
+
+    `fields` (see serializers.parse_fieldset) is passed on to serializer_class,
+    so only the picked fields are serialized and only their columns are read.
+    """
+
+    def __init__(self, serializer_class, context=None, fields=None):
+        self.columns, self._steps = _plan(serializer_class, fields)
+        self.request = (context or {}).get('request')
+        self._urls = {}
+
+    def url(self, name, storage=default_storage):
+        """storage.url(name), memoized: most profiles share a handful of picture names (e.g. the default)."""
+        if not name:
+            return None
+        key = (id(storage), name)
+        try:
+            return self._urls[key]
+        except KeyError:
+            if len(self._urls) >= URL_MEMO_SIZE:  # keep streaming exports flat
+                self._urls.clear()
+            url = self._urls[key] = storage.url(name)
+            return url
+
+    def values(self, queryset, *extra):
+        """queryset.values() with the columns this serializer reads, plus `extra` ones the caller needs."""
+        return queryset.values(*dict.fromkeys((*self.columns, *extra)))
+
+    def to_representation(self, row):
+        return {name: step(row, self) for name, step in self._steps}
+
+    def serialize(self, rows):
+        return [self.to_representation(row) for row in rows]
@@ -0,0 +1,53 @@
+from math import cos, floor, pi, radians
+
+# Size of one spatial bucket in degrees (~28 km of latitude).
+GEO_CELL_DEGREES = 0.25
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = EARTH_RADIUS_KM * pi / 180  # Great-circle length of one degree on EARTH_RADIUS_KM
+
+
+def grid_cell(latitude, longitude):
+    """Returns the (cell_lat, cell_lon) bucket for a coordinate, or (None, None) if it is unset."""
+    if latitude is None or longitude is None:
+        return None, None
+    return (
+        floor(float(latitude) / GEO_CELL_DEGREES),
+        floor(float(longitude) / GEO_CELL_DEGREES),
+    )
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """
+    Returns the bucket ranges that fully cover a circle of `radius_km` around a point.
+
+    The result is `(lat_range, lon_ranges)` where `lat_range` is an inclusive
+    `(min, max)` tuple of cell indexes and `lon_ranges` is a list of such tuples
+    (two when the circle crosses the antimeridian), or None when every longitude
+    has to be scanned (the circle touches a pole).
+    """
+    latitude, longitude = float(latitude), float(longitude)
+    delta = radius_km / KM_PER_DEGREE
+
+    lat_min = max(latitude - delta, -90.0)
+    lat_max = min(latitude + delta, 90.0)
+    lat_range = (floor(lat_min / GEO_CELL_DEGREES), floor(lat_max / GEO_CELL_DEGREES))
+
+    if lat_min <= -90.0 or lat_max >= 90.0:
+        return lat_range, None
+
+    # Degrees of longitude shrink towards the poles, so widen by the worst case latitude
+    lon_delta = delta / cos(radians(max(abs(lat_min), abs(lat_max))))
+    if lon_delta >= 180.0:
+        return lat_range, None
+
+    lon_min, lon_max = longitude - lon_delta, longitude + lon_delta
+    if lon_min < -180.0:
+        spans = [(-180.0, lon_max), (lon_min + 360.0, 180.0)]
+    elif lon_max > 180.0:
+        spans = [(lon_min, 180.0), (-180.0, lon_max - 360.0)]
+    else:
+        spans = [(lon_min, lon_max)]
+
+    lon_ranges = [(floor(lo / GEO_CELL_DEGREES), floor(hi / GEO_CELL_DEGREES)) for lo, hi in spans]
+    return lat_range, lon_ranges
@@ -0,0 +1,380 @@
+"""
+Shared, memory-mapped k-d tree over profile coordinates for radius and k-nearest queries.
+
+The tree is built offline (manage.py build_geo_index) into one file that every
+worker maps read-only with np.memmap, so the OS page cache holds a single copy
+however many workers there are. Points are stored as unit vectors on the
+sphere: straight-line (chord) distance between them is monotonic in
+great-circle distance, so the 3-d boxes prune exactly, with no special cases
+at the antimeridian or the poles.
+
+Profiles created, moved or edited after the build are kept in a small
+per-process delta (refreshed from updated_at like the profile snapshot), which
+overrides the file's entries at query time until the next rebuild. Deletions
+leave no updated_at behind: this process drops them through discard() (see
+signals), and every refresh compares the count and sum of located user ids
+with the database to catch the ones made elsewhere.
+"""
+import json
+import os
+import struct
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .distance import haversine_km
+from .geo import EARTH_RADIUS_KM
+from .models import UserProfile
+
+# Points per leaf; leaves are scanned with one vectorized distance computation
+LEAF_SIZE = 64
+
+# How often (seconds) a request may check for a rebuilt file and pull the delta
+REFRESH_SECONDS = getattr(settings, 'GEO_INDEX_REFRESH_SECONDS', 5)
+REFRESH_OVERLAP = timedelta(seconds=2)
+
+# near() filters by exact user ids up to this many, beyond that the grid cells are the cheaper query
+MAX_ID_FILTER = 5000
+
+MAGIC = b'FBKDTRE1'
+ALIGN = 64
+
+
+def unit_vectors(latitudes, longitudes):
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def chord_for_km(radius_km):
+    return 2 * np.sin(min(radius_km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def km_for_chord(chords):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chords / 2, 0.0, 1.0))
+
+
+def _align(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+class KDTree:
+    """
+    Static k-d tree in heap layout: node i has children 2i+1 and 2i+2 and owns
+    points[start[i]:end[i]]; every leaf sits at the same depth.
+    """
+    ARRAYS = ('points', 'user_ids', 'node_start', 'node_end', 'node_lo', 'node_hi')
+
+    def __init__(self, points, user_ids, node_start, node_end, node_lo, node_hi, watermark=None):
+        self.points = points
+        self.user_ids = user_ids
+        self.node_start = node_start
+        self.node_end = node_end
+        self.node_lo = node_lo
+        self.node_hi = node_hi
+        self.watermark = watermark
+        self.first_leaf = len(node_start) // 2
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @classmethod
+    def build(cls, user_ids, latitudes, longitudes, leaf_size=LEAF_SIZE, watermark=None):
+        points = unit_vectors(latitudes, longitudes)
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        count = len(user_ids)
+        depth = max(0, int(np.ceil(np.log2(count / leaf_size)))) if count else 0
+        nodes = 2 ** (depth + 1) - 1
+
+        order = np.arange(count)
+        node_start = np.zeros(nodes, dtype=np.int64)
+        node_end = np.zeros(nodes, dtype=np.int64)
+        node_lo = np.full((nodes, 3), np.inf)
+        node_hi = np.full((nodes, 3), -np.inf)
+        node_end[0] = count
+        for node in range(nodes):
+            start, end = node_start[node], node_end[node]
+            if end > start:
+                box = points[order[start:end]]
+                node_lo[node], node_hi[node] = box.min(axis=0), box.max(axis=0)
+            if 2 * node + 1 >= nodes:
+                continue
+            # Split at the median of the widest axis
+            middle = (start + end) // 2
+            if end - start > 1:
+                axis = int(np.argmax(node_hi[node] - node_lo[node]))
+                part = np.argpartition(points[order[start:end], axis], middle - start)
+                order[start:end] = order[start:end][part]
+            node_start[2 * node + 1], node_end[2 * node + 1] = start, middle
+            node_start[2 * node + 2], node_end[2 * node + 2] = middle, end
+
+        return cls(points[order], user_ids[order], node_start, node_end, node_lo, node_hi, watermark)
+
+    def save(self, path):
+        """Writes the tree to `path` atomically (readers see the old or the new file, never half of one)."""
+        layout, offset = {}, 0
+        for name in self.ARRAYS:
+            array = getattr(self, name)
+            offset = _align(offset)
+            layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset += array.nbytes
+        header = json.dumps({
+            'arrays': layout,
+            'watermark': self.watermark.isoformat() if self.watermark else None,
+        }).encode()
+        data_start = _align(len(MAGIC) + 8 + len(header))
+
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as fh:
+            fh.write(MAGIC + struct.pack('<Q', len(header)) + header)
+            for name in self.ARRAYS:
+                fh.seek(data_start + layout[name]['offset'])
+                np.ascontiguousarray(getattr(self, name)).tofile(fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(temporary, path)
+
+    @classmethod
+    def open(cls, path):
+        """Maps a saved tree read-only; the arrays are views into the shared file pages."""
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a geo index file")
+        size = struct.unpack('<Q', bytes(buffer[len(MAGIC):len(MAGIC) + 8]))[0]
+        header = json.loads(bytes(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + size]))
+        data_start = _align(len(MAGIC) + 8 + size)
+        arrays = {
+            name: np.frombuffer(
+                buffer, dtype=spec['dtype'], count=int(np.prod(spec['shape'])), offset=data_start + spec['offset'],
+            ).reshape(spec['shape'])
+            for name, spec in header['arrays'].items()
+        }
+        watermark = parse_datetime(header['watermark']) if header['watermark'] else None
+        return cls(**arrays, watermark=watermark)
+
+    def _box_distances(self, nodes, point):
+        """Chord distance from `point` to the nearest corner/face of each node's box (0 inside it)."""
+        gap = np.maximum(np.maximum(self.node_lo[nodes] - point, point - self.node_hi[nodes]), 0)
+        return np.sqrt((gap ** 2).sum(axis=1))
+
+    def _ranges_within(self, point, chord):
+        """Point indexes in the leaves whose boxes come within `chord` of `point`, one tree level at a time."""
+        nodes = np.zeros(1, dtype=np.int64)
+        while len(nodes):
+            nodes = nodes[self._box_distances(nodes, point) <= chord]
+            if not len(nodes) or nodes[0] >= self.first_leaf:
+                break
+            nodes = np.concatenate((2 * nodes + 1, 2 * nodes + 2))
+        if not len(nodes):
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(self.node_start[n], self.node_end[n]) for n in nodes])
+
+    def radius(self, point, chord):
+        """(point indexes, chord distances) of the points within `chord` of the unit vector `point`."""
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        rows = self._ranges_within(point, chord)
+        chords = np.sqrt(((self.points[rows] - point) ** 2).sum(axis=1))
+        keep = chords <= chord
+        return rows[keep], chords[keep]
+
+    def nearest_bound(self, point, k, excluded=None):
+        """
+        A chord within which at least `k` points (not in `excluded` user ids) lie, or inf if there are fewer.
+
+        Walks down towards `point` to the smallest node still holding enough
+        points; the k-th closest of those is an upper bound for the true k-th.
+        """
+        node = 0
+        while 2 * node + 1 < len(self.node_start):
+            children = np.array([2 * node + 1, 2 * node + 2])
+            child = children[np.argmin(self._box_distances(children, point))]
+            if self.node_end[child] - self.node_start[child] < k:
+                break
+            node = child
+        rows = np.arange(self.node_start[node], self.node_end[node])
+        if excluded is not None and len(excluded):
+            rows = rows[~np.isin(self.user_ids[rows], excluded)]
+        if len(rows) < k:
+            return np.inf
+        chords = np.sqrt(((self.points[rows] - point) ** 2).sum(axis=1))
+        return np.partition(chords, k - 1)[k - 1]
+
+
+class GeoIndex:
+    """The shared tree file plus this process's delta of profiles changed since it was built."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._file = None
+        self._watermark = None
+        self._delta = {}  # user id -> (latitude, longitude), None when unset
+        # (tree, delta user ids, delta points, overridden user ids), swapped as a whole for lock-free reads
+        self._state = None
+
+    @property
+    def tree(self):
+        return self._state[0] if self._state else None
+
+    def refresh(self, force=False):
+        """Reopens the file if it was rebuilt and pulls profiles changed since, at most every REFRESH_SECONDS."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._checked_at < REFRESH_SECONDS:
+                return
+            self._checked_at = now
+
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._file, self._state = None, None
+                return
+            tree = self.tree
+            if (stat.st_ino, stat.st_mtime_ns, stat.st_size) != self._file:
+                tree = KDTree.open(self.path)
+                self._file = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                self._watermark = tree.watermark
+                self._delta = {}
+
+            profiles = UserProfile.objects.using('default')  # not a lagging replica, as for the snapshot
+            changed = profiles
+            if self._watermark is not None:
+                changed = changed.filter(updated_at__gte=self._watermark - REFRESH_OVERLAP)
+            for user_id, latitude, longitude, updated_at in changed.values_list('user_id', 'latitude', 'longitude', 'updated_at'):
+                located = latitude is not None and longitude is not None
+                self._delta[user_id] = (float(latitude), float(longitude)) if located else None
+                self._watermark = updated_at if self._watermark is None else max(self._watermark, updated_at)
+            self._swap(tree)
+
+            # Deletions made by other processes; the sum of ids also catches a delete plus a create
+            located = profiles.exclude(latitude=None).exclude(longitude=None)
+            present = located.aggregate(count=Count('user_id'), ids=Sum('user_id'))
+            indexed = self._located_ids()
+            if (present['count'], present['ids'] or 0) != (len(indexed), int(indexed.sum())):
+                gone = np.setdiff1d(indexed, np.fromiter(located.values_list('user_id', flat=True), dtype=np.int64))
+                self._delta.update(dict.fromkeys(gone.tolist()))
+                self._swap(tree)
+
+    def discard(self, user_id):
+        """Drops a deleted profile from this process's view at once (other processes reconcile on refresh)."""
+        with self._lock:
+            if self._state is not None:
+                self._delta[user_id] = None
+                self._swap(self.tree)
+
+    def _swap(self, tree):
+        moved = [(user_id, point) for user_id, point in self._delta.items() if point is not None]
+        delta_ids = np.array([user_id for user_id, _ in moved], dtype=np.int64)
+        delta_points = unit_vectors([p[0] for _, p in moved], [p[1] for _, p in moved]).reshape(-1, 3)
+        self._state = (tree, delta_ids, delta_points, np.array(sorted(self._delta), dtype=np.int64))
+
+    def _located_ids(self):
+        """User ids this index currently returns: the file's, minus those overridden, plus the delta's."""
+        tree, delta_ids, _, overridden = self._state
+        return np.concatenate((tree.user_ids[~np.isin(tree.user_ids, overridden)], delta_ids))
+
+    def radius(self, latitude, longitude, radius_km):
+        """(user ids, distances in km) of located profiles within `radius_km`, unordered."""
+        return self._within(self._state, unit_vectors([latitude], [longitude])[0], chord_for_km(radius_km))
+
+    @staticmethod
+    def _within(state, point, chord):
+        tree, delta_ids, delta_points, overridden = state
+        rows, chords = tree.radius(point, chord)
+        user_ids = tree.user_ids[rows]
+        fresh = ~np.isin(user_ids, overridden)
+        delta_chords = np.sqrt(((delta_points - point) ** 2).sum(axis=1))
+        near = delta_chords <= chord
+        return (
+            np.concatenate((user_ids[fresh], delta_ids[near])),
+            km_for_chord(np.concatenate((chords[fresh], delta_chords[near]))),
+        )
+
+    def nearest(self, latitude, longitude, k):
+        """(user ids, distances in km) of the `k` closest located profiles, closest first."""
+        state = self._state
+        point = unit_vectors([latitude], [longitude])[0]
+        user_ids, distances = self._within(state, point, state[0].nearest_bound(point, k, state[3]))
+        ranked = np.lexsort((user_ids, distances))[:k]
+        return user_ids[ranked], distances[ranked]
+
+
+def index_path():
+    """settings.GEO_INDEX_PATH, read on use so tests and benchmarks can point it elsewhere."""
+    return getattr(settings, 'GEO_INDEX_PATH', os.path.join(settings.BASE_DIR, 'geo_index.kdtree'))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_geo_index():
+    """The process-wide index, refreshed if due, or None until build_geo_index has written the file."""
+    global _index
+    path = index_path()
+    with _index_lock:
+        if _index is None or _index.path != path:
+            _index = GeoIndex(path)
+        index = _index
+    index.refresh()
+    return index if index.tree is not None else None
+
+
+def discard_from_geo_index(user_id):
+    """Forgets a deleted profile in this process's index, if it has one."""
+    if _index is not None:
+        _index.discard(user_id)
+
+
+def build_geo_index(path=None, leaf_size=LEAF_SIZE):
+    """Builds the tree from every located profile and writes it to `path` (default GEO_INDEX_PATH); returns the tree."""
+    path = path or index_path()
+    started = timezone.now()  # rows changed from here on are picked up by the workers' delta
+    rows = list(
+        UserProfile.objects.exclude(latitude=None).exclude(longitude=None)
+        .values_list('user_id', 'latitude', 'longitude')
+    )
+    user_ids, latitudes, longitudes = zip(*rows) if rows else ((), (), ())
+    tree = KDTree.build(user_ids, latitudes, longitudes, leaf_size=leaf_size, watermark=started)
+    tree.save(path)
+    return tree
+
+
+def profiles_within(latitude, longitude, radius_km):
+    """(user ids, distances in km) of located profiles within `radius_km`, from the index when it is built."""
+    index = get_geo_index()
+    if index is not None:
+        return index.radius(latitude, longitude, radius_km)
+
+    located = list(UserProfile.objects.near(latitude, longitude, radius_km).values_list('user_id', 'latitude', 'longitude'))
+    user_ids = np.array([row[0] for row in located], dtype=np.int64)
+    distances = haversine_km(latitude, longitude, [row[1] for row in located], [row[2] for row in located])
+    within = distances <= radius_km
+    return user_ids[within], distances[within]
+
+
+def near(queryset, latitude, longitude, radius_km):
+    """
+    Narrows a UserProfile queryset to the radius (callers still check distances).
+
+    Uses the index's exact user ids when there are at most MAX_ID_FILTER of
+    them, and the grid-cell superset (UserProfileQuerySet.near) otherwise.
+    """
+    return near_in(get_geo_index(), queryset, latitude, longitude, radius_km)
+
+
+def near_in(index, queryset, latitude, longitude, radius_km):
+    """near() with an index already fetched by get_geo_index() (None if unbuilt); runs no query itself."""
+    if index is not None:
+        user_ids, _ = index.radius(float(latitude), float(longitude), radius_km)
+        if len(user_ids) <= MAX_ID_FILTER:
+            return queryset.filter(user_id__in=user_ids.tolist())
+    return queryset.near(latitude, longitude, radius_km)
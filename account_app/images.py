@@ -0,0 +1,100 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels for each stored variant, smallest first
+VARIANT_SIZES = {
+    'thumb': 96,   # admin list preview and match lists
+    'card': 320,   # explore cards
+    'full': 1080,  # profile page
+}
+VARIANT_FORMAT = 'WEBP'
+VARIANT_QUALITY = 80
+
+_pool = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'PROFILE_PIC_WORKERS', 2),
+    thread_name_prefix='profile-pics',
+)
+
+
+def variant_name(pic_name, variants, variant):
+    """Storage name of a stored variant, falling back to the original upload until it has been rendered."""
+    return (variants or {}).get(variant) or pic_name
+
+
+def variant_url(pic_name, variants, variant):
+    """URL of a stored variant, falling back to the original upload until it has been rendered."""
+    name = variant_name(pic_name, variants, variant)
+    return default_storage.url(name) if name else None
+
+
+def _encode(image, size):
+    resized = image.copy()
+    resized.thumbnail((size, size), Image.Resampling.LANCZOS)  # never upscales
+    buffer = BytesIO()
+    resized.save(buffer, format=VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def render_variants(profile_id):
+    """Resizes and recompresses a profile's original picture into every VARIANT_SIZES entry."""
+    profile = UserProfile.objects.filter(pk=profile_id).only('profile_pic').first()
+    if profile is None or not profile.profile_pic:
+        return
+    source = profile.profile_pic.name
+
+    try:
+        with profile.profile_pic.open('rb') as fh:
+            image = Image.open(fh)
+            image.load()
+    except (OSError, UnidentifiedImageError):
+        logger.warning("Could not read profile picture %r of profile %s", source, profile_id)
+        return
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    variants = {'source': source}
+    for variant, size in VARIANT_SIZES.items():
+        data = _encode(image, size)
+        # Content-hashed names: identical renders are stored once and can be cached forever
+        name = f"profile_pics/{variant}/{sha256(data).hexdigest()[:24]}.{VARIANT_FORMAT.lower()}"
+        if not default_storage.exists(name):
+            name = default_storage.save(name, ContentFile(data))
+        variants[variant] = name
+
+    # Skip the write if a newer picture was uploaded while we were rendering this one
+    UserProfile.objects.filter(pk=profile_id, profile_pic=source).update(
+        profile_pic_variants=variants, updated_at=timezone.now(),
+    )
+
+
+def _render_in_background(profile_id):
+    close_old_connections()
+    try:
+        render_variants(profile_id)
+    except Exception:
+        logger.exception("Rendering profile picture variants failed for profile %s", profile_id)
+    finally:
+        connection.close()
+
+
+def enqueue_profile_pic(profile_id):
+    """Renders the variants off the request path (inline when PROFILE_PIC_PIPELINE_EAGER is set)."""
+    if getattr(settings, 'PROFILE_PIC_PIPELINE_EAGER', False):
+        render_variants(profile_id)
+    else:
+        _pool.submit(_render_in_background, profile_id)
@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from account_app.benchmarks import ENDPOINTS, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every account_app endpoint against synthetic populations of growing size "
+        "and write p50/p95 latency, query counts and peak memory as JSON. "
+        "Runs in a throwaway test database, never the configured one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--endpoint', action='append', dest='endpoints', help="Only this URL name (repeatable).")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='bench_output.json', help="Where to write the JSON report.")
+
+    def handle(self, *args, **options):
+        unknown = set(options['endpoints'] or []) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoint(s): {', '.join(sorted(unknown))}")
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # Match refreshes run inline, so none are left queued for the database destroyed below
+            with override_settings(MATCH_REFRESH_EAGER=True):
+                report = run_benchmarks(
+                    options['sizes'], iterations=options['iterations'], endpoints=options['endpoints'],
+                    seed=options['seed'], stdout=self.stdout,
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(report['results'])} results to {options['output']}"))
@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from account_app.benchmarks import run_login_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure login throughput of the legacy email lookup against EmailBackend "
+        "for growing user tables and write the results as JSON. "
+        "Runs in a throwaway test database, never the configured one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--iterations', type=int, default=200, help="Logins per strategy and size.")
+        parser.add_argument('--fast-hasher', action='store_true', help="Hash with MD5 to isolate the lookup cost.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='bench_login.json', help="Where to write the JSON report.")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # Match refreshes run inline, so none are left queued for the database destroyed below
+            with override_settings(MATCH_REFRESH_EAGER=True):
+                report = run_login_benchmark(
+                    options['sizes'], iterations=options['iterations'], seed=options['seed'],
+                    fast_hasher=options['fast_hasher'], stdout=self.stdout,
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        with open(options['output'], 'w') as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(report['results'])} results to {options['output']}"))
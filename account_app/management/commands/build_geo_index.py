@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from account_app.geo_index import LEAF_SIZE, build_geo_index, index_path
+
+
+class Command(BaseCommand):
+    help = "Rebuild the memory-mapped k-d tree of profile coordinates that workers share for geo queries."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help="Index file to (re)write (default: GEO_INDEX_PATH).")
+        parser.add_argument('--leaf-size', type=int, default=LEAF_SIZE, help="Points per leaf.")
+
+    def handle(self, *args, **options):
+        path = options['path'] or index_path()
+        started = time.perf_counter()
+        tree = build_geo_index(path, leaf_size=options['leaf_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {len(tree)} located profiles into {path} in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from account_app.population import generate_population
+
+
+class Command(BaseCommand):
+    help = "Insert N synthetic users (User, UserProfile, UserPreference) clustered around a few cities."
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help="Number of users to create.")
+        parser.add_argument('--seed', type=int, default=None, help="Random seed, for reproducible populations.")
+        parser.add_argument('--password', default=None, help="Password shared by all generated users (default: unusable).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = generate_population(
+            options['count'], seed=options['seed'], password=options['password'], batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(users)} users. Run 'manage.py rebuild_matches' to materialize their matches."
+        ))
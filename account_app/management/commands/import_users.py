@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from account_app.bulk_import import BATCH_SIZE, import_file
+
+
+class Command(BaseCommand):
+    help = "Create users (User, UserProfile, UserPreference) from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV with a header row, or NDJSON with one object per line.")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=None, help="Password hashing processes (default: CPU count).")
+        parser.add_argument('--no-matches', action='store_true', help="Skip MatchHistory updates; run rebuild_matches later.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        try:
+            fh = open(path, encoding='utf-8-sig', newline='')
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        with fh:
+            result = import_file(
+                fh, fmt, batch_size=options['batch_size'], workers=options['workers'],
+                materialize=not options['no_matches'],
+            )
+
+        for number, errors in sorted(result.errors, key=lambda error: error[0]):
+            self.stderr.write(f"row {number}: {json.dumps(errors)}")
+        style = self.style.WARNING if result.errors else self.style.SUCCESS
+        self.stdout.write(style(f"Created {result.created} users, rejected {len(result.errors)} rows."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from account_app.matching import rebuild_all_matches, refresh_changed_since
+
+
+class Command(BaseCommand):
+    help = "Recompute the MatchHistory table (all pairs, or only users changed since a timestamp)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--changed-since',
+            help="ISO timestamp; only re-materialize profiles/preferences with a newer updated_at.",
+        )
+
+    def handle(self, *args, **options):
+        if options['changed_since']:
+            since = parse_datetime(options['changed_since'])
+            if since is None:
+                raise CommandError("--changed-since must be an ISO 8601 timestamp.")
+            refresh_changed_since(since)
+            self.stdout.write(self.style.SUCCESS(f"Refreshed matches changed since {since.isoformat()}."))
+            return
+
+        written = rebuild_all_matches(stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt MatchHistory with {written} matches."))
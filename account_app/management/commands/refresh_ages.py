@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from account_app.age_refresh import refresh_stored_ages
+
+
+class Command(BaseCommand):
+    help = "Update UserProfile.age for profiles whose birthday has passed since the last run (run daily)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--today', help="ISO date to compute ages for (default: today).")
+        parser.add_argument(
+            '--no-matches', action='store_true',
+            help="Skip re-materializing matches of updated profiles (run rebuild_matches later).",
+        )
+
+    def handle(self, *args, **options):
+        today = None
+        if options['today']:
+            today = parse_date(options['today'])
+            if today is None:
+                raise CommandError("--today must be an ISO 8601 date.")
+        started = time.perf_counter()
+        updated = refresh_stored_ages(today, materialize=not options['no_matches'])
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} ages in {time.perf_counter() - started:.1f}s."))
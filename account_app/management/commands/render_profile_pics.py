@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from account_app.images import render_variants
+from account_app.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = "Render resized profile picture variants for profiles that do not have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Re-render every profile, not only missing ones.")
+
+    def handle(self, *args, **options):
+        placeholder = UserProfile._meta.get_field('profile_pic').default
+        profiles = UserProfile.objects.exclude(profile_pic__in=['', placeholder]).exclude(profile_pic=None)
+        if not options['all']:
+            profiles = profiles.filter(profile_pic_variants={})
+        rendered = 0
+        for profile_id in profiles.values_list('id', flat=True).iterator(chunk_size=500):
+            render_variants(profile_id)
+            rendered += 1
+        self.stdout.write(self.style.SUCCESS(f"Rendered variants for {rendered} profiles."))
@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from .models import MatchHistory, UserPreference, UserProfile
+from .scoring import PreferenceColumns, fit_percentages
+from .snapshot import get_profile_snapshot
+
+# Only pairs scoring above this percentage are stored in MatchHistory
+MIN_MATCH_PERCENTAGE = getattr(settings, 'MATCH_HISTORY_MIN_PERCENTAGE', 50)
+
+BATCH_SIZE = 2000
+
+# Users re-materialized per transaction in refresh_matches
+USERS_PER_PASS = 500
+
+# How long (seconds) queued refreshes wait for more changes to batch with
+QUEUE_DELAY = getattr(settings, 'MATCH_REFRESH_DELAY', 1.0)
+
+logger = logging.getLogger(__name__)
+
+
+def _outgoing_rows(user_profile, user_preferences, snapshot):
+    """MatchHistory rows for how well everyone else fits `user_preferences`."""
+    return [
+        MatchHistory(user_id=user_profile.user_id, matched_user_id=matched_user_id, match_percentage=percentage)
+        for matched_user_id, _, percentage, _ in snapshot.matches(user_profile, user_preferences, MIN_MATCH_PERCENTAGE)
+    ]
+
+
+def refresh_outgoing_matches(user):
+    """Recomputes the stored matches for `user` after their preferences (or location) changed."""
+    try:
+        user_profile = UserProfile.objects.get(user=user)
+        user_preferences = UserPreference.objects.get(user=user)
+    except (UserProfile.DoesNotExist, UserPreference.DoesNotExist):
+        return
+    rows = _outgoing_rows(user_profile, user_preferences, get_profile_snapshot(force=True))
+    with transaction.atomic():
+        MatchHistory.objects.filter(user=user).delete()
+        MatchHistory.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+
+def rebuild_all_matches(stdout=None):
+    """Drops and recomputes every stored match. Returns the number of rows written."""
+    snapshot = get_profile_snapshot(force=True)
+    profiles = UserProfile.objects.in_bulk(field_name='user_id')
+    written = 0
+    with transaction.atomic():
+        MatchHistory.objects.all().delete()
+        batch = []
+        for user_preferences in UserPreference.objects.iterator(chunk_size=BATCH_SIZE):
+            user_profile = profiles.get(user_preferences.user_id)
+            if user_profile is None:
+                continue
+            batch.extend(_outgoing_rows(user_profile, user_preferences, snapshot))
+            if len(batch) >= BATCH_SIZE:
+                MatchHistory.objects.bulk_create(batch, batch_size=BATCH_SIZE)
+                written += len(batch)
+                batch = []
+                if stdout is not None:
+                    stdout.write(f"{written} matches written...")
+        MatchHistory.objects.bulk_create(batch, batch_size=BATCH_SIZE)
+        written += len(batch)
+    return written
+
+
+def _refresh_pass(profile_user_ids, outgoing_user_ids, snapshot, preferences):
+    profiles = UserProfile.objects.in_bulk(outgoing_user_ids, field_name='user_id')
+    rows = []
+    for user_preferences in UserPreference.objects.filter(user_id__in=outgoing_user_ids):
+        user_profile = profiles.get(user_preferences.user_id)
+        if user_profile is not None:
+            rows.extend(_outgoing_rows(user_profile, user_preferences, snapshot))
+
+    # Pairs whose owner is in this pass already came from the outgoing rows
+    owners_elsewhere = ~np.isin(preferences.owner_ids, outgoing_user_ids)
+    for user_id in profile_user_ids:
+        profile = profiles.get(user_id)
+        if profile is None:
+            continue
+        percentages = fit_percentages(profile, preferences)
+        rows.extend(
+            MatchHistory(user_id=int(preferences.owner_ids[i]), matched_user_id=user_id, match_percentage=float(percentages[i]))
+            for i in np.flatnonzero(owners_elsewhere & (percentages > MIN_MATCH_PERCENTAGE))
+        )
+
+    with transaction.atomic():
+        MatchHistory.objects.filter(user_id__in=outgoing_user_ids).delete()
+        MatchHistory.objects.filter(matched_user_id__in=profile_user_ids).delete()
+        MatchHistory.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+def refresh_matches(profile_user_ids=(), preference_user_ids=()):
+    """
+    Re-materializes a batch of changed users. Returns the number of rows written.
+
+    A profile change moves both who the user matches and who matches them; a
+    preference change only the former. The snapshot is refreshed and every
+    preference row loaded once for the whole batch, not once per user.
+    """
+    profile_user_ids = set(profile_user_ids)
+    outgoing_user_ids = sorted(profile_user_ids | set(preference_user_ids))
+    if not outgoing_user_ids:
+        return 0
+    snapshot = get_profile_snapshot(force=True)
+    preferences = PreferenceColumns.load(UserPreference.objects.all()) if profile_user_ids else PreferenceColumns([])
+
+    written = 0
+    for start in range(0, len(outgoing_user_ids), USERS_PER_PASS):
+        chunk = outgoing_user_ids[start:start + USERS_PER_PASS]
+        written += _refresh_pass([user_id for user_id in chunk if user_id in profile_user_ids], chunk, snapshot, preferences)
+    return written
+
+
+def refresh_changed_since(since):
+    """Re-materializes users whose profile or preferences changed at or after `since` (e.g. via bulk updates)."""
+    return refresh_matches(
+        UserProfile.objects.filter(updated_at__gte=since).values_list('user_id', flat=True),
+        UserPreference.objects.filter(updated_at__gte=since).values_list('user_id', flat=True),
+    )
+
+
+_queue_lock = threading.Lock()
+_queued_profiles = set()
+_queued_preferences = set()
+_queue_scheduled = False
+_queue_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='match-refresh')
+
+
+def _drain_queue():
+    global _queue_scheduled
+    time.sleep(QUEUE_DELAY)  # let a burst of saves join this batch
+    with _queue_lock:
+        profile_user_ids, preference_user_ids = set(_queued_profiles), set(_queued_preferences)
+        _queued_profiles.clear()
+        _queued_preferences.clear()
+        _queue_scheduled = False
+    close_old_connections()
+    try:
+        refresh_matches(profile_user_ids, preference_user_ids)
+    except Exception:
+        logger.exception("Refreshing matches failed for %s users", len(profile_user_ids | preference_user_ids))
+    finally:
+        connection.close()
+
+
+def queue_match_refresh(profile_user_ids=(), preference_user_ids=()):
+    """
+    refresh_matches off the request path: changes queued within MATCH_REFRESH_DELAY
+    are merged into one batch (inline when MATCH_REFRESH_EAGER is set).
+
+    The queue is in memory; changes still queued when the process exits are
+    picked up by rebuild_matches --changed-since.
+    """
+    global _queue_scheduled
+    if getattr(settings, 'MATCH_REFRESH_EAGER', False):
+        refresh_matches(profile_user_ids, preference_user_ids)
+        return
+    with _queue_lock:
+        _queued_profiles.update(profile_user_ids)
+        _queued_preferences.update(preference_user_ids)
+        if _queue_scheduled:
+            return
+        _queue_scheduled = True
+    _queue_pool.submit(_drain_queue)
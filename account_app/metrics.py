@@ -0,0 +1,207 @@
+"""
+Per-endpoint request metrics in Prometheus text format.
+
+MetricsMiddleware records, for every URL name in account_app/urls.py, request
+latency, DB query count and time, and time spent building serializer output.
+Numbers are per process; with several workers, scrape each one (or put them
+behind a single-worker metrics port).
+"""
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger('account_app.slow_requests')
+
+PREFIX = 'friendsbook'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250)
+
+# Optional slow-request log: requests slower than this (ms) are logged with their SQL
+SLOW_REQUEST_MS = getattr(settings, 'SLOW_REQUEST_MS', None)
+
+
+class _RequestStats:
+    def __init__(self, keep_sql):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializer_depth = 0
+        self.sql = [] if keep_sql else None
+
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels):
+        self.name, self.help_text, self.buckets, self.labels = name, help_text, buckets, labels
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, label_values, value):
+        series = self._series.setdefault(label_values, [0] * (len(self.buckets) + 2))
+        series[bisect_left(self.buckets, value)] += 1  # counts are made cumulative on export
+        series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for label_values, series in sorted(self._series.items()):
+            labels = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), series[:-1]):
+                cumulative += count
+                yield f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+            yield f"{self.name}_sum{{{labels}}} {series[-1]}"
+            yield f"{self.name}_count{{{labels}}} {cumulative}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name, self.help_text, self.labels = name, help_text, labels
+        self._series = {}
+
+    def inc(self, label_values):
+        self._series[label_values] = self._series.get(label_values, 0) + 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in sorted(self._series.items()):
+            yield f"{self.name}{{{_labels(self.labels, label_values)}}} {value}"
+
+
+def _labels(names, values):
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for value in values)
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+_lock = threading.Lock()
+REQUESTS = Counter(f'{PREFIX}_http_requests_total', "Requests handled, by view, method and status.", ('view', 'method', 'status'))
+LATENCY = Histogram(f'{PREFIX}_http_request_duration_seconds', "Time to build the response.", LATENCY_BUCKETS, ('view', 'method'))
+QUERIES = Histogram(f'{PREFIX}_db_queries_per_request', "SQL queries run per request.", QUERY_COUNT_BUCKETS, ('view', 'method'))
+DB_TIME = Histogram(f'{PREFIX}_db_duration_seconds', "Time spent in SQL per request.", LATENCY_BUCKETS, ('view', 'method'))
+SERIALIZER_TIME = Histogram(f'{PREFIX}_serializer_duration_seconds', "Time spent building serializer output per request.", LATENCY_BUCKETS, ('view', 'method'))
+METRICS = (REQUESTS, LATENCY, QUERIES, DB_TIME, SERIALIZER_TIME)
+
+
+def record_query(execute, sql, params, many, context):
+    """Connection execute wrapper (installed on every connection, see signals) feeding the current request's stats."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+        if stats.sql is not None:
+            stats.sql.append(sql)
+
+
+def _timed(original):
+    """Wraps a serializer rendering method so its time counts towards the current request's serializer time."""
+    @wraps(original)
+    def timed(*args, **kwargs):
+        stats = _current.get()
+        if stats is None or stats.serializer_depth:  # nested calls are already being timed
+            return original(*args, **kwargs)
+        stats.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            stats.serializer_seconds += time.perf_counter() - started
+            stats.serializer_depth -= 1
+
+    timed.instrumented = True
+    return timed
+
+
+def instrument_serializers():
+    """
+    Times serializer output: BaseSerializer.data, the one place every DRF
+    serializer (list or single) renders, and ValuesSerializer's
+    to_representation/serialize, which the fast list and detail views use instead.
+    """
+    from .fast_serializers import ValuesSerializer
+
+    if getattr(BaseSerializer.data.fget, 'instrumented', False):
+        return
+    BaseSerializer.data = property(_timed(BaseSerializer.data.fget))
+    ValuesSerializer.to_representation = _timed(ValuesSerializer.to_representation)
+    ValuesSerializer.serialize = _timed(ValuesSerializer.serialize)
+
+
+def _account_url_names():
+    from . import urls
+    return {pattern.name for pattern in urls.urlpatterns if pattern.name}
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.url_names = _account_url_names()
+
+    def __call__(self, request):
+        stats = _RequestStats(keep_sql=SLOW_REQUEST_MS is not None)
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.url_name if match is not None else None
+        if view not in self.url_names:
+            return response
+
+        labels = (view, request.method)
+        with _lock:
+            REQUESTS.inc((*labels, response.status_code))
+            LATENCY.observe(labels, elapsed)
+            QUERIES.observe(labels, stats.queries)
+            DB_TIME.observe(labels, stats.db_seconds)
+            SERIALIZER_TIME.observe(labels, stats.serializer_seconds)
+
+        if SLOW_REQUEST_MS is not None and elapsed * 1000 >= SLOW_REQUEST_MS:
+            logger.warning(
+                "Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms, serializers %.1f ms\n%s",
+                request.method, request.path, view, elapsed * 1000, stats.queries,
+                stats.db_seconds * 1000, stats.serializer_seconds * 1000, '\n'.join(stats.sql),
+            )
+        return response
+
+
+def scrape_allowed(request):
+    """
+    With METRICS_TOKEN set, only requests bearing it; otherwise direct requests from METRICS_ALLOWED_IPS.
+
+    Behind a reverse proxy REMOTE_ADDR is the proxy's own address, so forwarded
+    requests never pass the IP check; give the scraper the token instead.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        return hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', '').encode(), f"Bearer {token}".encode())
+    if 'HTTP_X_FORWARDED_FOR' in request.META or 'HTTP_FORWARDED' in request.META:
+        return False
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; 404 for anyone scrape_allowed() turns away."""
+    if not scrape_allowed(request):
+        raise Http404
+    with _lock:
+        lines = [line for metric in METRICS for line in metric.render()]
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+from account_app.geo import grid_cell
+
+
+def backfill_geo_cells(apps, schema_editor):
+    UserProfile = apps.get_model('account_app', 'UserProfile')
+    batch = []
+    profiles = UserProfile.objects.exclude(latitude=None).exclude(longitude=None).only('id', 'latitude', 'longitude')
+    for profile in profiles.iterator(chunk_size=2000):
+        profile.geo_cell_lat, profile.geo_cell_lon = grid_cell(profile.latitude, profile.longitude)
+        batch.append(profile)
+        if len(batch) >= 2000:
+            UserProfile.objects.bulk_update(batch, ['geo_cell_lat', 'geo_cell_lon'])
+            batch = []
+    if batch:
+        UserProfile.objects.bulk_update(batch, ['geo_cell_lat', 'geo_cell_lon'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_app', '0006_userprofile_latitude_userprofile_longitude'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='geo_cell_lat',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='geo_cell_lon',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['geo_cell_lat', 'geo_cell_lon'], name='profile_geo_cell_idx'),
+        ),
+        migrations.RunPython(backfill_geo_cells, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_app', '0009_userprofile_profile_pic_variants'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        # auth.User belongs to django.contrib.auth, so its index is created here in SQL.
+        # Expression indexes are supported by SQLite, PostgreSQL and MySQL 8.0.13+.
+        migrations.RunSQL(
+            sql='CREATE INDEX auth_user_email_lower_idx ON auth_user ((LOWER(email)));',
+            reverse_sql='DROP INDEX auth_user_email_lower_idx;',
+        ),
+    ]
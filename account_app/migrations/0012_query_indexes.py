@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_app', '0011_revokedtoken'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='matchhistory',
+            index=models.Index(fields=['user', '-match_percentage', 'id'], name='match_user_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='matchhistory',
+            index=models.Index(fields=['user', 'created_at'], name='match_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userpreference',
+            index=models.Index(fields=['updated_at', 'id'], name='preference_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['created_at', 'id'], name='profile_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['updated_at', 'id'], name='profile_updated_idx'),
+        ),
+        # Explore pages through auth_user by (date_joined, id); see 0010 for why this is SQL
+        migrations.RunSQL(
+            sql='CREATE INDEX auth_user_date_joined_id_idx ON auth_user (date_joined, id);',
+            reverse_sql='DROP INDEX auth_user_date_joined_id_idx;',
+        ),
+    ]
@@ -1,5 +1,11 @@
+from datetime import date
+
+from django.core.files.storage import default_storage
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
+from .ages import age_on, age_range_q
+from .geo import covering_cells, grid_cell
 
 def profile_created_by_choices():
     """Returns choices for who created the profile."""
@@ -23,11 +29,34 @@ class BaseModel(models.Model):
     class Meta:
         abstract = True
 
+class UserProfileQuerySet(models.QuerySet):
+    def near(self, latitude, longitude, radius_km):
+        """
+        Narrows the queryset to profiles in the spatial buckets covering the radius.
+
+        This is a superset of the real answer; callers still run an exact distance
+        check on the (small) candidate set.
+        """
+        lat_range, lon_ranges = covering_cells(latitude, longitude, radius_km)
+        query = Q(geo_cell_lat__range=lat_range)
+        if lon_ranges is not None:
+            lon_query = Q()
+            for lon_range in lon_ranges:
+                lon_query |= Q(geo_cell_lon__range=lon_range)
+            query &= lon_query
+        return self.filter(query)
+
+    def aged(self, age_min=None, age_max=None, today=None):
+        """Profiles aged `age_min`..`age_max` (inclusive, either optional) as a date_of_birth range."""
+        return self.filter(age_range_q(age_min, age_max, today))
+
+
 class UserProfile(BaseModel):
     """Model for storing user profile information."""
 
     user          = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
     profile_pic   = models.ImageField(upload_to="profile_pics/",default= 'def.png', null=True, blank=True)
+    profile_pic_variants = models.JSONField(default=dict, blank=True, editable=False)  # see images.render_variants
     created_by    = models.CharField(max_length=10, choices=profile_created_by_choices())
     gender        = models.CharField(max_length=6, choices=gender_choices())
     name          = models.CharField(max_length=255, null=True, blank=True)
@@ -45,10 +74,44 @@ class UserProfile(BaseModel):
     religion      = models.CharField(max_length=100, null=True, blank=True)
     latitude      = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude     = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    geo_cell_lat  = models.IntegerField(null=True, blank=True, editable=False)  # see geo.grid_cell
+    geo_cell_lon  = models.IntegerField(null=True, blank=True, editable=False)
+
+    objects = UserProfileQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['geo_cell_lat', 'geo_cell_lon'], name='profile_geo_cell_idx'),
+            models.Index(fields=['created_at', 'id'], name='profile_created_idx'),  # profile list keyset pages
+            models.Index(fields=['updated_at', 'id'], name='profile_updated_idx'),  # export, snapshot and match refresh
+            models.Index(fields=['date_of_birth'], name='profile_birth_date_idx'),  # age ranges and refresh_ages
+        ]
 
     def __str__(self):
         return self.name
 
+    def profile_pic_url(self, variant='full'):
+        """URL of a resized picture variant ('thumb', 'card' or 'full'), or the original until it is rendered."""
+        name = self.profile_pic_variants.get(variant) or (self.profile_pic.name if self.profile_pic else None)
+        return default_storage.url(name) if name else None
+
+    def save(self, *args, **kwargs):
+        # Keep the spatial bucket in step with the coordinates
+        self.geo_cell_lat, self.geo_cell_lon = grid_cell(self.latitude, self.longitude)
+        # ...and the stored age with the birth date (refresh_ages moves it on at birthdays).
+        # The birth date may still be a string here, e.g. create(date_of_birth='1990-01-01').
+        self.date_of_birth = self._meta.get_field('date_of_birth').to_python(self.date_of_birth)
+        self.age = age_on(self.date_of_birth, date.today()) if self.date_of_birth else None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {'latitude', 'longitude'} & update_fields:
+                update_fields |= {'geo_cell_lat', 'geo_cell_lon'}
+            if 'date_of_birth' in update_fields:
+                update_fields.add('age')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
 class UserPreference(BaseModel):
     """Model for storing user’s preferred partner criteria."""
 
@@ -63,6 +126,11 @@ class UserPreference(BaseModel):
     preferred_education  = models.CharField(max_length=255, null=True, blank=True)
     preferred_location   = models.CharField(max_length=255, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='preference_updated_idx'),  # export and match refresh
+        ]
+
     def __str__(self):
         return f"{self.user.username}'s Preferences"
 
@@ -73,5 +141,33 @@ class MatchHistory(models.Model):
     match_percentage = models.FloatField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'matched_user'], name='unique_match_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-match_percentage', 'id'], name='match_user_rank_idx'),  # ranked match list
+            models.Index(fields=['user', 'created_at'], name='match_user_created_idx'),  # match history
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} matched with {self.matched_user.username} ({self.match_percentage}%)"
+
+class RevokedToken(models.Model):
+    """JTI of a logged-out JWT; rows are pruned once the token would have expired anyway."""
+    jti = models.CharField(max_length=64, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.jti} (expires {self.expires_at:%Y-%m-%d %H:%M})"
+
+
+class AgeRefreshRun(models.Model):
+    """One day's run of manage.py refresh_ages; the next run only looks at birthdays after the latest one."""
+    ran_on = models.DateField(unique=True)
+    updated = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f"{self.user.username} matched with {self.matched_user.username} ({self.match_percentage}%)"
\ No newline at end of file
+        return f"{self.ran_on:%Y-%m-%d} ({self.updated} ages updated)"
@@ -0,0 +1,158 @@
+import base64
+import datetime
+import inspect
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Like DjangoJSONEncoder, but keeps full microsecond precision so key equality holds."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a fixed sort key such as ('created_at', 'id').
+
+    The cursor holds the sort-key values of the last row served and the next page
+    is read with a `key > cursor` range filter, so deep pages cost the same as the
+    first one. The last ordering field must be unique to make the key total.
+    """
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=('created_at', 'id')):
+        self.ordering = tuple(ordering)
+        self.next_position = None
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None, keep=None):
+        """
+        Returns one page of `queryset`.
+
+        `keep`, if given, filters a list of fetched rows (e.g. an exact distance
+        check); rows are then scanned in batches until the page is full.
+        """
+        self.request = request
+        size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+
+        if keep is None:
+            rows = list(self._after(queryset, position)[:size + 1])
+            page = rows[:size]
+            self.next_position = self._position(page[-1]) if len(rows) > size else None
+            return page
+
+        page = []
+        while len(page) < size:
+            batch = list(self._after(queryset, position)[:size * 2])
+            if not batch:
+                break
+            for row in keep(batch):
+                page.append(row)
+                if len(page) == size:
+                    break
+            position = self._position(batch[-1])
+            if len(batch) < size * 2:
+                break
+        # A full page may be followed by an empty last page; that is the price of not over-scanning
+        self.next_position = self._position(page[-1]) if len(page) == size else None
+        return page
+
+    async def apaginate_queryset(self, queryset, request, keep=None):
+        """
+        Async twin of paginate_queryset for async views, reading rows with the async ORM.
+
+        `keep` may be a coroutine function so CPU-heavy filtering can run in an executor.
+        """
+        self.request = request
+        size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+
+        if keep is None:
+            rows = [row async for row in self._after(queryset, position)[:size + 1]]
+            page = rows[:size]
+            self.next_position = self._position(page[-1]) if len(rows) > size else None
+            return page
+
+        page = []
+        while len(page) < size:
+            batch = [row async for row in self._after(queryset, position)[:size * 2]]
+            if not batch:
+                break
+            kept = keep(batch)
+            if inspect.isawaitable(kept):
+                kept = await kept
+            page.extend(kept[:size - len(page)])
+            position = self._position(batch[-1])
+            if len(batch) < size * 2:
+                break
+        self.next_position = self._position(page[-1]) if len(page) == size else None
+        return page
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def encode_cursor(self, position):
+        raw = json.dumps(position, cls=CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(name.lstrip('-')).to_python(value)
+                for name, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _position(self, row):
+        names = [name.lstrip('-') for name in self.ordering]
+        if isinstance(row, dict):
+            return [row[name] for name in names]
+        return [getattr(row, name) for name in names]
+
+    def _after(self, queryset, position):
+        if position is None:
+            return queryset
+        condition = Q()
+        equal = Q()
+        for name, value in zip(self.ordering, position):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return queryset.filter(condition)
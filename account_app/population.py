@@ -0,0 +1,110 @@
+import random
+import uuid
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .ages import age_on
+from .geo import KM_PER_DEGREE, grid_cell
+from .models import UserPreference, UserProfile
+
+# (name, latitude, longitude, relative weight) of the clusters users are drawn around
+CITY_CENTERS = [
+    ("Dhaka", 23.8103, 90.4125, 40),
+    ("Chattogram", 22.3569, 91.7832, 15),
+    ("Khulna", 22.8456, 89.5403, 8),
+    ("Rajshahi", 24.3745, 88.6042, 7),
+    ("Sylhet", 24.8949, 91.8687, 7),
+    ("London", 51.5074, -0.1278, 10),
+    ("New York", 40.7128, -74.0060, 8),
+    ("Toronto", 43.6532, -79.3832, 5),
+]
+CLUSTER_SPREAD_KM = 15
+
+FIRST_NAMES = ["Ayesha", "Rahim", "Karim", "Nusrat", "Tanvir", "Farhana", "Sadia", "Imran", "Mitu", "Arif", "Lamia", "Hasan"]
+LAST_NAMES = ["Ahmed", "Hossain", "Islam", "Rahman", "Chowdhury", "Khan", "Akter", "Uddin", "Sarker", "Begum"]
+EDUCATION = ["High School", "Diploma", "Bachelor's", "Master's", "PhD"]
+RELIGIONS = ["Islam", "Hinduism", "Christianity", "Buddhism", None]
+LANGUAGES = ["Bangla", "English", "Hindi", "Urdu"]
+
+
+def generate_population(count, seed=None, password=None, batch_size=1000):
+    """
+    Bulk-inserts `count` realistic User/UserProfile/UserPreference rows and returns the new users.
+
+    Coordinates are gaussian clusters around CITY_CENTERS. Every user shares one
+    password hash (unusable unless `password` is given), so generating 100k users
+    does not spend minutes in PBKDF2.
+    """
+    rng = random.Random(seed)
+    prefix = uuid.UUID(int=rng.getrandbits(128)).hex[:8]
+    password_hash = make_password(password)
+    today = date.today()
+    centers = [center[1:3] for center in CITY_CENTERS]
+    weights = [center[3] for center in CITY_CENTERS]
+    spread = CLUSTER_SPREAD_KM / KM_PER_DEGREE
+
+    created = []
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        users = []
+        for i in range(start, start + size):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            users.append(User(
+                username=f"pop_{prefix}_{i}",
+                email=f"pop_{prefix}_{i}@example.com",
+                first_name=first,
+                last_name=last,
+                password=password_hash,
+            ))
+
+        with transaction.atomic():
+            users = User.objects.bulk_create(users)
+            profiles, preferences = [], []
+            for user in users:
+                date_of_birth = today - timedelta(days=rng.randint(18 * 365, 60 * 365))
+                age = age_on(date_of_birth, today)
+                gender = rng.choice(["male", "female"])
+                height = round(rng.gauss(172 if gender == "male" else 160, 7), 2)
+                center_lat, center_lon = rng.choices(centers, weights)[0]
+                latitude = round(rng.gauss(center_lat, spread), 6)
+                longitude = round(rng.gauss(center_lon, spread), 6)
+                geo_cell_lat, geo_cell_lon = grid_cell(latitude, longitude)
+                profiles.append(UserProfile(
+                    user=user,
+                    created_by=rng.choice(["self", "self", "self", "parent", "sibling", "relative", "friend"]),
+                    gender=gender,
+                    name=f"{user.first_name} {user.last_name}",
+                    date_of_birth=date_of_birth,
+                    email=user.email,
+                    height=height,
+                    age=age,
+                    weight=round(rng.gauss(70 if gender == "male" else 58, 9), 2),
+                    education=rng.choice(EDUCATION),
+                    country="Bangladesh" if center_lon > 85 else "Abroad",
+                    address=f"{rng.randint(1, 200)} Road {rng.randint(1, 40)}",
+                    language=rng.choice(LANGUAGES),
+                    religion=rng.choice(RELIGIONS),
+                    latitude=latitude,
+                    longitude=longitude,
+                    geo_cell_lat=geo_cell_lat,  # bulk_create skips save(), so fill the bucket here
+                    geo_cell_lon=geo_cell_lon,
+                ))
+                preferences.append(UserPreference(
+                    user=user,
+                    email=user.email,
+                    preferred_height_min=round(height - rng.uniform(5, 20), 2),
+                    preferred_height_max=round(height + rng.uniform(5, 20), 2),
+                    preferred_age_min=max(18, age - rng.randint(2, 8)),
+                    preferred_age_max=age + rng.randint(2, 8),
+                    preferred_weight_min=rng.choice([None, 45]),
+                    preferred_weight_max=rng.choice([None, 90]),
+                    preferred_education=rng.choice(EDUCATION + [None]),
+                    preferred_location=rng.choice(["Bangladesh", "Abroad", None]),
+                ))
+            UserProfile.objects.bulk_create(profiles)
+            UserPreference.objects.bulk_create(preferences)
+        created.extend(users)
+    return created
@@ -0,0 +1,131 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken
+
+# How often (seconds) a check may pull revocations made by other processes
+SYNC_SECONDS = getattr(settings, 'TOKEN_REVOCATION_SYNC_SECONDS', 5)
+
+# How often (seconds) expired rows are deleted and the filter rebuilt without them
+PRUNE_SECONDS = getattr(settings, 'TOKEN_REVOCATION_PRUNE_SECONDS', 3600)
+
+# Re-read rows this far behind the watermark so slow-committing writes are not missed
+SYNC_OVERLAP = timedelta(seconds=2)
+
+CAPACITY = getattr(settings, 'TOKEN_REVOCATION_CAPACITY', 100_000)
+FALSE_POSITIVE_RATE = getattr(settings, 'TOKEN_REVOCATION_FP_RATE', 0.001)
+
+
+class BloomFilter:
+    """Fixed-size set membership with no false negatives and a tunable false-positive rate."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.count = 0
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.bits for i in range(self.hashes))
+
+    def add(self, key):
+        """Adds `key`; `count` only grows when a bit was unset, so re-adding a key (e.g. on sync overlap) is free."""
+        added = False
+        for position in self._positions(key):
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not self._array[byte] & bit:
+                self._array[byte] |= bit
+                added = True
+        self.count += added
+
+    def __contains__(self, key):
+        return all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationStore:
+    """
+    Process-local Bloom filter in front of the RevokedToken table.
+
+    A JTI that is not in the filter was never revoked, so most authenticated
+    requests are answered without a query; only filter hits (revoked tokens and
+    the rare false positive) are confirmed against the table. Revocations made by
+    other processes are pulled in incrementally every SYNC_SECONDS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._watermark = None
+        self._synced_at = 0.0
+        self._pruned_at = 0.0
+
+    def _rebuild(self):
+        now = timezone.now()
+        jtis = list(RevokedToken.objects.filter(expires_at__gt=now).values_list('jti', flat=True))
+        # Leave headroom so incremental adds stay under capacity until the next prune
+        bloom = BloomFilter(max(CAPACITY, 2 * len(jtis)), FALSE_POSITIVE_RATE)
+        for jti in jtis:
+            bloom.add(jti)
+        self._filter = bloom
+        self._watermark = now
+        self._synced_at = self._pruned_at = time.monotonic()
+
+    def _sync(self, force=False):
+        now = time.monotonic()
+        if self._filter is None or now - self._pruned_at >= PRUNE_SECONDS:
+            if self._filter is not None:
+                RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+            self._rebuild()
+            return
+        if not force and now - self._synced_at < SYNC_SECONDS:
+            return
+        self._synced_at = now
+
+        started = timezone.now()
+        for jti in RevokedToken.objects.filter(revoked_at__gte=self._watermark - SYNC_OVERLAP).values_list('jti', flat=True):
+            self._filter.add(jti)
+        self._watermark = started
+        if self._filter.count > self._filter.capacity:
+            self._rebuild()
+
+    def revoke(self, jti, expires_at):
+        """Records a token as revoked until `expires_at` (an aware datetime)."""
+        RevokedToken.objects.bulk_create([RevokedToken(jti=jti, expires_at=expires_at)], ignore_conflicts=True)
+        with self._lock:
+            self._sync()
+            self._filter.add(jti)
+
+    def is_revoked(self, jti):
+        with self._lock:
+            self._sync()
+            if jti not in self._filter:
+                return False
+        return RevokedToken.objects.filter(jti=jti, expires_at__gt=timezone.now()).exists()
+
+    def reset(self):
+        """Drops the filter; the next check rebuilds it from the table."""
+        with self._lock:
+            self._filter = None
+
+
+_store = RevocationStore()
+
+
+def get_revocation_store():
+    return _store
+
+
+def revoke_token(token):
+    """Revokes a validated simplejwt token (access or refresh) until it expires."""
+    expires_at = datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+    _store.revoke(token[api_settings.JTI_CLAIM], expires_at)
@@ -0,0 +1,168 @@
+"""
+Read-replica routing.
+
+Reads go to a replica only inside views that opt in with @use_replica (or the
+replica_reads() context manager in async views); everything else, and every
+write, uses `default`. A user whose request wrote something is pinned to the
+primary for REPLICA_PIN_SECONDS so they read their own writes despite
+replication lag. An unreachable replica is skipped for REPLICA_RETRY_SECONDS.
+
+The pin is a cookie (for browsers) plus a per-user key in the default cache
+(for JWT clients, which do not send cookies back). With several workers the
+cache must be shared (CACHE_BACKEND), or a pin set by one worker is not seen by
+the next; check_pin_cache warns about that.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import checks
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+RETRY_SECONDS = getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+PIN_COOKIE = 'replica_pin'
+PIN_CACHE_KEY = 'replica-pin:{}'
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class _RoutingState:
+    def __init__(self):
+        self.use_replica = False
+        self.replica = None  # alias picked on the first routed read ('default' if none is reachable)
+        self.wrote = False
+        self.written_user_ids = set()
+
+
+_state = ContextVar('replica_routing', default=None)
+_down_until = {}  # replica alias -> time.monotonic() until which it is skipped
+
+
+def replica_aliases():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def _healthy_replica():
+    aliases = replica_aliases()
+    for alias in random.sample(aliases, len(aliases)):
+        if _down_until.get(alias, 0) > time.monotonic():
+            continue
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            _down_until[alias] = time.monotonic() + RETRY_SECONDS
+            continue
+        return alias
+    return None
+
+
+def _is_pinned(request, user):
+    if request.COOKIES.get(PIN_COOKIE):
+        return True
+    return bool(user is not None and user.is_authenticated and cache.get(PIN_CACHE_KEY.format(user.pk)))
+
+
+@contextmanager
+def replica_reads(request, user=None):
+    """Routes the reads made inside the block to a replica, unless the user is pinned to the primary."""
+    state = _state.get()
+    token = None
+    if state is None:
+        token = _state.set(state := _RoutingState())
+    previous = state.use_replica
+    state.use_replica = bool(replica_aliases()) and not _is_pinned(request, user)
+    try:
+        yield
+    finally:
+        state.use_replica = previous
+        if token is not None:
+            _state.reset(token)
+
+
+def use_replica(methods=None):
+    """View decorator for read-only views (or the listed read-only methods of a view)."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if methods is not None and request.method not in methods:
+                return view(request, *args, **kwargs)
+            with replica_reads(request, request.user):
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica:
+            return None
+        if state.replica is None:
+            # Checked here rather than in replica_reads(), on the thread that will run the query
+            state.replica = _healthy_replica() or 'default'
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        # Only picks the database: get_or_create() asks for it before a plain SELECT.
+        # record_write() notes the statements that actually write.
+        state = _state.get()
+        if state is not None:
+            instance = hints.get('instance')
+            if isinstance(instance, User) and instance.pk:
+                state.written_user_ids.add(instance.pk)  # e.g. a registration, made anonymously
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *replica_aliases()}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+
+def record_write(execute, sql, params, many, context):
+    """Connection execute wrapper (installed on every connection, see signals) marking requests that wrote."""
+    state = _state.get()
+    if state is not None and not state.wrote and sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+        state.wrote = True
+    return execute(sql, params, many, context)
+
+
+@checks.register(checks.Tags.database)
+def check_pin_cache(app_configs, **kwargs):
+    """Replica pins kept in a process-local cache only reach the worker that set them."""
+    from .authentication import cache_is_shared
+
+    if replica_aliases() and not cache_is_shared():
+        return [checks.Warning(
+            "Read replicas are configured but the default cache is process-local, so JWT clients may "
+            "not read their own writes when several workers serve them.",
+            hint="Set CACHE_BACKEND to a shared cache such as Redis or Memcached.",
+            id='account_app.W001',
+        )]
+    return []
+
+
+class ReplicaPinMiddleware:
+    """Pins whoever just wrote to the primary, by user id and by cookie."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _state.set(state := _RoutingState())
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote and replica_aliases():
+            user = getattr(request, 'user', None)  # DRF and the async views set the JWT user here
+            user_ids = set(state.written_user_ids)
+            if user is not None and user.is_authenticated:
+                user_ids.add(user.pk)
+            cache.set_many({PIN_CACHE_KEY.format(user_id): True for user_id in user_ids}, PIN_SECONDS)
+            response.set_cookie(PIN_COOKIE, '1', max_age=PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,81 @@
+"""
+Preference-side scoring: how well one profile fits many UserPreference rows.
+
+This is the reverse direction of ProfileSnapshot.match_percentages (many profiles
+against one preference); both mirror calculate_match_percentage.
+"""
+from datetime import date
+
+import numpy as np
+
+from .ages import age_on
+from .distance import haversine_km
+
+# Same threshold calculate_match_percentage uses for the location criterion
+LOCATION_MATCH_KM = 50
+
+PREFERENCE_COLUMNS = (
+    'user_id',
+    'preferred_age_min', 'preferred_age_max',
+    'preferred_height_min', 'preferred_height_max',
+    'preferred_weight_min', 'preferred_weight_max',
+    'user__profile__latitude', 'user__profile__longitude',
+)
+
+
+def _column(values):
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+
+
+class PreferenceColumns:
+    """The range criteria of many UserPreference rows (plus their owners' location) as arrays."""
+
+    def __init__(self, rows):
+        rows = list(rows)
+        columns = zip(*rows) if rows else [()] * len(PREFERENCE_COLUMNS)
+        owner_ids, age_min, age_max, height_min, height_max, weight_min, weight_max, lats, lons = columns
+        self.owner_ids = np.array(owner_ids, dtype=np.int64)
+        self.ranges = [
+            ('age', _column(age_min), _column(age_max)),
+            ('height', _column(height_min), _column(height_max)),
+            ('weight', _column(weight_min), _column(weight_max)),
+        ]
+        self.latitudes, self.longitudes = _column(lats), _column(lons)
+
+    @classmethod
+    def load(cls, queryset):
+        """One query for every preference row in `queryset`."""
+        return cls(queryset.values_list(*PREFERENCE_COLUMNS))
+
+    def __len__(self):
+        return len(self.owner_ids)
+
+
+def fit_percentages(profile, preferences, distances=None):
+    """
+    Match percentage of `profile` in the eyes of every row of `preferences`.
+
+    Pass `distances` (km from `profile` to each owner, aligned with the rows) when
+    they are already known; otherwise they are computed from the owners' locations.
+    """
+    score = np.zeros(len(preferences), dtype=np.float64)
+    total = np.zeros(len(preferences), dtype=np.float64)
+
+    for field, low, high in preferences.ranges:
+        # The age as of today, not the stored UserProfile.age
+        value = age_on(profile.date_of_birth, date.today()) if field == 'age' else getattr(profile, field)
+        active = (np.nan_to_num(low) != 0) & (np.nan_to_num(high) != 0)
+        if value is not None:
+            score += active & (low <= float(value)) & (float(value) <= high)
+        total += active
+
+    if profile.latitude and profile.longitude:
+        located = (np.nan_to_num(preferences.latitudes) != 0) & (np.nan_to_num(preferences.longitudes) != 0)
+        if distances is None:
+            distances = haversine_km(profile.latitude, profile.longitude, preferences.latitudes, preferences.longitudes)
+        score += located & (distances <= LOCATION_MATCH_KM)
+        total += located
+
+    percentages = np.zeros(len(preferences), dtype=np.float64)
+    np.divide(score, total, out=percentages, where=total > 0)
+    return percentages * 100
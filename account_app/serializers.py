@@ -1,13 +1,102 @@
-from datetime import date
+import base64
+import binascii
+from functools import lru_cache
+from io import BytesIO
+from PIL import Image, UnidentifiedImageError
 from rest_framework import serializers
 from .models import UserProfile, UserPreference
 from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db.models.functions import Lower
+from .backends import normalize_email
+from .distance import haversine_km
+from .fast_serializers import ValuesSerializer
+from .images import VARIANT_SIZES, variant_name
+
+def parse_fieldset(query_params, serializer_class):
+    """
+    Output fields picked with ?fields=a,b and/or ?exclude=c, or None when neither is given.
+
+    `serializer_class.fieldset_choices()` lists the names a client may pick; a
+    dotted name ("userprofile.country") selects one key of a nested field. Raises
+    ValidationError (a 400) for unknown names and for selections left empty.
+    """
+    if 'fields' not in query_params and 'exclude' not in query_params:
+        return None
+    choices = serializer_class.fieldset_choices()
+
+    def expand(param):
+        names = [name.strip() for name in query_params.get(param, '').split(',') if name.strip()]
+        unknown = [name for name in names if name not in choices]
+        if unknown:
+            raise serializers.ValidationError({param: [f"Unknown field(s): {', '.join(unknown)}. Choose from: {', '.join(choices)}."]})
+        return {leaf for name in names for leaf in choices if leaf == name or leaf.startswith(name + '.')}
+
+    picked = expand('fields') if 'fields' in query_params else set(choices)
+    if not picked:
+        raise serializers.ValidationError({'fields': ["Name at least one field, or leave out ?fields= for all of them."]})
+    fields = tuple(leaf for leaf in choices if leaf in picked - expand('exclude'))
+    if not fields:
+        raise serializers.ValidationError({'exclude': ["Excludes every selected field."]})
+    return fields
+
+
+class SparseFieldsMixin:
+    """
+    Serializer taking a `fields` argument (see parse_fieldset) that drops every other output field.
+
+    Subclasses with a nested dict field list its keys in `nested_fieldsets`
+    ({field: keys}); the picked keys end up in `self.nested_fields[field]`.
+    """
+    nested_fieldsets = {}
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.nested_fields = {name: tuple(keys) for name, keys in self.nested_fieldsets.items()}
+        if fields is None:
+            return
+        for name in set(self.fields) - {leaf.split('.')[0] for leaf in fields}:
+            self.fields.pop(name)
+        for name, keys in self.nested_fieldsets.items():
+            self.nested_fields[name] = tuple(key for key in keys if f"{name}.{key}" in fields)
+
+    @classmethod
+    def fieldset_choices(cls):
+        return _fieldset_choices(cls)
+
+
+@lru_cache(maxsize=None)
+def _fieldset_choices(serializer_class):
+    names = []
+    for name, field in serializer_class().fields.items():
+        if field.write_only:
+            continue
+        names.append(name)
+        names.extend(f"{name}.{key}" for key in serializer_class.nested_fieldsets.get(name, ()))
+    return tuple(names)
+
+
+class UserProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    profile_pic_urls = serializers.SerializerMethodField()
+
+    # get_profile_pic_urls for ValuesSerializer rows
+    values_methods = {
+        'profile_pic_urls': (
+            ('profile_pic', 'profile_pic_variants'),
+            lambda url, pic, variants: {variant: url(variant_name(pic, variants, variant)) for variant in VARIANT_SIZES},
+        ),
+    }
 
-from geopy.distance import geodesic
-class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
-        fields = '__all__'  # Include all fields
+        exclude = ['geo_cell_lat', 'geo_cell_lon', 'profile_pic_variants']  # Internal bookkeeping, everything else is included
+        read_only_fields = ['age']  # Derived from date_of_birth in UserProfile.save
+
+    def get_profile_pic_urls(self, obj):
+        """Resized picture variants, smallest first."""
+        return {variant: obj.profile_pic_url(variant) for variant in VARIANT_SIZES}
 
 class UserPreferenceSerializer(serializers.ModelSerializer):
     class Meta:
@@ -18,7 +107,7 @@ class UserPreferenceSerializer(serializers.ModelSerializer):
    
 class UserProfileRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
-    profile_pic = serializers.ImageField(source="profile_picture", required=False)
+    profile_pic = serializers.CharField(required=False, write_only=True, help_text="Base64 data URI, e.g. data:image/png;base64,...")
     
 
     # UserProfile fields
@@ -56,8 +145,25 @@ class UserProfileRegistrationSerializer(serializers.ModelSerializer):
             'preferred_weight_min', 'preferred_weight_max', 'preferred_education', 'preferred_location'
         ]
 
+    def validate_email(self, value):
+        """Addresses are unique ignoring case, the way EmailBackend looks them up."""
+        if User.objects.annotate(email_lower=Lower('email')).filter(email_lower=normalize_email(value)).exists():
+            raise serializers.ValidationError("A user with this email already exists.")
+        return value
+
+    def validate_profile_pic(self, value):
+        """Decodes the data URI; resizing happens later, off the request path (see images.py)."""
+        try:
+            header, imgstr = value.split(';base64,')  # Extract the format and base64 string
+            ext = header.split('/')[1]  # Extract the file extension (e.g., png, jpeg)
+            data = base64.b64decode(imgstr, validate=True)
+            Image.open(BytesIO(data))  # Only parses the header
+        except (ValueError, IndexError, binascii.Error, UnidentifiedImageError):
+            raise serializers.ValidationError("Expected a base64 encoded image, e.g. 'data:image/png;base64,...'.")
+        return ContentFile(data, name="profile_pic." + ext)
+
     def create(self, validated_data):
-        profile_pic_data = validated_data.pop('profile_pic', None)
+        profile_pic = validated_data.pop('profile_pic', None)
         # Extract user-related data
         password = validated_data.pop('password')
         user_data = {key: validated_data[key] for key in ['username', 'email', 'first_name', 'last_name']}
@@ -67,21 +173,11 @@ class UserProfileRegistrationSerializer(serializers.ModelSerializer):
         user.set_password(password)
         user.save()
 
-        # Calculate age from date_of_birth
-        date_of_birth = validated_data.get('date_of_birth')
-        today = date.today()
-        age = today.year - date_of_birth.year - ((today.month, today.day) < (date_of_birth.month, date_of_birth.day))
-
-        if profile_pic_data:
-            format, imgstr = profile_pic_data.split(';base64,')  # Extract the format and base64 string
-            ext = format.split('/')[1]  # Extract the file extension (e.g., png, jpeg)
-            image_data = ContentFile(base64.b64decode(imgstr), name="profile_pic." + ext)
-            validated_data['profile_picture'] = image_data 
-        
         # Create UserProfile data
         profile_data = {key: validated_data[key] for key in ['created_by', 'gender', 'name', 'date_of_birth', 'height', 'weight', 'education', 'country', 'address', 'phone_number', 'hide_phone_number', 'language', 'religion']}
+        if profile_pic:
+            profile_data['profile_pic'] = profile_pic  # Stored as uploaded; variants are rendered in the background
         profile_data['user'] = user
-        profile_data['age'] = age  # Set the calculated age
         profile_data['email'] = validated_data['email']  # Add email to the profile
         profile = UserProfile.objects.create(**profile_data)
 
@@ -107,14 +203,8 @@ class LoginSerializer(serializers.Serializer):
         email = data.get("email")
         password = data.get("password")
 
-        # Check if user exists with this email
-        try:
-            user = User.objects.get(email=email)
-        except User.DoesNotExist:
-            raise serializers.ValidationError("Invalid email or password.")
-
-        # Authenticate using email
-        user = authenticate(username=user.username, password=password)
+        # EmailBackend finds the user by email and checks the password in one query
+        user = authenticate(self.context.get("request"), email=email, password=password)
         if not user:
             raise serializers.ValidationError("Invalid email or password.")
 
@@ -128,56 +218,100 @@ class LoginSerializer(serializers.Serializer):
 
 
 # <------------------------------------- Explore Area ------------------------------------->
-class Explore_UserSerializer(serializers.ModelSerializer):
+# userprofile key -> (UserProfile columns it reads, value from the profile)
+EXPLORE_PROFILE_FIELDS = {
+    "id": (('id',), lambda profile: profile.id),
+    "country": (('country',), lambda profile: profile.country),
+    "profile_picture": (('profile_pic', 'profile_pic_variants'), lambda profile: profile.profile_pic_url('card')),
+    "phone_number": (('phone_number',), lambda profile: profile.phone_number),
+    "date_of_birth": (('date_of_birth',), lambda profile: profile.date_of_birth),
+    "gender": (('gender',), lambda profile: profile.gender),
+    "address": (('address',), lambda profile: profile.address),
+    "created_at": (('created_at',), lambda profile: profile.created_at),
+}
+
+class Explore_UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     userprofile = serializers.SerializerMethodField()  # Get full user profile data
     distance = serializers.SerializerMethodField()
+    nested_fieldsets = {'userprofile': EXPLORE_PROFILE_FIELDS}
+
     class Meta:
         model = User
         fields = ["username", "userprofile", "distance"]  # Include full UserProfile inside
 
+    @classmethod
+    def restrict(cls, queryset, fields=None, *extra):
+        """Loads only the User/UserProfile columns `fields` (parse_fieldset output, None for all) and `extra` need."""
+        fields = cls.fieldset_choices() if fields is None else fields
+        columns = ['id', *extra] + [name for name in ('username',) if name in fields]
+        for key, (profile_columns, _) in EXPLORE_PROFILE_FIELDS.items():
+            if f"userprofile.{key}" in fields:
+                columns += [f"profile__{column}" for column in profile_columns]
+        if any(column.startswith('profile__') for column in columns):
+            queryset = queryset.select_related('profile')
+        return queryset.only(*columns)
+
     def get_userprofile(self, obj):
         """Fetch all user profile data dynamically."""
-        user_profile = UserProfile.objects.get(user=obj)
-        return {
-            "id": user_profile.id,
-            "country": user_profile.country,
-            "profile_picture": user_profile.profile_picture.url if user_profile.profile_picture else None,
-            "bio": user_profile.bio,
-            "phone_number": user_profile.phone_number,
-            "date_of_birth": user_profile.date_of_birth,
-            "gender": user_profile.gender,
-            "address": user_profile.address,
-            "city": user_profile.city,
-            "zip_code": user_profile.zip_code,
-            "created_at": user_profile.created_at,
-        }
+        # Views load the profile with select_related('profile'), so this does not query
+        user_profile = getattr(obj, 'profile', None)
+        if user_profile is None:
+            return None
+        return {key: EXPLORE_PROFILE_FIELDS[key][1](user_profile) for key in self.nested_fields['userprofile']}
         
     def get_distance(self, obj):
         """Calculate the distance between the user's location and a dynamic reference point."""
+        # Distances already computed in bulk by the view (user id -> km)
+        distances = self.context.get('distances')
+        if distances is not None:
+            return distances.get(obj.id)
+
         # Get the reference location from request data
         reference_location = self.context.get('reference_location', None)
+        if not reference_location:
+            return None
+        user_profile = getattr(obj, 'profile', None)
         
-        if reference_location:
+        if user_profile is not None:
             latitude, longitude = reference_location
-            user_profile = UserProfile.objects.get(user=obj)
-            user_location = (user_profile.latitude, user_profile.longitude)
             
             if user_profile.latitude and user_profile.longitude:
-                distance = geodesic(user_location, (latitude, longitude)).km  # Distance in kilometers
-                return round(distance, 2)  # Return distance rounded to 2 decimal places
+                distance = haversine_km(latitude, longitude, [user_profile.latitude], [user_profile.longitude])[0]
+                return round(float(distance), 2)  # Return distance rounded to 2 decimal places
         return None
     
+class MatchSerializer(SparseFieldsMixin, serializers.Serializer):
+    """One entry of the match list; the views build entries as dicts, this names the fields ?fields= can pick."""
+    user_id = serializers.IntegerField()
+    username = serializers.CharField()
+    match_percentage = serializers.FloatField()
+    outgoing_percentage = serializers.FloatField()  # with ?limit=&mutual=1
+    incoming_percentage = serializers.FloatField()  # with ?limit=&mutual=1
+    distance = serializers.FloatField(allow_null=True)  # with ?limit=
+    profile_pic = serializers.CharField(allow_null=True)
+
+
 class LastJoinedUserSerializer(serializers.ModelSerializer):
-    user_profile = UserProfileSerializer(read_only=True)
+    user_profile = UserProfileSerializer(source='profile', read_only=True)
 
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'user_profile']
 
+LAST_JOINED_USER_CACHE_KEY = 'account_app:last_joined_user'
+
 def get_last_joined_user():
-    """Fetch the last joined user and serialize the data."""
-    last_joined_user = User.objects.latest('date_joined')  # Fetch the most recent user based on date_joined
-    return LastJoinedUserSerializer(last_joined_user).data
+    """Fetch the last joined user and serialize the data (cached until a User/UserProfile is saved)."""
+    data = cache.get(LAST_JOINED_USER_CACHE_KEY)
+    if data is None:
+        fast = ValuesSerializer(LastJoinedUserSerializer)
+        last_joined_user = User.objects.values(*fast.columns).latest('date_joined')  # Fetch the most recent user based on date_joined
+        data = fast.to_representation(last_joined_user)
+        cache.set(LAST_JOINED_USER_CACHE_KEY, data, settings.LAST_JOINED_USER_CACHE_TIMEOUT)
+    return data
+
+def invalidate_last_joined_user():
+    cache.delete(LAST_JOINED_USER_CACHE_KEY)
 
 class PreferredEducationSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,83 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_cached_user
+from .geo_index import discard_from_geo_index
+from .images import enqueue_profile_pic
+from .matching import queue_match_refresh
+from .metrics import record_query
+from .models import MatchHistory, UserPreference, UserProfile
+from .routers import record_write
+from .serializers import invalidate_last_joined_user
+from .snapshot import invalidate_profile_snapshot
+
+
+@receiver(post_save, sender=UserProfile)
+def rematch_profile(sender, instance, raw=False, **kwargs):
+    """A profile change affects both who this user matches and who matches them."""
+    if raw:
+        return
+    transaction.on_commit(lambda: queue_match_refresh(profile_user_ids=[instance.user_id]))
+
+
+@receiver(post_save, sender=UserPreference)
+def rematch_preferences(sender, instance, raw=False, **kwargs):
+    """A preference change only affects this user's own matches."""
+    if raw:
+        return
+    transaction.on_commit(lambda: queue_match_refresh(preference_user_ids=[instance.user_id]))
+
+
+@receiver(post_delete, sender=UserProfile)
+def drop_profile_matches(sender, instance, **kwargs):
+    """Without a profile the user neither matches nor is matched (deleting the User cascades anyway)."""
+    MatchHistory.objects.filter(Q(user_id=instance.user_id) | Q(matched_user_id=instance.user_id)).delete()
+
+
+@receiver(post_delete, sender=UserProfile)
+def drop_deleted_profile_from_snapshot(sender, instance, **kwargs):
+    """updated_at cannot report deletions, so this process reloads its snapshot (others compare ids)."""
+    transaction.on_commit(invalidate_profile_snapshot)
+
+
+@receiver(post_delete, sender=UserProfile)
+def drop_deleted_profile_from_geo_index(sender, instance, **kwargs):
+    """The geo index file keeps the profile until the next rebuild, so this process masks it now."""
+    transaction.on_commit(lambda: discard_from_geo_index(instance.user_id))
+
+
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=UserProfile)
+def drop_last_joined_user_cache(sender, instance, **kwargs):
+    """The cached last-joined-user payload embeds both the User and its profile."""
+    transaction.on_commit(invalidate_last_joined_user)
+
+
+@receiver([post_save, post_delete], sender=User)
+def drop_cached_jwt_user(sender, instance, **kwargs):
+    """Saves cover password changes and deactivation, both of which must reach authentication."""
+    transaction.on_commit(lambda: invalidate_cached_user(instance.pk))
+
+
+@receiver(post_save, sender=UserProfile)
+def render_profile_pic(sender, instance, raw=False, **kwargs):
+    """Queues resized variants whenever the original picture changes."""
+    if raw or not instance.profile_pic:
+        return
+    if instance.profile_pic.name == UserProfile._meta.get_field('profile_pic').default:
+        return  # the shared placeholder is not resized per user
+    if instance.profile_pic_variants.get('source') == instance.profile_pic.name:
+        return
+    transaction.on_commit(lambda: enqueue_profile_pic(instance.pk))
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """Counts and times every query for the request metrics and notes writes for replica pinning (no-ops outside requests)."""
+    for wrapper in (record_query, record_write):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
@@ -0,0 +1,325 @@
+import heapq
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+
+from .ages import birth_date_range
+from .distance import haversine_km
+from .images import variant_url
+from .models import UserPreference, UserProfile
+from .scoring import LOCATION_MATCH_KM, PreferenceColumns, fit_percentages
+
+# How often (seconds) a request may trigger an incremental refresh from the DB
+REFRESH_SECONDS = getattr(settings, 'PROFILE_SNAPSHOT_REFRESH_SECONDS', 5)
+
+# Re-read rows this far behind the watermark so slow-committing writes are not missed
+REFRESH_OVERLAP = timedelta(seconds=2)
+
+# Rows scored per pass in top_matches before checking whether the rest can still place
+TOP_MATCHES_BLOCK = 1024
+
+SNAPSHOT_COLUMNS = (
+    'user_id', 'user__username', 'date_of_birth', 'height', 'weight', 'latitude', 'longitude',
+    'profile_pic', 'profile_pic_variants', 'updated_at',
+)
+
+
+def _nullable(values, dtype):
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=dtype)
+
+
+class ProfileSnapshot:
+    """
+    Process-local, column-oriented copy of the profile fields used for matching.
+
+    Each column is a typed NumPy array indexed by row, so a whole candidate set
+    can be scored against one UserPreference with array comparisons instead of
+    building a model instance per profile.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watermark = None
+        self._checked_at = 0.0
+        self._preferences = None  # PreferenceColumns of every UserPreference, for mutual_matches
+        self._preferences_stamp = None
+        self._reset()
+
+    def _reset(self):
+        self._rows = {}  # user id -> row index
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.birth_days = np.empty(0, dtype=np.int32)  # date_of_birth as a proleptic ordinal
+        self.heights = np.empty(0, dtype=np.float32)
+        self.weights = np.empty(0, dtype=np.float32)
+        self.latitudes = np.empty(0, dtype=np.float64)
+        self.longitudes = np.empty(0, dtype=np.float64)
+        self.usernames = []
+        self.pic_urls = []
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def refresh(self, force=False):
+        """
+        Pulls rows changed since the last refresh, or everything on the first call.
+
+        Always reads the primary, even inside a @use_replica view: a lagging
+        replica would move the watermark past rows it has not received yet.
+        """
+        profiles = UserProfile.objects.using('default')
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._watermark is not None and now - self._checked_at < REFRESH_SECONDS:
+                return
+            self._checked_at = now
+
+            if self._watermark is None:
+                self._load(profiles.order_by('id').values_list(*SNAPSHOT_COLUMNS), replace=True)
+            else:
+                changed = profiles.filter(updated_at__gte=self._watermark - REFRESH_OVERLAP)
+                self._load(changed.values_list(*SNAPSHOT_COLUMNS), replace=False)
+
+                # updated_at cannot tell us about deletions made by other processes (ours arrive through
+                # invalidate()). The sum of ids also catches a delete and a create in the same window,
+                # which leave the count unchanged.
+                present = profiles.aggregate(count=Count('user_id'), ids=Sum('user_id'))
+                if (present['count'], present['ids'] or 0) != (len(self), int(self.user_ids.sum())):
+                    self._load(profiles.order_by('id').values_list(*SNAPSHOT_COLUMNS), replace=True)
+
+            # The preference columns carry their owners' locations, so profile changes count too
+            preferences = UserPreference.objects.using('default').aggregate(count=Count('pk'), latest=Max('updated_at'))
+            stamp = (self._watermark, len(self), preferences['count'], preferences['latest'])
+            if stamp != self._preferences_stamp:
+                self._preferences, self._preferences_stamp = None, stamp
+
+    def preference_columns(self):
+        """Every UserPreference as PreferenceColumns, loaded once and kept until refresh() sees a change."""
+        with self._lock:
+            if self._preferences is None:
+                self._preferences = PreferenceColumns.load(UserPreference.objects.using('default'))
+            return self._preferences
+
+    def invalidate(self):
+        """Forces a full reload on the next refresh, e.g. after a profile was deleted."""
+        with self._lock:
+            self._watermark = None
+            self._preferences = None
+
+    def _load(self, rows, replace):
+        rows = list(rows)
+        if replace:
+            self._reset()
+            self._watermark = None
+        if not rows:
+            return
+
+        user_ids, usernames, births, heights, weights, lats, lons, pics, variants, stamps = zip(*rows)
+        columns = (
+            np.array(user_ids, dtype=np.int64),
+            np.array([born.toordinal() for born in births], dtype=np.int32),
+            _nullable(heights, np.float32),
+            _nullable(weights, np.float32),
+            _nullable(lats, np.float64),
+            _nullable(lons, np.float64),
+        )
+        urls = [variant_url(pic, pic_variants, 'thumb') for pic, pic_variants in zip(pics, variants)]
+        self._watermark = max(stamps) if self._watermark is None else max(self._watermark, *stamps)
+
+        positions = np.array([self._rows.get(uid, -1) for uid in user_ids], dtype=np.int64)
+        existing = positions >= 0
+        if existing.any():
+            at = positions[existing]
+            for target, column in zip(self._numeric_columns(), columns):
+                target[at] = column[existing]
+            for i in np.flatnonzero(existing):
+                self.usernames[positions[i]] = usernames[i]
+                self.pic_urls[positions[i]] = urls[i]
+
+        new = ~existing
+        if new.any():
+            start = len(self)
+            (
+                self.user_ids, self.birth_days, self.heights, self.weights, self.latitudes, self.longitudes,
+            ) = (
+                np.concatenate([target, column[new]])
+                for target, column in zip(self._numeric_columns(), columns)
+            )
+            for offset, i in enumerate(np.flatnonzero(new)):
+                self._rows[user_ids[i]] = start + offset
+                self.usernames.append(usernames[i])
+                self.pic_urls.append(urls[i])
+
+    def _numeric_columns(self):
+        return (self.user_ids, self.birth_days, self.heights, self.weights, self.latitudes, self.longitudes)
+
+    def _range_scores(self, user_preferences, rows=slice(None)):
+        """Points and criteria count from the age/height/weight ranges, for `rows` of the snapshot."""
+        births, heights, weights = self.birth_days[rows], self.heights[rows], self.weights[rows]
+        score = np.zeros(len(births), dtype=np.float64)
+        total = np.zeros(len(births), dtype=np.float64)
+
+        age_min, age_max = user_preferences.preferred_age_min, user_preferences.preferred_age_max
+        if age_min and age_max:
+            # Ages as of today, compared as a date_of_birth range
+            born_after, born_by = birth_date_range(age_min, age_max, date.today())
+            score += (births > born_after.toordinal()) & (births <= born_by.toordinal())
+            total += 1
+
+        for column, low, high in (
+            (heights, user_preferences.preferred_height_min, user_preferences.preferred_height_max),
+            (weights, user_preferences.preferred_weight_min, user_preferences.preferred_weight_max),
+        ):
+            if low and high:
+                score += (column >= np.float32(low)) & (column <= np.float32(high))
+                total += 1
+        return score, total
+
+    def _located(self, rows=slice(None)):
+        latitudes, longitudes = self.latitudes[rows], self.longitudes[rows]
+        return ~np.isnan(latitudes) & (latitudes != 0) & ~np.isnan(longitudes) & (longitudes != 0)
+
+    @staticmethod
+    def _percentages(score, total):
+        percentages = np.zeros(len(score), dtype=np.float64)
+        np.divide(score, total, out=percentages, where=total > 0)
+        return percentages * 100
+
+    def match_percentages(self, user_profile, user_preferences):
+        """
+        Scores every row against `user_preferences`, mirroring calculate_match_percentage.
+
+        Returns a float64 array aligned with the snapshot columns.
+        """
+        return self._score(user_profile, user_preferences)[0]
+
+    def _score(self, user_profile, user_preferences):
+        # (percentages, distances in km or None when the user has no location)
+        score, total = self._range_scores(user_preferences)
+        distances = None
+
+        if user_profile.latitude and user_profile.longitude:
+            located = self._located()
+            distances = haversine_km(user_profile.latitude, user_profile.longitude, self.latitudes, self.longitudes)
+            score += located & (distances <= LOCATION_MATCH_KM)
+            total += located
+
+        return self._percentages(score, total), distances
+
+    def matches(self, user_profile, user_preferences, min_percentage=0):
+        """Returns `(user_id, username, match_percentage, pic_url)` for rows scoring above `min_percentage`."""
+        with self._lock:
+            percentages = self.match_percentages(user_profile, user_preferences)
+            rows = np.flatnonzero((percentages > min_percentage) & (self.user_ids != user_profile.user_id))
+            return [
+                (int(self.user_ids[i]), self.usernames[i], float(percentages[i]), self.pic_urls[i])
+                for i in rows
+            ]
+
+    def top_matches(self, user_profile, user_preferences, limit, min_percentage=0):
+        """
+        The best `limit` rows scoring above zero and at least `min_percentage`, best first.
+
+        Returns `(user_id, username, match_percentage, pic_url, distance_km)` tuples
+        sorted by score, then distance (unknown distances last). The range criteria
+        give every row an upper bound before any distance is computed; rows are
+        scored in blocks from the highest bound down, and scoring stops once no
+        remaining bound can beat the current `limit`-th score.
+        """
+        with self._lock:
+            score, total = self._range_scores(user_preferences)
+            user_located = bool(user_profile.latitude and user_profile.longitude)
+            located = self._located() if user_located else np.zeros(len(self), dtype=bool)
+            # A located row can at best also earn the location point
+            bounds = self._percentages(score + located, total + located)
+
+            eligible = (bounds > 0) & (bounds >= min_percentage) & (self.user_ids != user_profile.user_id)
+            candidates = np.flatnonzero(eligible)
+            candidates = candidates[np.argsort(-bounds[candidates], kind='stable')]
+
+            best = []  # min-heap of (percentage, -distance, -user_id, row); best[0] is the current worst
+            block_size = max(limit, TOP_MATCHES_BLOCK)
+            for start in range(0, len(candidates), block_size):
+                if len(best) == limit and bounds[candidates[start]] < best[0][0]:
+                    break
+                rows = candidates[start:start + block_size]
+                distances = np.full(len(rows), np.inf)
+                if user_located:
+                    distances[located[rows]] = haversine_km(
+                        user_profile.latitude, user_profile.longitude,
+                        self.latitudes[rows][located[rows]], self.longitudes[rows][located[rows]],
+                    )
+                near = located[rows] & (distances <= LOCATION_MATCH_KM)
+                percentages = self._percentages(score[rows] + near, total[rows] + located[rows])
+
+                for row, percentage, distance in zip(rows, percentages, distances):
+                    if percentage <= 0 or percentage < min_percentage:
+                        continue
+                    entry = (float(percentage), -float(distance), -int(self.user_ids[row]), int(row))
+                    if len(best) < limit:
+                        heapq.heappush(best, entry)
+                    elif entry > best[0]:
+                        heapq.heapreplace(best, entry)
+
+            return [
+                (
+                    int(self.user_ids[row]), self.usernames[row], percentage, self.pic_urls[row],
+                    None if np.isinf(distance) else -distance,
+                )
+                for percentage, distance, _, row in sorted(best, reverse=True)
+            ]
+
+    def mutual_matches(self, user_profile, user_preferences, preferences, limit, min_percentage=0):
+        """
+        The best `limit` rows by two-sided score, given every candidate's PreferenceColumns
+        (usually preference_columns()).
+
+        The mutual score is the geometric mean of how well the row fits
+        `user_preferences` and how well `user_profile` fits the row's own
+        preferences, so a one-sided fit ranks low. Both directions are computed
+        for the whole snapshot in one pass and share the distance column.
+        Returns `(user_id, username, mutual, outgoing, incoming, pic_url, distance_km)`
+        tuples sorted by mutual score, then distance.
+        """
+        with self._lock:
+            outgoing, distances = self._score(user_profile, user_preferences)
+            if distances is None:
+                distances = np.full(len(self), np.nan)
+
+            # Align the preference rows with the snapshot rows of their owners
+            positions = np.array([self._rows.get(int(uid), -1) for uid in preferences.owner_ids], dtype=np.int64)
+            known = positions >= 0
+            incoming = np.zeros(len(self), dtype=np.float64)
+            incoming[positions[known]] = fit_percentages(user_profile, preferences, distances[positions])[known]
+
+            mutual = np.sqrt(outgoing * incoming)
+            eligible = np.flatnonzero(
+                (mutual > 0) & (mutual >= min_percentage) & (self.user_ids != user_profile.user_id)
+            )
+            sort_distances = np.nan_to_num(distances[eligible], nan=np.inf)
+            # lexsort keys run from least to most significant
+            ranked = eligible[np.lexsort((self.user_ids[eligible], sort_distances, -mutual[eligible]))][:limit]
+
+            return [
+                (
+                    int(self.user_ids[i]), self.usernames[i], float(mutual[i]), float(outgoing[i]), float(incoming[i]),
+                    self.pic_urls[i], None if np.isnan(distances[i]) else float(distances[i]),
+                )
+                for i in ranked
+            ]
+
+
+_snapshot = ProfileSnapshot()
+
+
+def invalidate_profile_snapshot():
+    _snapshot.invalidate()
+
+
+def get_profile_snapshot(force=False):
+    """Returns the process-wide snapshot, refreshed from the DB if it is due (or `force` is set)."""
+    _snapshot.refresh(force=force)
+    return _snapshot
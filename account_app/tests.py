@@ -1,3 +1,1300 @@
-from django.test import TestCase
+import json
+import math
+import os
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+import numpy as np
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework import serializers
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .age_refresh import refresh_stored_ages
+from .ages import age_on
+from .authentication import CachedJWTAuthentication, LRUCache, _users as _cached_users
+from .benchmarks import ENDPOINTS, BenchmarkError, run_benchmarks
+from .bulk_import import import_file
+from .distance import haversine_km
+from .fast_serializers import ValuesSerializer
+from .geo import covering_cells, grid_cell
+from .geo_index import GeoIndex, KDTree, build_geo_index, chord_for_km, get_geo_index, km_for_chord, profiles_within, unit_vectors
+from .matching import rebuild_all_matches, refresh_matches, refresh_outgoing_matches
+from .metrics import QUERIES, REQUESTS, SERIALIZER_TIME, Counter, Histogram, _RequestStats, _current, record_query
+from .models import MatchHistory, RevokedToken, UserPreference, UserProfile
+from .population import generate_population
+from .revocation import BloomFilter, RevocationStore, get_revocation_store
+from .routers import PIN_COOKIE, PIN_CACHE_KEY, check_pin_cache, replica_reads
+from .scoring import PreferenceColumns
+from .serializers import LastJoinedUserSerializer, UserPreferenceSerializer, UserProfileSerializer
+from .snapshot import ProfileSnapshot, get_profile_snapshot
+from .views import calculate_distance, calculate_match_percentage, score_ranked_matches
+
+
+def create_member(username, latitude=23.8103, longitude=90.4125, **profile_fields):
+    """Creates a User with a UserProfile and UserPreference, like registration does."""
+    user = User.objects.create_user(username=username, email=f"{username}@example.com")
+    profile_data = {
+        'created_by': 'self',
+        'gender': 'female',
+        'name': username.title(),
+        'date_of_birth': date(1995, 6, 1),
+        'email': user.email,
+        'height': 165,
+        'weight': 60,
+        'latitude': latitude,
+        'longitude': longitude,
+    }
+    profile_data.update(profile_fields)
+    UserProfile.objects.create(user=user, **profile_data)
+    UserPreference.objects.create(user=user, preferred_age_min=25, preferred_age_max=35)
+    return user
+
+
+class ExploreQueryCountTests(TestCase):
+    """Explore_UserSerializer must not issue per-row queries."""
+
+    def setUp(self):
+        self.me = create_member("me")
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def add_members(self, count):
+        for i in range(count):
+            create_member(f"member{User.objects.count()}_{i}", latitude=23.8103 + i * 0.001)
+
+    def test_explore_query_count_is_independent_of_page_size(self):
+        self.add_members(3)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('list-other-users'))
+        self.assertEqual(len(response.json()['results']), 3)
+
+        self.add_members(12)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('list-other-users'))
+        self.assertEqual(len(response.json()['results']), 15)
+
+    def test_explore_includes_profile(self):
+        self.add_members(1)
+        result = self.client.get(reverse('list-other-users')).json()['results'][0]
+        self.assertEqual(result['userprofile']['gender'], 'female')
+        self.assertIsNone(result['distance'])
+
+    def test_start_matching_query_count_is_independent_of_result_size(self):
+        self.add_members(3)
+        with self.assertNumQueries(2):
+            response = self.client.post(reverse('start_matching'), {'latitude': 23.8103, 'longitude': 90.4125}, format='json')
+        self.assertEqual(len(response.json()), 4)
+
+        self.add_members(12)
+        with self.assertNumQueries(2):
+            response = self.client.post(reverse('start_matching'), {'latitude': 23.8103, 'longitude': 90.4125}, format='json')
+        self.assertEqual(len(response.json()), 16)
+        self.assertTrue(all(row['distance'] is not None for row in response.json()))
+
+
+def points_around(latitude, longitude, radius_km, count, seed=0):
+    """`count` random points within `radius_km` of a coordinate (and a few on the circle itself)."""
+    rng = np.random.default_rng(seed)
+    bearings = rng.uniform(0, 2 * np.pi, count)
+    spans = np.concatenate((rng.uniform(0, radius_km, count - 8), np.full(8, radius_km))) / 6371.0
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2 = np.arcsin(np.sin(lat1) * np.cos(spans) + np.cos(lat1) * np.sin(spans) * np.cos(bearings))
+    lon2 = lon1 + np.arctan2(np.sin(bearings) * np.sin(spans) * np.cos(lat1), np.cos(spans) - np.sin(lat1) * np.sin(lat2))
+    return np.round(np.degrees(lat2), 9), np.round((np.degrees(lon2) + 180) % 360 - 180, 9)
+
+
+class GeoCellTests(TestCase):
+    """covering_cells (and so UserProfile.objects.near) never miss a point inside the radius."""
+
+    CENTERS = [(23.81, 90.41), (0.0, 179.99), (-45.0, -179.9), (60.0, 0.0), (89.5, 10.0), (-89.8, -120.0)]
+
+    def test_grid_cell(self):
+        self.assertEqual(grid_cell(23.8103, 90.4125), (95, 361))
+        self.assertEqual(grid_cell(-0.1, -180), (-1, -720))
+        self.assertEqual(grid_cell(Decimal("0.25"), Decimal("-0.25")), (1, -1))
+        self.assertEqual(grid_cell(None, 90.4), (None, None))
+
+    def test_covering_cells_contain_the_radius(self):
+        for latitude, longitude in self.CENTERS:
+            for radius_km in (0, 0.5, 10, 100, 1000):
+                with self.subTest(center=(latitude, longitude), radius_km=radius_km):
+                    lat_range, lon_ranges = covering_cells(latitude, longitude, radius_km)
+                    for lat, lon in zip(*points_around(latitude, longitude, radius_km, 300)):
+                        cell_lat, cell_lon = grid_cell(lat, lon)
+                        self.assertTrue(lat_range[0] <= cell_lat <= lat_range[1], (lat, lon))
+                        if lon_ranges is not None:
+                            self.assertTrue(any(lo <= cell_lon <= hi for lo, hi in lon_ranges), (lat, lon))
+
+    def test_antimeridian_and_poles(self):
+        lat_range, lon_ranges = covering_cells(0.0, 179.99, 10)
+        self.assertEqual(lon_ranges, [(719, 720), (-720, -720)])  # both sides of ±180
+        self.assertIsNone(covering_cells(89.95, 10.0, 10)[1])  # the circle covers the pole: every longitude
+        self.assertEqual(covering_cells(-89.95, 10.0, 10)[0][0], -360)
+        self.assertEqual(covering_cells(23.81, 90.41, 0), ((95, 95), [(361, 361)]))
+
+    def test_near_matches_brute_force(self):
+        radius_km = 50
+        located = []
+        for n, (latitude, longitude) in enumerate(self.CENTERS[1:5]):
+            lats, lons = points_around(latitude, longitude, 2 * radius_km, 12, seed=n)
+            for i, (lat, lon) in enumerate(zip(lats, lons)):
+                user = create_member(f"member{n}_{i}", latitude=round(lat, 6), longitude=round(lon, 6))
+                located.append((user.id, float(user.profile.latitude), float(user.profile.longitude)))
+        user_ids = np.array([row[0] for row in located])
+        for latitude, longitude in self.CENTERS:
+            with self.subTest(center=(latitude, longitude)):
+                distances = haversine_km(latitude, longitude, [row[1] for row in located], [row[2] for row in located])
+                found = set(UserProfile.objects.near(latitude, longitude, radius_km).values_list('user_id', flat=True))
+                self.assertLessEqual(set(user_ids[distances <= radius_km].tolist()), found)
+        exact = create_member("exact", latitude=12.5, longitude=-7.25)
+        self.assertIn(exact.id, UserProfile.objects.near(12.5, -7.25, 0).values_list('user_id', flat=True))
+
+
+class HaversineTests(TestCase):
+    def test_agrees_with_the_scalar_formula(self):
+        rng = np.random.default_rng(7)
+        latitudes, longitudes = rng.uniform(-90, 90, 500), rng.uniform(-180, 180, 500)
+        for latitude, longitude in ((23.8103, 90.4125), (0, 180), (-89.9, -45), (51.5, -0.12)):
+            with self.subTest(origin=(latitude, longitude)):
+                expected = [calculate_distance(latitude, longitude, lat, lon) for lat, lon in zip(latitudes, longitudes)]
+                np.testing.assert_allclose(haversine_km(latitude, longitude, latitudes, longitudes), expected, rtol=1e-9, atol=1e-6)
+
+    def test_inputs(self):
+        distances = haversine_km(Decimal("23.8103"), Decimal("90.4125"), [Decimal("23.8103"), None, 22.3569], [Decimal("90.4125"), 91.7832, None])
+        self.assertEqual(distances[0], 0)
+        self.assertTrue(np.isnan(distances[1:]).all())  # a missing coordinate
+        self.assertEqual(haversine_km(0, 0, [], []).shape, (0,))
+        self.assertAlmostEqual(float(haversine_km(0, 0, [0], [180])[0]), math.pi * 6371.0, places=6)  # antipodes
+        self.assertAlmostEqual(calculate_distance(Decimal("10"), Decimal("20"), 11, 20), 6371.0 * math.pi / 180, places=9)  # one degree north
+
+
+class LastJoinedUserCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(create_member("first"))
+
+    def test_hot_path_does_not_query(self):
+        first = self.client.get(reverse('last_joined_user')).json()
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('last_joined_user')).json()
+        self.assertEqual(first, second)
+        self.assertEqual(second['user_profile']['name'], 'First')
+
+    def test_new_user_invalidates_cache(self):
+        self.client.get(reverse('last_joined_user'))
+        with self.captureOnCommitCallbacks(execute=True):
+            create_member("second")
+        self.assertEqual(self.client.get(reverse('last_joined_user')).json()['username'], 'second')
+
+
+@skipUnless(connection.vendor == 'sqlite', "reads SQLite's EXPLAIN QUERY PLAN output")
+class QueryPlanTests(TestCase):
+    """Every query behind the main views must be served by an index, never a full table scan."""
+
+    def setUp(self):
+        self.me = create_member("me")
+        self.me.is_staff = True
+        self.me.save()
+        for i in range(5):
+            create_member(f"member{i}", latitude=23.8103 + i * 0.01, height=160 + i)
+        refresh_outgoing_matches(self.me)
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def full_scans(self, method, name, data=None, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(reverse(name, kwargs=kwargs), data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400)
+
+        scans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                for row in cursor.fetchall():
+                    # "SCAN t USING [COVERING] INDEX ..." walks an index in order; a bare "SCAN t" reads every row
+                    if row[3].startswith('SCAN ') and ' USING ' not in row[3]:
+                        scans.append(f"{row[3]}: {query['sql']}")
+        return scans
+
+    def test_main_views_use_indexes(self):
+        profile = UserProfile.objects.get(user=self.me)
+        cases = [
+            ('get', 'list-other-users', None, {}),
+            ('get', 'user-profile-list', None, {}),
+            ('get', 'user-profile-detail', None, {'pk': profile.pk}),
+            ('get', 'user-profile-export', None, {}),
+            ('get', 'user-preferences', None, {}),
+            ('post', 'find_matches', None, {}),
+            ('post', 'start_matching', {'latitude': 23.8103, 'longitude': 90.4125}, {}),
+            ('get', 'find_matches_with_all_percentise', None, {}),
+            ('get', 'last_joined_user', None, {}),
+        ]
+        for method, name, data, kwargs in cases:
+            with self.subTest(view=name):
+                self.assertEqual(self.full_scans(method, name, data, **kwargs), [])
+
+    def test_second_page_uses_index(self):
+        next_page = self.client.get(reverse('user-profile-list'), {'page_size': 2}).json()['next']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(next_page)
+        # queries[0] is the conditional GET lookup (max(updated_at), count)
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {queries[-1]['sql']}")
+            self.assertIn('profile_created_idx', cursor.fetchall()[0][3])
+
+
+class AgeTests(TestCase):
+    """Age ranges run as date_of_birth ranges, and refresh_ages only touches birthdays since the last run."""
+
+    BIRTHDAYS = [date(2004, 2, 29), date(2004, 2, 28), date(2004, 3, 1), date(1995, 6, 1), date(1995, 6, 2), date(1990, 12, 31)]
+
+    def setUp(self):
+        for i, born in enumerate(self.BIRTHDAYS):
+            create_member(f"member{i}", date_of_birth=born)
+
+    def test_aged_matches_age_on(self):
+        profiles = list(UserProfile.objects.all())
+        for today in (date(2026, 2, 28), date(2026, 3, 1), date(2028, 2, 29), date(2026, 6, 1), date(2026, 12, 31)):
+            for age_min, age_max in ((22, 22), (21, 31), (30, 36), (None, 25), (31, None)):
+                with self.subTest(today=today, age_min=age_min, age_max=age_max):
+                    expected = {
+                        p.pk for p in profiles
+                        if (age_min is None or age_min <= age_on(p.date_of_birth, today))
+                        and (age_max is None or age_on(p.date_of_birth, today) <= age_max)
+                    }
+                    actual = set(UserProfile.objects.aged(age_min, age_max, today).values_list('pk', flat=True))
+                    self.assertEqual(actual, expected)
+
+    def test_refresh_only_touches_birthdays_since_last_run(self):
+        refresh_stored_ages(date(2030, 5, 31), materialize=False)  # first run checks everyone
+        self.assertEqual(
+            {p.date_of_birth: p.age for p in UserProfile.objects.all()},
+            {born: age_on(born, date(2030, 5, 31)) for born in self.BIRTHDAYS},
+        )
+        before = dict(UserProfile.objects.values_list('date_of_birth', 'updated_at'))
+
+        self.assertEqual(refresh_stored_ages(date(2030, 6, 2), materialize=False), 2)
+        after = {p.date_of_birth: p for p in UserProfile.objects.all()}
+        for born in self.BIRTHDAYS:
+            self.assertEqual(after[born].age, age_on(born, date(2030, 6, 2)))
+            self.assertEqual(after[born].updated_at != before[born], born.month == 6)
+        self.assertEqual(refresh_stored_ages(date(2030, 6, 2), materialize=False), 0)
+
+    def test_refresh_rematerializes_updated_profiles(self):
+        stale = UserProfile.objects.get(date_of_birth=date(1995, 6, 1))
+        UserProfile.objects.filter(pk=stale.pk).update(age=1)  # every other stored age is already right
+
+        with patch('account_app.age_refresh.refresh_matches', wraps=refresh_matches) as refresh:
+            self.assertEqual(refresh_stored_ages(date.today()), 1)
+        refresh.assert_called_once_with(profile_user_ids=[stale.user_id])
+        involving_stale = Q(user_id=stale.user_id) | Q(matched_user_id=stale.user_id)
+        stored = set(MatchHistory.objects.filter(involving_stale).values_list('user_id', 'matched_user_id', 'match_percentage'))
+        self.assertTrue(stored)
+        rebuild_all_matches()
+        self.assertEqual(stored, set(MatchHistory.objects.filter(involving_stale).values_list('user_id', 'matched_user_id', 'match_percentage')))
+
+    def test_save_accepts_an_iso_birth_date(self):
+        user = User.objects.create_user(username="stringly")
+        profile = UserProfile.objects.create(user=user, created_by='self', gender='male', name="S", date_of_birth='1990-01-01', height=170)
+        self.assertEqual(profile.date_of_birth, date(1990, 1, 1))
+        self.assertEqual(profile.age, age_on(date(1990, 1, 1), date.today()))
+
+
+class FastSerializerParityTests(TestCase):
+    """ValuesSerializer rows must serialize exactly like the DRF serializers they mirror."""
+
+    def setUp(self):
+        create_member("plain")
+        create_member("sparse", weight=None, latitude=None, longitude=None, religion=None, height='170.5')
+        create_member("pictured", height='158.25', profile_pic='profile_pics/original.png')
+        create_member(
+            "rendered", profile_pic='profile_pics/original.jpg',
+            profile_pic_variants={'source': 'profile_pics/original.jpg', 'thumb': 'profile_pics/thumb/a.webp'},
+        )
+        UserPreference.objects.filter(user__username='plain').update(
+            preferred_height_min='150.5', preferred_weight_max=80, preferred_education="Master's",
+        )
+        User.objects.create_user(username="no_profile", email="no_profile@example.com")
+
+    def assertParity(self, serializer_class, queryset, context=None):
+        context = context or {}
+        fast = ValuesSerializer(serializer_class, context=context)
+        rows = {row['id']: row for row in queryset.values(*fast.columns)}
+        instances = list(queryset.order_by('id'))
+        self.assertTrue(instances)
+        for instance in instances:
+            with self.subTest(serializer=serializer_class.__name__, pk=instance.pk):
+                self.assertEqual(fast.to_representation(rows[instance.pk]), serializer_class(instance, context=context).data)
+
+    def test_profiles(self):
+        self.assertParity(UserProfileSerializer, UserProfile.objects.all())
+
+    def test_profiles_with_request_builds_absolute_urls(self):
+        request = APIRequestFactory().get('/profiles/')
+        self.assertParity(UserProfileSerializer, UserProfile.objects.all(), context={'request': request})
+
+    def test_preferences(self):
+        self.assertParity(UserPreferenceSerializer, UserPreference.objects.all())
+
+    def test_nested_profile_including_missing_one(self):
+        self.assertParity(LastJoinedUserSerializer, User.objects.all())
+
+    def test_views_match_drf_output(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(username="plain"))
+        listed = client.get(reverse('user-profile-list')).json()['results']
+        expected = UserProfileSerializer(UserProfile.objects.order_by('created_at', 'id'), many=True).data
+        self.assertEqual(listed, [dict(row) for row in expected])
+
+        cache.clear()
+        self.assertEqual(
+            client.get(reverse('last_joined_user')).json(),
+            LastJoinedUserSerializer(User.objects.latest('date_joined')).data,
+        )
+
+    def test_unsupported_field_is_rejected(self):
+        class Unsupported(serializers.ModelSerializer):
+            greeting = serializers.SerializerMethodField()
+
+            class Meta:
+                model = UserProfile
+                fields = ['id', 'greeting']
+
+        with self.assertRaises(ImproperlyConfigured):
+            ValuesSerializer(Unsupported)
+
+
+class ProfileSnapshotTests(TestCase):
+
+    def test_delete_and_create_in_one_refresh_window(self):
+        gone, kept = create_member("gone"), create_member("kept")
+        snapshot = ProfileSnapshot()  # a snapshot in another process: no post_delete reaches it
+        snapshot.refresh(force=True)
+
+        UserProfile.objects.filter(user=gone).delete()
+        new = create_member("new")
+        snapshot.refresh(force=True)
+        self.assertEqual(set(snapshot.user_ids.tolist()), {kept.id, new.id})
+
+    def test_profile_delete_invalidates_process_snapshot(self):
+        gone = create_member("gone")
+        get_profile_snapshot(force=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            UserProfile.objects.filter(user=gone).delete()
+        self.assertNotIn(gone.id, get_profile_snapshot().user_ids.tolist())
+
+
+@override_settings(MATCH_REFRESH_EAGER=True)
+class MatchMaterializationTests(TestCase):
+    """Saves keep MatchHistory equal to a full rebuild."""
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.me = create_member("me")
+            self.other = create_member("other")
+
+    def stored(self):
+        return set(MatchHistory.objects.values_list('user_id', 'matched_user_id', 'match_percentage'))
+
+    def assertMatchesRebuild(self):
+        stored = self.stored()
+        rebuild_all_matches()
+        self.assertEqual(stored, self.stored())
+
+    def test_created_on_save(self):
+        self.assertEqual(self.stored(), {(self.me.id, self.other.id, 100.0), (self.other.id, self.me.id, 100.0)})
+
+    def test_profile_and_preference_updates(self):
+        profile = self.other.profile
+        profile.date_of_birth = date(1970, 1, 1)  # outside my 25-35 range: age fails, location still matches
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertEqual(self.stored(), {(self.other.id, self.me.id, 100.0)})
+        self.assertMatchesRebuild()
+
+        preferences = self.me.preferences
+        preferences.preferred_age_min, preferences.preferred_age_max = 50, 60
+        with self.captureOnCommitCallbacks(execute=True):
+            preferences.save()
+        self.assertIn((self.me.id, self.other.id, 100.0), self.stored())
+        self.assertMatchesRebuild()
+
+    def test_removed_on_profile_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.profile.delete()
+        self.assertEqual(self.stored(), set())
+
+    def test_batched_refresh_matches_rebuild(self):
+        for i in range(6):
+            create_member(f"member{i}", latitude=23.8103 + i * 0.2, date_of_birth=date(1985 + 3 * i, 1, 1))
+        UserPreference.objects.filter(user__username__startswith="member").update(preferred_age_min=30, preferred_age_max=45)
+        refresh_matches(UserProfile.objects.values_list('user_id', flat=True))
+        self.assertMatchesRebuild()
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.me = create_member("me")
+        for i in range(6):
+            create_member(f"member{i}", latitude=23.8103 + i * 0.01)
+        # Ties on created_at: only the id tie-breaker orders these
+        UserProfile.objects.filter(user__username__in=["member1", "member2", "member3"]).update(
+            created_at=UserProfile.objects.get(user__username="member1").created_at,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def walk(self, method, url, **params):
+        ids, pages = [], 0
+        response = getattr(self.client, method)(url + '?' + '&'.join(f"{k}={v}" for k, v in params.items()))
+        while True:
+            body = response.json()
+            ids += [row['id'] for row in body['results']]
+            pages += 1
+            if not body['next']:
+                return ids, pages
+            response = getattr(self.client, method)(body['next'])
+
+    def test_cursor_round_trip_with_ties(self):
+        ids, pages = self.walk('get', reverse('user-profile-list'), page_size=2)
+        expected = list(UserProfile.objects.order_by('created_at', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 4)  # 7 rows in pages of 2
+
+    def test_filtered_pages_skip_nothing(self):
+        ids, _ = self.walk('post', reverse('find_matches'), page_size=2, radius=3)
+        expected = list(
+            UserProfile.objects.exclude(user=self.me).filter(latitude__lt=23.8103 + 0.027)
+            .order_by('created_at', 'id').values_list('id', flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('user-profile-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.staff = create_member("staff")
+        self.staff.is_staff = True
+        self.staff.save()
+        for i in range(4):
+            create_member(f"member{i}")
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def export(self, **params):
+        response = self.client.get(reverse('user-profile-export'), params)
+        self.assertTrue(response.streaming)
+        chunks = [chunk.decode() if isinstance(chunk, bytes) else chunk for chunk in response.streaming_content]
+        self.assertTrue(all(chunk.endswith('\n') for chunk in chunks))
+        return chunks, [json.loads(line) for line in ''.join(chunks).splitlines()]
+
+    def test_streams_every_row_in_chunks(self):
+        with patch('account_app.export.LINES_PER_WRITE', 2):
+            chunks, rows = self.export()
+        self.assertEqual(len(chunks), 3)
+        expected = UserProfileSerializer(UserProfile.objects.order_by('updated_at', 'id'), many=True).data
+        self.assertEqual(rows, json.loads(json.dumps(expected, cls=DjangoJSONEncoder)))
+
+    def test_preferences_and_updated_window(self):
+        _, rows = self.export(model='preferences')
+        self.assertEqual(len(rows), 5)
+
+        cutoff = UserProfile.objects.order_by('updated_at', 'id')[2].updated_at
+        _, rows = self.export(updated_after=cutoff.isoformat())
+        self.assertEqual([row['id'] for row in rows], list(
+            UserProfile.objects.filter(updated_at__gt=cutoff).order_by('updated_at', 'id').values_list('id', flat=True)
+        ))
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.client.get(reverse('user-profile-export'), {'model': 'users'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('user-profile-export'), {'updated_after': 'yesterday'}).status_code, 400)
+        self.client.force_authenticate(create_member("plain"))
+        self.assertEqual(self.client.get(reverse('user-profile-export')).status_code, 403)
+
+
+class AsyncViewParityTests(TestCase):
+    """The async endpoints answer exactly like their sync twins."""
+
+    def setUp(self):
+        self.me = create_member("me")
+        for i in range(5):
+            create_member(f"member{i}", latitude=23.8103 + i * 0.02, height=160 + i)
+        refresh_outgoing_matches(self.me)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.me).access_token}")
+
+    def assertSameAnswer(self, method, sync_name, async_name, query='', data=None):
+        sync = getattr(self.client, method)(reverse(sync_name) + query, data, format='json')
+        asynchronous = getattr(self.client, method)(reverse(async_name) + query, data, format='json')
+        self.assertEqual(sync.status_code, 200)
+        self.assertEqual(asynchronous.status_code, 200)
+        expected, actual = sync.json(), asynchronous.json()
+        if isinstance(actual, dict) and actual.get('next'):
+            actual['next'] = actual['next'].replace('/async/', '/')  # same cursor, other route
+        self.assertEqual(expected, actual)
+
+    def test_find_matches(self):
+        self.assertSameAnswer('post', 'find_matches', 'async_find_matches', '?radius=5&page_size=2')
+        self.assertSameAnswer('post', 'find_matches', 'async_find_matches', '?fields=id,name')
+
+    def test_start_matching(self):
+        self.assertSameAnswer('post', 'start_matching', 'async_start_matching', data={'latitude': 23.8103, 'longitude': 90.4125})
+
+    def test_match_list(self):
+        self.assertSameAnswer('get', 'find_matches_with_all_percentise', 'async_find_matches_with_all_percentise', '?page_size=2')
+        self.assertSameAnswer('get', 'find_matches_with_all_percentise', 'async_find_matches_with_all_percentise', '?limit=3&mutual=1')
+
+    def test_with_the_geo_index(self):
+        self.enterContext(override_settings(GEO_INDEX_PATH=os.path.join(self.enterContext(TemporaryDirectory()), 'geo_index.kdtree')))
+        build_geo_index()
+        self.assertSameAnswer('post', 'find_matches', 'async_find_matches', '?radius=5')
+        self.assertSameAnswer('post', 'find_matches', 'async_find_matches', '?nearest=3')
+        self.assertSameAnswer('post', 'start_matching', 'async_start_matching', data={'latitude': 23.8103, 'longitude': 90.4125})
+
+    def test_scoring_runs_in_the_pool(self):
+        threads = []
+
+        def score(*args):
+            threads.append(threading.current_thread().name)
+            return score_ranked_matches(*args)
+
+        with patch('account_app.async_views.score_ranked_matches', side_effect=score):
+            self.assertSameAnswer('get', 'find_matches_with_all_percentise', 'async_find_matches_with_all_percentise', '?limit=3')
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith('matching'))
+
+    def test_requires_token(self):
+        self.client.credentials()
+        self.assertEqual(self.client.post(reverse('async_find_matches')).status_code, 401)
+
+
+class PopulationAndBenchmarkTests(TestCase):
+
+    def test_population_rows_are_complete(self):
+        users = generate_population(25, seed=7, batch_size=10)
+        self.assertEqual(len(users), 25)
+        profiles = UserProfile.objects.filter(user__in=users)
+        self.assertEqual(profiles.count(), 25)
+        self.assertEqual(UserPreference.objects.filter(user__in=users).count(), 25)
+        for profile in profiles:
+            self.assertEqual(profile.age, age_on(profile.date_of_birth, date.today()))
+            self.assertEqual((profile.geo_cell_lat, profile.geo_cell_lon), grid_cell(profile.latitude, profile.longitude))
+
+
+    def test_benchmark_rows(self):
+        # logout runs with its own tokens, so the endpoints after it stay authenticated
+        endpoints = ['user-profile-list', 'logout', 'find_matches', 'find_matches_with_all_percentise']
+        report = run_benchmarks([3, 5], iterations=2, endpoints=endpoints)
+        self.assertFalse(os.path.exists(settings.GEO_INDEX_PATH))  # built in a temporary file instead
+        self.assertEqual([row['endpoint'] for row in report['results']], endpoints * 2)
+        self.assertEqual([row['users'] for row in report['results']], [3] * 4 + [5] * 4)
+        for row in report['results']:
+            self.assertLess(row['status'], 400)
+            self.assertLessEqual(row['p50_ms'], row['p95_ms'])
+
+    def test_benchmark_fails_on_error_responses(self):
+        missing_profile = ('get', lambda ctx: ({'pk': 0}, None), None)
+        with patch.dict(ENDPOINTS, {'user-profile-detail': missing_profile}):
+            with self.assertRaisesMessage(BenchmarkError, "returned 404"):
+                run_benchmarks([2], iterations=1, endpoints=['user-profile-detail'])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EmailLoginTests(TestCase):
+    PASSWORD = "s3cret-pass-123"
+
+    def setUp(self):
+        self.user = create_member("ayesha")
+        self.user.email = "Ayesha.Rahman@Example.com"
+        self.user.set_password(self.PASSWORD)
+        self.user.save()
+        self.client = APIClient()
+
+    def login(self, email, password=PASSWORD):
+        return self.client.post(reverse('user-login'), {'email': email, 'password': password}, format='json')
+
+    def test_login_ignores_case_in_one_query(self):
+        for email in ("ayesha.rahman@example.com", "AYESHA.RAHMAN@EXAMPLE.COM", " Ayesha.Rahman@Example.com "):
+            with self.subTest(email=email):
+                self.assertEqual(authenticate(email=email, password=self.PASSWORD), self.user)
+        with self.assertNumQueries(1):
+            authenticate(email="ayesha.rahman@example.com", password=self.PASSWORD)
+        response = self.login("ayesha.rahman@EXAMPLE.com")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json())
+
+    def test_wrong_password_and_unknown_email(self):
+        self.assertEqual(self.login("ayesha.rahman@example.com", "wrong-password").status_code, 400)
+        self.assertEqual(self.login("nobody@example.com").status_code, 400)
+
+    def test_registration_rejects_email_differing_only_in_case(self):
+        body = {
+            'username': 'ayesha2', 'email': 'AYESHA.rahman@example.COM', 'password': self.PASSWORD,
+            'created_by': 'self', 'gender': 'female', 'name': 'Ayesha', 'date_of_birth': '1996-04-12', 'height': 160,
+        }
+        response = self.client.post(reverse('user-registration'), body, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.json())
+        self.assertEqual(self.login("ayesha.rahman@example.com").status_code, 200)  # still unambiguous
+
+
+class ProfilePicPlaceholderTests(TestCase):
+    """The shared default picture is never rendered per profile; uploads are."""
+
+    def test_default_picture_is_not_rendered(self):
+        with patch('account_app.signals.enqueue_profile_pic') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                user = create_member("plain")
+            profile = user.profile
+            self.assertEqual(profile.profile_pic.name, 'def.png')
+            with self.captureOnCommitCallbacks(execute=True):
+                profile.save()
+            enqueue.assert_not_called()
+
+            profile.profile_pic = 'profile_pics/upload.png'
+            with self.captureOnCommitCallbacks(execute=True):
+                profile.save()
+            enqueue.assert_called_once_with(profile.pk)
+
+    def test_render_command_skips_placeholder(self):
+        create_member("plain")
+        uploaded = create_member("uploaded").profile
+        UserProfile.objects.filter(pk=uploaded.pk).update(profile_pic='profile_pics/upload.png')
+        with patch('account_app.management.commands.render_profile_pics.render_variants') as render:
+            call_command('render_profile_pics', stdout=StringIO())
+        render.assert_called_once_with(uploaded.pk)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BulkImportTests(TestCase):
+    HEADER = "username,email,password,created_by,gender,name,date_of_birth,height,preferred_age_min,preferred_age_max\n"
+
+    def row(self, username, email=None, date_of_birth="1994-03-02"):
+        return f"{username},{email or username + '@example.com'},s3cret-pass-123,self,male,{username.title()},{date_of_birth},170,25,35\n"
+
+    def test_csv_import_reports_bad_rows_and_duplicates(self):
+        create_member("taken")
+        csv_file = StringIO(
+            self.HEADER
+            + self.row("rafi")
+            + self.row("noheight").replace(",170,", ",,")
+            + self.row("taken")
+            + self.row("shouting", "TAKEN@example.com")
+            + self.row("rafi", "rafi2@example.com")
+            + self.row("nadia")
+        )
+        result = import_file(csv_file, 'csv', workers=1)
+        self.assertEqual(result.created, 2)
+        self.assertEqual(sorted(number for number, _ in result.errors), [3, 4, 5, 6])
+        errors = dict(result.errors)
+        self.assertIn('height', errors[3])
+        self.assertEqual(errors[4], {'username': ["Already in use."], 'email': ["Already in use."]})
+        self.assertEqual(errors[5], {'email': ["Already in use."]})
+        self.assertEqual(errors[6], {'username': ["Already in use."]})
+
+        rafi = User.objects.get(username="rafi")
+        self.assertEqual(sorted(result.user_ids), sorted([rafi.id, User.objects.get(username="nadia").id]))
+        self.assertTrue(rafi.check_password("s3cret-pass-123"))
+        self.assertEqual(rafi.profile.age, age_on(date(1994, 3, 2), date.today()))
+        self.assertEqual(rafi.preferences.preferred_age_max, 35)
+
+    def test_ndjson_import(self):
+        lines = [
+            json.dumps({'username': 'rafi', 'email': 'rafi@example.com', 'password': 's3cret-pass-123', 'created_by': 'self',
+                        'gender': 'male', 'name': 'Rafi', 'date_of_birth': '1994-03-02', 'height': 170}),
+            "{not json",
+            "",
+        ]
+        result = import_file(StringIO("\n".join(lines)), 'ndjson', workers=1)
+        self.assertEqual(result.created, 1)
+        self.assertEqual([number for number, _ in result.errors], [2])
+        self.assertTrue(User.objects.filter(username="rafi", profile__isnull=False, preferences__isnull=False).exists())
+
+    def test_materializes_imported_matches_like_a_rebuild(self):
+        create_member("existing")
+        csv_file = StringIO(self.HEADER + self.row("rafi") + self.row("nadia", date_of_birth="1960-01-01"))
+        with patch('account_app.bulk_import.refresh_matches', wraps=refresh_matches) as batched:
+            result = import_file(csv_file, 'csv', workers=1)
+        batched.assert_called_once_with(result.user_ids, result.user_ids)
+        stored = set(MatchHistory.objects.values_list('user_id', 'matched_user_id', 'match_percentage'))
+        self.assertTrue(stored)
+        rebuild_all_matches()
+        self.assertEqual(stored, set(MatchHistory.objects.values_list('user_id', 'matched_user_id', 'match_percentage')))
+
+    def test_admin_import_queues_matches(self):
+        create_member("existing")
+        admin = User.objects.create_superuser("admin", "admin@example.com", "admin-pass-123")
+        self.client.force_login(admin)
+        upload = SimpleUploadedFile("users.csv", (self.HEADER + self.row("rafi")).encode())
+        with patch('account_app.admin.queue_match_refresh') as queue:
+            response = self.client.post(reverse('admin:account_app_userprofile_import'), {'file': upload, 'format': 'csv'})
+        self.assertEqual(response.status_code, 302)
+        rafi = User.objects.get(username="rafi")
+        queue.assert_called_once_with([rafi.id], [rafi.id])
+        self.assertFalse(MatchHistory.objects.filter(user=rafi).exists())  # left to the background refresh
+
+
+class CachedJWTUserTests(TestCase):
+    """Cached users stop authenticating once deactivated or their password changes, in this process or another."""
+
+    def setUp(self):
+        cache.clear()
+        _cached_users.clear()
+        self.user = create_member("kabir")
+        self.auth = CachedJWTAuthentication()
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f"Bearer {token}")
+        return self.auth.authenticate(request)[0]
+
+    def token(self):
+        return str(RefreshToken.for_user(self.user).access_token)
+
+    def test_cache_hits_run_no_queries(self):
+        token = self.token()
+        self.authenticate(token)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(token), self.user)
+
+    def test_writes_without_post_save_wait_for_the_ttl(self):
+        token = self.token()
+        self.authenticate(token)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)  # or a save in another LocMemCache worker
+        self.assertEqual(self.authenticate(token), self.user)
+        _cached_users.clear()  # what JWT_USER_CACHE_TTL does to the entry
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_deactivation_by_save(self):
+        token = self.token()
+        self.authenticate(token)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_password_change(self):
+        with patch.object(api_settings, 'CHECK_REVOKE_TOKEN', True):
+            token = self.token()
+            self.authenticate(token)
+            User.objects.filter(pk=self.user.pk).update(password=make_password("new-pass-456"))
+            _cached_users.clear()  # expired
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate(token)
+
+            self.user.refresh_from_db()
+            token = self.token()
+            self.authenticate(token)
+            self.user.set_password("newer-pass-789")
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.save()
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate(token)
+
+    def test_entries_expire_and_evict(self):
+        users = LRUCache(maxsize=2, ttl=60)
+        with patch('account_app.authentication.time.monotonic', return_value=1000.0):
+            users.set(1, "a")
+            users.set(2, "b")
+            users.get(1)
+            users.set(3, "c")  # evicts 2, the least recently used
+            self.assertEqual((users.get(1), users.get(2), users.get(3)), ("a", None, "c"))
+        with patch('account_app.authentication.time.monotonic', return_value=1061.0):
+            self.assertIsNone(users.get(1))
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        self.store = RevocationStore()
+        self.expires_at = timezone.now() + timedelta(hours=1)
+
+    def test_revoke_and_lookup(self):
+        self.store.revoke("revoked-jti", self.expires_at)
+        self.assertTrue(self.store.is_revoked("revoked-jti"))
+        with self.assertNumQueries(0):  # filter miss: answered without the table
+            self.assertFalse(self.store.is_revoked("live-jti"))
+
+    def test_false_positive_falls_back_to_the_table(self):
+        self.store.revoke("revoked-jti", self.expires_at)
+        with patch.object(BloomFilter, '__contains__', return_value=True), self.assertNumQueries(1):
+            self.assertFalse(self.store.is_revoked("live-jti"))
+
+    def test_revocations_from_other_processes_are_synced_once(self):
+        self.assertFalse(self.store.is_revoked("elsewhere"))
+        RevokedToken.objects.create(jti="elsewhere", expires_at=self.expires_at)
+        self.store._sync(force=True)
+        self.store._sync(force=True)  # same row again inside the overlap window
+        self.assertTrue(self.store.is_revoked("elsewhere"))
+        self.assertEqual(self.store._filter.count, 1)
+
+    def test_expired_rows_are_purged(self):
+        self.store.revoke("expired", timezone.now() - timedelta(seconds=1))
+        self.store.revoke("current", self.expires_at)
+        self.assertFalse(self.store.is_revoked("expired"))  # in the filter, but no longer enforced
+        with patch('account_app.revocation.PRUNE_SECONDS', 0):
+            self.store.is_revoked("current")
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ["current"])
+        self.assertNotIn("expired", self.store._filter)
+        self.assertTrue(self.store.is_revoked("current"))
+
+    def test_logout_revokes_both_tokens(self):
+        user = create_member("kabir")
+        refresh = RefreshToken.for_user(user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        store = get_revocation_store()
+        store.reset()  # rebuilt from this test's table
+        self.addCleanup(store.reset)
+        self.assertEqual(client.get(reverse('user-preferences')).status_code, 200)
+        self.assertEqual(client.post(reverse('logout'), {'refresh_token': str(refresh)}, format='json').status_code, 200)
+        self.assertEqual(client.get(reverse('user-preferences')).status_code, 401)
+        self.assertTrue(store.is_revoked(refresh[api_settings.JTI_CLAIM]))
+
+
+@override_settings(REPLICA_DATABASES=['replica1'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """replica1 mirrors the test database, so what matters is which connection each query uses."""
+    databases = {'default', 'replica1'}
+
+    def setUp(self):
+        cache.clear()
+        self.me = create_member("me")
+        create_member("other")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.me).access_token}")
+
+    def replica_queries(self, call):
+        with CaptureQueriesContext(connections['replica1']) as replica:
+            result = call()
+        return result, len(replica)
+
+    def find_matches(self):
+        self.client.cookies.clear()  # a JWT client that never sends the pin cookie back
+        return self.client.post(reverse('find_matches'))
+
+    def test_views_read_from_the_replica(self):
+        response, queries = self.replica_queries(self.find_matches)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(queries, 0)
+
+    def test_snapshot_and_geo_index_refresh_from_the_primary(self):
+        path = os.path.join(self.enterContext(TemporaryDirectory()), 'geo_index.kdtree')
+        build_geo_index(path)
+        index = GeoIndex(path)
+
+        def refresh():
+            get_profile_snapshot().invalidate()
+            get_profile_snapshot(force=True)
+            index.refresh(force=True)
+
+        with replica_reads(APIRequestFactory().get('/')):
+            _, queries = self.replica_queries(refresh)
+        self.assertEqual(queries, 0)
+        self.assertEqual(len(get_profile_snapshot()), 2)
+
+    def test_only_real_writes_pin_the_user(self):
+        pinned = PIN_CACHE_KEY.format(self.me.pk)
+        response = self.client.get(reverse('user-preferences'))  # get_or_create that finds the row
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertIsNone(cache.get(pinned))
+        self.assertGreater(self.replica_queries(self.find_matches)[1], 0)
+
+        response = self.client.put(reverse('user-preferences'), {'preferred_age_max': 40}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertTrue(cache.get(pinned))
+        self.assertEqual(self.replica_queries(self.find_matches)[1], 0)  # pinned by user id, without the cookie
+
+    def test_pin_cache_check(self):
+        self.assertEqual([warning.id for warning in check_pin_cache(None)], ['account_app.W001'])  # LocMemCache
+        with patch('account_app.authentication.cache_is_shared', return_value=True):
+            self.assertEqual(check_pin_cache(None), [])
+        with override_settings(REPLICA_DATABASES=[]):
+            self.assertEqual(check_pin_cache(None), [])
+
+
+class RankedMatchParityTests(TestCase):
+    """?limit=K ranks exactly like scoring every candidate with calculate_match_percentage."""
+
+    def setUp(self):
+        self.me = create_member("me", height=170)
+        UserPreference.objects.filter(user=self.me).update(preferred_height_min=160, preferred_height_max=180)
+        for i in range(4):  # identical candidates: ties on score and distance, broken by user id
+            create_member(f"twin{i}", latitude=23.9)
+        create_member("far", latitude=25.0)  # beyond the 50 km location criterion
+        create_member("older", date_of_birth=date(1970, 1, 1))
+        create_member("tall", height=190, latitude=23.85)
+        create_member("unlocated", latitude=None, longitude=None)
+        picky = create_member("picky", latitude=23.82)
+        UserPreference.objects.filter(user=picky).update(preferred_height_min=180, preferred_height_max=200)
+        unpicky = create_member("unpicky", latitude=23.95)
+        UserPreference.objects.filter(user=unpicky).update(preferred_age_min=None, preferred_age_max=None)
+        get_profile_snapshot().invalidate()
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def ranked(self, query):
+        response = self.client.get(reverse('find_matches_with_all_percentise') + query)
+        self.assertEqual(response.status_code, 200)
+        return [(match['user_id'], match['match_percentage']) for match in response.json()['matches']]
+
+    def brute_force(self, mutual=False, min_score=0):
+        me, mine = UserProfile.objects.get(user=self.me), UserPreference.objects.get(user=self.me)
+        ranked = []
+        for profile in UserProfile.objects.exclude(user=self.me).select_related('user__preferences'):
+            score = calculate_match_percentage(me, profile, mine)
+            if mutual:
+                score = math.sqrt(score * calculate_match_percentage(profile, me, profile.user.preferences))
+            located = profile.latitude is not None and profile.longitude is not None
+            distance = calculate_distance(me.latitude, me.longitude, profile.latitude, profile.longitude) if located else math.inf
+            if score > 0 and score >= min_score:
+                ranked.append((-score, distance, profile.user_id))
+        return [(user_id, -score) for score, _, user_id in sorted(ranked)]
+
+    def assertSameRanking(self, ranked, expected):
+        self.assertEqual([user_id for user_id, _ in ranked], [user_id for user_id, _ in expected])
+        for (_, got), (_, want) in zip(ranked, expected):
+            self.assertAlmostEqual(got, want)
+
+    def test_top_matches(self):
+        expected = self.brute_force()
+        self.assertSameRanking(self.ranked("?limit=50"), expected)  # more than there are candidates
+        self.assertSameRanking(self.ranked("?limit=3"), expected[:3])  # cuts through the tied twins
+        self.assertSameRanking(self.ranked("?limit=50&min_score=75"), self.brute_force(min_score=75))
+
+    def test_mutual_matches(self):
+        expected = self.brute_force(mutual=True)
+        self.assertSameRanking(self.ranked("?limit=50&mutual=1"), expected)
+        self.assertSameRanking(self.ranked("?limit=2&mutual=1"), expected[:2])
+        self.assertSameRanking(self.ranked("?limit=50&mutual=1&min_score=80"), self.brute_force(mutual=True, min_score=80))
+
+    def test_preference_columns_are_cached_until_preferences_change(self):
+        with patch('account_app.snapshot.PreferenceColumns.load', wraps=PreferenceColumns.load) as load:
+            self.ranked("?limit=50&mutual=1")
+            self.ranked("?limit=50&mutual=1")
+            get_profile_snapshot(force=True)
+            self.ranked("?limit=50&mutual=1")
+            self.assertEqual(load.call_count, 1)
+
+            picky = UserPreference.objects.get(user__username="picky")
+            picky.preferred_height_min = picky.preferred_height_max = None
+            picky.save()
+            get_profile_snapshot(force=True)
+            self.assertSameRanking(self.ranked("?limit=50&mutual=1"), self.brute_force(mutual=True))
+            self.assertEqual(load.call_count, 2)
+
+
+class MetricsTests(TestCase):
+    def test_histogram_and_counter_rendering(self):
+        histogram = Histogram('latency', "Request latency.", (0.1, 1.0), ('view', 'method'))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(('say "hi"', 'GET'), value)
+        labels = 'view="say \\"hi\\"",method="GET"'
+        self.assertEqual(list(histogram.render()), [
+            "# HELP latency Request latency.",
+            "# TYPE latency histogram",
+            f'latency_bucket{{{labels},le="0.1"}} 2',  # bounds are inclusive
+            f'latency_bucket{{{labels},le="1.0"}} 3',
+            f'latency_bucket{{{labels},le="+Inf"}} 4',
+            f"latency_sum{{{labels}}} 3.65",
+            f"latency_count{{{labels}}} 4",
+        ])
+        counter = Counter('requests', "Requests.", ('status',))
+        counter.inc((200,))
+        counter.inc((200,))
+        self.assertEqual(list(counter.render())[2:], ['requests{status="200"} 2'])
+
+    def test_execute_wrapper_counts_queries_of_the_current_request(self):
+        self.assertIn(record_query, connection.execute_wrappers)
+        stats = _RequestStats(keep_sql=True)
+        token = _current.set(stats)
+        try:
+            User.objects.count()
+            UserProfile.objects.exists()
+        finally:
+            _current.reset(token)
+        User.objects.count()  # outside a request: not recorded
+        self.assertEqual(stats.queries, 2)
+        self.assertEqual(len(stats.sql), 2)
+        self.assertGreater(stats.db_seconds, 0)
+
+    def test_middleware_records_account_views(self):
+        self.client = APIClient()
+        self.client.force_authenticate(create_member("kabir"))
+        labels = ('user-profile-list', 'GET')
+        before = [REQUESTS._series.get((*labels, 200), 0)] + [metric._series.get(labels, [0])[-1] for metric in (QUERIES, SERIALIZER_TIME)]
+        self.assertEqual(self.client.get(reverse('user-profile-list')).status_code, 200)
+        self.assertEqual(REQUESTS._series[(*labels, 200)], before[0] + 1)
+        self.assertGreater(QUERIES._series[labels][-1], before[1])  # the sum of queries per request
+        self.assertGreater(SERIALIZER_TIME._series[labels][-1], before[2])  # rendered by ValuesSerializer
+
+        body = self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').content.decode()
+        self.assertIn('friendsbook_http_requests_total{view="user-profile-list",method="GET",status="200"}', body)
+        self.assertNotIn('view="metrics"', body)
+
+    def test_scrape_access(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 404)
+        # Through a reverse proxy on localhost
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.9').status_code, 404)
+        with override_settings(METRICS_TOKEN='scrape-secret'):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 404)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+            response = self.client.get(
+                '/metrics', REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.9', HTTP_AUTHORIZATION='Bearer scrape-secret',
+            )
+            self.assertEqual(response.status_code, 200)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.me = create_member("me")
+        self.other = create_member("other")
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def get(self, name, query, method='get', **kwargs):
+        return getattr(self.client, method)(reverse(name, kwargs=kwargs) + query)
+
+    def test_fields_and_exclude(self):
+        all_fields = set(self.get('user-profile-detail', '', pk=self.me.profile.pk).json())
+        for method, name, kwargs, rows in (
+            ('get', 'user-profile-list', {}, lambda body: body['results']),
+            ('get', 'user-profile-detail', {'pk': self.me.profile.pk}, lambda body: [body]),
+            ('post', 'find_matches', {}, lambda body: body['results']),
+        ):
+            with self.subTest(name):
+                picked = rows(self.get(name, '?fields=name, gender', method, **kwargs).json())
+                self.assertTrue(picked)
+                self.assertTrue(all(set(row) == {'name', 'gender'} for row in picked))
+                trimmed = rows(self.get(name, '?exclude=address,profile_pic_urls', method, **kwargs).json())
+                self.assertTrue(all(set(row) == all_fields - {'address', 'profile_pic_urls'} for row in trimmed))
+                both = rows(self.get(name, '?fields=name,gender&exclude=gender', method, **kwargs).json())
+                self.assertTrue(all(set(row) == {'name'} for row in both))
+                self.assertEqual(rows(self.get(name, '?exclude=', method, **kwargs).json()), rows(self.get(name, '', method, **kwargs).json()))
+
+    def test_empty_or_unknown_selections_are_rejected(self):
+        for query, param in (
+            ('?fields=', 'fields'), ('?fields=,', 'fields'), ('?fields=name,nickname', 'fields'),
+            ('?exclude=nickname', 'exclude'), ('?fields=name&exclude=name', 'exclude'),
+        ):
+            for method, name, kwargs in (
+                ('get', 'user-profile-list', {}),
+                ('get', 'user-profile-detail', {'pk': self.me.profile.pk}),
+                ('post', 'find_matches', {}),
+            ):
+                with self.subTest(query=query, view=name):
+                    response = self.get(name, query, method, **kwargs)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn(param, response.json())
+
+    def test_nested_explore_keys(self):
+        rows = self.get('list-other-users', '?fields=username,userprofile.country').json()['results']
+        self.assertEqual(self.get('list-other-users', '?fields=').status_code, 400)
+        self.assertTrue(rows)
+        self.assertTrue(all(set(row) == {'username', 'userprofile'} and set(row['userprofile']) == {'country'} for row in rows))
+
+    def test_match_list(self):
+        refresh_outgoing_matches(self.me)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.me).access_token}")  # for the async view
+        for name in ('find_matches_with_all_percentise', 'async_find_matches_with_all_percentise'):
+            with self.subTest(name):
+                stored = self.get(name, '?fields=username,match_percentage').json()['matches']
+                self.assertTrue(stored)
+                self.assertTrue(all(set(row) == {'username', 'match_percentage'} for row in stored))
+                ranked = self.get(name, '?limit=5&mutual=1&exclude=profile_pic,distance').json()['matches']
+                self.assertTrue(ranked)
+                self.assertTrue(all(set(row) == {'user_id', 'username', 'match_percentage', 'outgoing_percentage', 'incoming_percentage'} for row in ranked))
+                self.assertEqual(self.get(name, '?fields=nickname').status_code, 400)
+        with CaptureQueriesContext(connection) as queries:
+            self.get('find_matches_with_all_percentise', '?exclude=profile_pic')
+        self.assertNotIn('account_app_userprofile', queries.captured_queries[-1]['sql'])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.me = create_member("me")
+        self.other = create_member("other")
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def touch(self, model, **filters):
+        # A second later than anything so far, so HTTP dates (whole seconds) move as well
+        model.objects.filter(**filters).update(updated_at=timezone.now() + timedelta(seconds=2))
+
+    def test_list_etag(self):
+        url = reverse('user-profile-list')
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertNotIn('Last-Modified', first)
+        etag = first['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.touch(UserProfile, user=self.other)
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        etag = changed['ETag']
+
+        UserProfile.objects.filter(user=self.other).delete()  # max(updated_at) stays put
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_ignores_if_modified_since(self):
+        url = reverse('user-profile-list')
+        since = http_date(time.time() + 60)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+    def test_detail_if_modified_since(self):
+        url = reverse('user-profile-detail', kwargs={'pk': self.other.profile.pk})
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        since = first['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 304)
+        self.touch(UserProfile, user=self.other)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+    def test_detail_etag_covers_fields(self):
+        url = reverse('user-profile-detail', kwargs={'pk': self.other.profile.pk})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url + '?fields=name', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_preferences(self):
+        url = reverse('user-preferences')
+        first = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+        self.assertEqual(self.client.put(url, {'preferred_age_max': 40}, format='json').status_code, 200)
+        self.touch(UserPreference, user=self.me)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 200)
+
+
+class GeoIndexTests(TestCase):
+    def setUp(self):
+        self.path = os.path.join(self.enterContext(TemporaryDirectory()), 'geo_index.kdtree')
+        self.enterContext(override_settings(GEO_INDEX_PATH=self.path))
+
+    def test_kdtree_matches_brute_force(self):
+        rng = np.random.default_rng(3)
+        latitudes = np.concatenate((rng.uniform(-90, 90, 400), rng.uniform(88, 90, 50), rng.uniform(-5, 5, 50)))
+        longitudes = np.concatenate((rng.uniform(-180, 180, 400), rng.uniform(-180, 180, 50), rng.uniform(179, 181, 50) % 360 - 180))
+        user_ids = np.arange(1, len(latitudes) + 1)
+        KDTree.build(user_ids, latitudes, longitudes, leaf_size=8).save(self.path)
+        tree = KDTree.open(self.path)
+        index = GeoIndex(self.path)
+        index._swap(tree)  # the file alone: refresh() would drop these ids, which no profile in the database has
+
+        for latitude, longitude in ((0, 180), (89.5, 10), (23.8, 90.4), (-45, -120)):
+            distances = haversine_km(latitude, longitude, latitudes, longitudes)
+            for radius_km in (1, 50, 800, 5000, 30000):
+                with self.subTest(point=(latitude, longitude), radius_km=radius_km):
+                    rows, chords = tree.radius(unit_vectors([latitude], [longitude])[0], chord_for_km(radius_km))
+                    self.assertEqual(set(tree.user_ids[rows].tolist()), set(user_ids[distances <= radius_km].tolist()))
+                    np.testing.assert_allclose(km_for_chord(chords), distances[tree.user_ids[rows] - 1], rtol=1e-6, atol=1e-6)
+            for k in (1, 7, 64, len(user_ids) + 10):
+                with self.subTest(point=(latitude, longitude), k=k):
+                    found, found_km = index.nearest(latitude, longitude, k)
+                    expected = np.lexsort((user_ids, distances))[:k]
+                    self.assertEqual(found.tolist(), user_ids[expected].tolist())
+                    np.testing.assert_allclose(found_km, distances[expected], rtol=1e-6, atol=1e-6)
+
+    def test_delta_overrides_the_file(self):
+        staying = create_member("staying", latitude=23.80, longitude=90.40)
+        moving = create_member("moving", latitude=23.81, longitude=90.41)
+        unlocating = create_member("unlocating", latitude=23.82, longitude=90.42)
+        build_geo_index()
+        index = get_geo_index()
+        self.assertEqual(sorted(index.radius(23.8, 90.4, 10)[0].tolist()), sorted([staying.id, moving.id, unlocating.id]))
+
+        moving.profile.latitude, moving.profile.longitude = 48.85, 2.35
+        moving.profile.save()
+        unlocating.profile.latitude = unlocating.profile.longitude = None
+        unlocating.profile.save()
+        joined = create_member("joined", latitude=23.83, longitude=90.43)
+        index.refresh(force=True)
+
+        self.assertEqual(sorted(index.radius(23.8, 90.4, 10)[0].tolist()), sorted([staying.id, joined.id]))
+        self.assertEqual(index.radius(48.85, 2.35, 10)[0].tolist(), [moving.id])
+        user_ids, distances = index.nearest(23.8, 90.4, 10)
+        self.assertEqual(user_ids.tolist(), [staying.id, joined.id, moving.id])
+        self.assertEqual(profiles_within(48.85, 2.35, 10)[0].tolist(), [moving.id])
+
+    def test_deleted_profiles_leave_the_index(self):
+        staying = create_member("staying", latitude=23.80, longitude=90.40)
+        leaving = create_member("leaving", latitude=23.81, longitude=90.41)
+        moved_away = create_member("moved_away", latitude=23.82, longitude=90.42)
+        build_geo_index()
+        index = get_geo_index()
+        elsewhere = GeoIndex(self.path)  # another worker's copy, which our post_delete never reaches
+        elsewhere.refresh(force=True)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            leaving.delete()
+        self.assertEqual(sorted(index.radius(23.8, 90.4, 10)[0].tolist()), sorted([staying.id, moved_away.id]))
+
+        # A delete plus a create elsewhere leaves the count unchanged
+        with self.captureOnCommitCallbacks(execute=True):
+            moved_away.delete()
+        create_member("joined", latitude=48.85, longitude=2.35)
+        elsewhere.refresh(force=True)
+        self.assertEqual(elsewhere.radius(23.8, 90.4, 10)[0].tolist(), [staying.id])
+
+        client = APIClient()
+        client.force_authenticate(staying)
+        response = client.post(reverse('start_matching'), {"latitude": 23.8, "longitude": 90.4}, format='json')
+        self.assertEqual([row['username'] for row in response.data], ["staying"])
+
+    def test_start_matching_returns_the_closest(self):
+        members = [create_member(f"member{n}", latitude=23.80 + n / 100, longitude=90.40) for n in range(4)]
+        build_geo_index()
+        client = APIClient()
+        client.force_authenticate(members[0])
+        with patch('account_app.views.MAX_NEAREST', 2):
+            response = client.post(reverse('start_matching'), {"latitude": 23.83, "longitude": 90.40}, format='json')
+        self.assertEqual(sorted(row['username'] for row in response.data), ["member2", "member3"])
+
+    def test_workers_pick_up_a_new_file(self):
+        self.assertIsNone(get_geo_index())
+        create_member("someone")
+        build_geo_index()
+        self.assertIsNone(get_geo_index())  # not due for a check yet
+        with patch('account_app.geo_index.REFRESH_SECONDS', 0):
+            self.assertEqual(len(get_geo_index().tree), 1)
@@ -1,5 +1,6 @@
 from django.urls import path
-from .views import user_profile_list, logout, start_matching,update_preferred_education, update_preferred_location, find_matches_allDetails, last_joined_user_view, user_profile_detail, user_preferences, user_registration, user_login, explore_other_users, find_matches
+from . import async_views
+from .views import user_profile_list, logout, start_matching,update_preferred_education, update_preferred_location, find_matches_allDetails, last_joined_user_view, user_profile_detail, user_preferences, user_registration, user_login, explore_other_users, find_matches, export_profiles
 
 urlpatterns = [
     path('api/register/', user_registration, name='user-registration'),
@@ -9,11 +10,17 @@ urlpatterns = [
     
     path('profiles/', user_profile_list, name='user-profile-list'),
     path('profiles/<int:pk>/', user_profile_detail, name='user-profile-detail'),
+    path('profiles/export/', export_profiles, name='user-profile-export'),
     path('preferences/', user_preferences, name='user-preferences'),
     
     path('api/matching/', find_matches, name='find_matches'),
     path('start_matching/', start_matching, name='start_matching'),
     
+    # ASGI-friendly versions of the matching endpoints
+    path('async/api/matching/', async_views.find_matches, name='async_find_matches'),
+    path('async/start_matching/', async_views.start_matching, name='async_start_matching'),
+    path('async/api/find_matches_with_all_percentise/', async_views.find_matches_allDetails, name='async_find_matches_with_all_percentise'),
+    
     path('api/last_joined_user/', last_joined_user_view, name='last_joined_user'),
     path('api/find_matches_with_all_percentise/', find_matches_allDetails, name='find_matches_with_all_percentise'),
     path('update_preferred_education/', update_preferred_education, name='update_preferred_education'),
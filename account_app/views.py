@@ -1,8 +1,12 @@
+from datetime import date
+
+import numpy as np
+
 from django.shortcuts import get_object_or_404
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from .models import MatchHistory, UserProfile, UserPreference
 from .serializers import UserProfileSerializer, UserPreferenceSerializer, LastJoinedUserSerializer, UserProfileRegistrationSerializer, Explore_UserSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -11,21 +15,47 @@ from drf_yasg import openapi
 from .serializers import LoginSerializer
 from django.contrib.auth.models import User
 from math import radians, sin, cos, sqrt, atan2
-from .serializers import get_last_joined_user
-from geopy.distance import geodesic
+from .serializers import MatchSerializer, get_last_joined_user, parse_fieldset
+from .distance import haversine_km
+from .pagination import KeysetPagination
+from django.db.models import Q
+from django.http import Http404, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from .ages import age_on, age_range_q
+from .conditional import updated_at_condition
+from .export import iter_ndjson
+from .fast_serializers import ValuesSerializer
+from .geo_index import get_geo_index, near, profiles_within
+from .images import variant_url
+from .revocation import revoke_token
+from .routers import use_replica
+from .snapshot import get_profile_snapshot
+
+
+# ?fields= / ?exclude= on the profile, explore and matching endpoints (see serializers.parse_fieldset)
+FIELDSET_PARAMETERS = [
+    openapi.Parameter('fields', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Comma-separated fields to return; e.g. userprofile.country for one key of a nested field"),
+    openapi.Parameter('exclude', openapi.IN_QUERY, type=openapi.TYPE_STRING, description="Comma-separated fields to leave out"),
+]
+
+PREFERRED_AGE_PARAMETER = openapi.Parameter(
+    'preferred_age', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN,
+    description="Only profiles within your preferred age range (as of today)",
+)
 
 
 @swagger_auto_schema(method="post", request_body=LoginSerializer)
 @api_view(["POST"])
 @permission_classes([AllowAny])
 def user_login(request):
-    serializer = LoginSerializer(data=request.data)
+    serializer = LoginSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
         return Response(serializer.validated_data, status=status.HTTP_200_OK)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 def calculate_distance(lat1, lon1, lat2, lon2):
+    """Distance in km between two points; for many points at once use haversine_km."""
     R = 6371.0
     
     lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
@@ -39,38 +69,129 @@ def calculate_distance(lat1, lon1, lat2, lon2):
     distance = R * c
     return distance
 
+MAX_NEAREST = KeysetPagination.max_page_size
+
+
+def nearby_distances(latitude, longitude, radius_km=10):
+    """{user id: distance in km} of the MAX_NEAREST closest located profiles within `radius_km`, closest first."""
+    return closest_distances(*profiles_within(float(latitude), float(longitude), radius_km))
+
+
+def closest_distances(user_ids, distances):
+    """The MAX_NEAREST closest of `user_ids` as {user id: distance in km}, closest first."""
+    closest = np.lexsort((user_ids, distances))[:MAX_NEAREST]
+    return {int(user_ids[i]): round(float(distances[i]), 2) for i in closest}
+
+
+def preferred_age_q(user, query_params, field='date_of_birth'):
+    """
+    For `?preferred_age=1`: the user's preferred age range as a date_of_birth range on `field`, else Q().
+
+    The range is recomputed from today's date on every call, so it never goes stale
+    like UserProfile.age can, and it runs in SQL on the date_of_birth index.
+    """
+    if query_params.get('preferred_age', '').lower() not in ('1', 'true', 'yes'):
+        return Q()
+    age_range = UserPreference.objects.filter(user=user).values_list('preferred_age_min', 'preferred_age_max').first()
+    return age_range_q(*age_range, field=field) if age_range else Q()
+
+
+def nearest_profiles(user_profile, nearest, fast):
+    """
+    Nearest mode of find_matches: returns `(body, status)` for `?nearest=K`.
+
+    The K closest located profiles from the geo index, closest first, each with
+    its `distance` in km. Profiles deleted since the last index refresh are
+    skipped, so a page can come back a little short.
+    """
+    inputs, error = nearest_inputs(nearest)
+    if error:
+        return error
+    index, k = inputs
+    user_ids, distances = index.nearest(float(user_profile.latitude), float(user_profile.longitude), k + 1)  # +1: yourself
+    return nearest_results(user_profile, user_ids, distances, k, fast), 200
+
+
+def nearest_inputs(nearest):
+    """Validates `?nearest=K` and fetches the geo index: returns `((index, K), None)` or `(None, (body, status))`."""
+    try:
+        k = int(nearest)
+    except (TypeError, ValueError):
+        return None, ({"error": "nearest must be an integer."}, 400)
+    if not 1 <= k <= MAX_NEAREST:
+        return None, ({"error": f"nearest must be between 1 and {MAX_NEAREST}."}, 400)
+
+    index = get_geo_index()
+    if index is None:
+        return None, ({"error": "The geo index has not been built yet (manage.py build_geo_index)."}, 503)
+    return (index, k), None
+
+
+def nearest_results(user_profile, user_ids, distances, k, fast):
+    """The nearest-mode body for the index's `user_ids` and `distances` (closest first)."""
+    rows = {
+        row['user_id']: row
+        for row in fast.values(UserProfile.objects.filter(user_id__in=user_ids.tolist()).exclude(user_id=user_profile.user_id), 'user_id')
+    }
+    results = [
+        {**fast.to_representation(rows[user_id]), "distance": round(float(distance), 2)}
+        for user_id, distance in zip(user_ids.tolist(), distances) if user_id in rows
+    ]
+    return {"next": None, "results": results[:k]}
+
+
 @swagger_auto_schema(
     method='post', 
     request_body=Explore_UserSerializer, 
+    manual_parameters=FIELDSET_PARAMETERS + [
+        openapi.Parameter('radius', openapi.IN_QUERY, type=openapi.TYPE_NUMBER, default=50, description="Search radius in km"),
+        openapi.Parameter('nearest', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description=f"Return the K closest profiles instead (1-{MAX_NEAREST}), closest first"),
+        PREFERRED_AGE_PARAMETER,
+    ],
     responses={201: openapi.Response('User created', Explore_UserSerializer)}
 )
 @api_view(['POST'])
+@use_replica()
 def find_matches(request):
-    user_profile = request.user.userprofile
-    
+    user_profile = request.user.profile
+
     max_distance = float(request.GET.get("radius", 50))
 
-    # Get all other user profiles
-    users = UserProfile.objects.exclude(user=request.user) 
-    matched_users = []
+    if user_profile.latitude is None or user_profile.longitude is None:
+        return Response({"error": "Your profile has no location set."}, status=400)
 
-    for u in users:
-        if u.latitude and u.longitude:
-            distance = calculate_distance(user_profile.latitude, user_profile.longitude, u.latitude, u.longitude)
-            
-            if distance <= max_distance:
-                matched_users.append(u)
-    
-    serializer = UserProfileSerializer(matched_users, many=True)
-    return Response(serializer.data)
+    fast = ValuesSerializer(UserProfileSerializer, fields=parse_fieldset(request.query_params, UserProfileSerializer))
+    if 'nearest' in request.query_params:
+        body, status_code = nearest_profiles(user_profile, request.query_params['nearest'], fast)
+        return Response(body, status=status_code)
+
+    paginator = KeysetPagination()
+    # Only profiles near the user can be within range: exact ids from the geo index, or its spatial buckets
+    candidates = UserProfile.objects.exclude(user=request.user).filter(preferred_age_q(request.user, request.query_params))
+    users = fast.values(
+        near(candidates, user_profile.latitude, user_profile.longitude, max_distance),
+        'latitude', 'longitude', *paginator.ordering,
+    )
+
+    def within_radius(batch):
+        distances = haversine_km(
+            user_profile.latitude, user_profile.longitude,
+            [u['latitude'] for u in batch], [u['longitude'] for u in batch],
+        )
+        return [u for u, distance in zip(batch, distances) if distance <= max_distance]
+
+    matched_users = paginator.paginate_queryset(users, request, keep=within_radius)
+    return paginator.get_paginated_response(fast.serialize(matched_users))
 
 
 @swagger_auto_schema(
     method='post', 
     request_body=Explore_UserSerializer, 
+    manual_parameters=FIELDSET_PARAMETERS,
     responses={201: openapi.Response('User created', Explore_UserSerializer)}
 )
 @api_view(['POST'])
+@use_replica()
 def start_matching(request):
     # Extract latitude and longitude from the request data
     latitude = request.data.get('latitude')
@@ -82,16 +203,16 @@ def start_matching(request):
     # Create a reference location (tuple of latitude and longitude)
     reference_location = (latitude, longitude)
 
-    # Get all users to check distance (you can filter based on other criteria if needed)
-    users = User.objects.all()
+    # The closest users within a 10km radius, so only those get serialized
+    nearby = nearby_distances(latitude, longitude)
+    fields = parse_fieldset(request.query_params, Explore_UserSerializer)
+    # profile__isnull: the index can still list a profile deleted since its last refresh
+    users = Explore_UserSerializer.restrict(User.objects.filter(id__in=nearby, profile__isnull=False), fields)
 
-    # Create a list of serialized users with distance info
-    serializer = Explore_UserSerializer(users, many=True, context={'reference_location': reference_location})
-    
-    # Filter the users by distance (e.g., users within 10km radius)
-    matched_users = [user for user in serializer.data if user.get('distance') <= 10]  # 10km radius
-    
-    return Response(matched_users)
+    serializer = Explore_UserSerializer(
+        users, many=True, fields=fields, context={'reference_location': reference_location, 'distances': nearby}
+    )
+    return Response(serializer.data)
 
 
 
@@ -126,6 +247,7 @@ def user_registration(request):
 # User Profile List (GET, POST)
 @swagger_auto_schema(
     method='get', 
+    manual_parameters=FIELDSET_PARAMETERS,
     responses={200: UserProfileSerializer(many=True)}, 
     operation_description="Get all user profiles"
 )
@@ -137,11 +259,14 @@ def user_registration(request):
 )
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
+@use_replica(methods=['GET'])
+@updated_at_condition(lambda request: UserProfile.objects.all(), collection=True)
 def user_profile_list(request):
     if request.method == 'GET':
-        profiles = UserProfile.objects.all()
-        serializer = UserProfileSerializer(profiles, many=True)
-        return Response(serializer.data)
+        fast = ValuesSerializer(UserProfileSerializer, fields=parse_fieldset(request.query_params, UserProfileSerializer))
+        paginator = KeysetPagination()
+        profiles = paginator.paginate_queryset(fast.values(UserProfile.objects.all(), *paginator.ordering), request)
+        return paginator.get_paginated_response(fast.serialize(profiles))
 
     elif request.method == 'POST':
         serializer = UserProfileSerializer(data=request.data)
@@ -154,6 +279,7 @@ def user_profile_list(request):
 # User Profile Detail (GET, PUT, DELETE)
 @swagger_auto_schema(
     method='get', 
+    manual_parameters=FIELDSET_PARAMETERS,
     responses={200: UserProfileSerializer},
     operation_description="Retrieve a single user profile"
 )
@@ -170,14 +296,18 @@ def user_profile_list(request):
 )
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
+@updated_at_condition(lambda request, pk: UserProfile.objects.filter(pk=pk))
 def user_profile_detail(request, pk):
-    profile = get_object_or_404(UserProfile, pk=pk)
-
     if request.method == 'GET':
-        serializer = UserProfileSerializer(profile)
-        return Response(serializer.data)
+        fast = ValuesSerializer(UserProfileSerializer, fields=parse_fieldset(request.query_params, UserProfileSerializer))
+        profile = fast.values(UserProfile.objects.filter(pk=pk)).first()
+        if profile is None:
+            raise Http404
+        return Response(fast.to_representation(profile))
 
-    elif request.method == 'PUT':
+    profile = get_object_or_404(UserProfile, pk=pk)
+
+    if request.method == 'PUT':
         serializer = UserProfileSerializer(profile, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
@@ -203,6 +333,7 @@ def user_profile_detail(request, pk):
 )
 @api_view(['GET', 'PUT'])
 @permission_classes([IsAuthenticated])
+@updated_at_condition(lambda request: UserPreference.objects.filter(user=request.user))
 def user_preferences(request):
     preferences, created = UserPreference.objects.get_or_create(user=request.user)
 
@@ -218,14 +349,59 @@ def user_preferences(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-@swagger_auto_schema(method="get", responses={200: Explore_UserSerializer(many=True)})
+EXPORT_SOURCES = {
+    'profiles': (UserProfile, UserProfileSerializer),
+    'preferences': (UserPreference, UserPreferenceSerializer),
+}
+
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('model', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(EXPORT_SOURCES), default='profiles'),
+        openapi.Parameter('updated_after', openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME),
+        openapi.Parameter('updated_before', openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME),
+    ],
+    responses={200: 'Newline-delimited JSON, one record per line'},
+    operation_description="Stream every profile (or preference) as NDJSON, optionally only rows updated in a window"
+)
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_profiles(request):
+    source = request.GET.get('model', 'profiles')
+    if source not in EXPORT_SOURCES:
+        return Response({"error": f"model must be one of: {', '.join(EXPORT_SOURCES)}."}, status=status.HTTP_400_BAD_REQUEST)
+    model, serializer_class = EXPORT_SOURCES[source]
+
+    queryset = model.objects.order_by('updated_at', 'id')
+    for param, lookup in (('updated_after', 'updated_at__gt'), ('updated_before', 'updated_at__lte')):
+        value = request.GET.get(param)
+        if value:
+            moment = parse_datetime(value)
+            if moment is None:
+                return Response({"error": f"{param} must be an ISO 8601 timestamp."}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = queryset.filter(**{lookup: moment})
+
+    fast = ValuesSerializer(serializer_class)
+    return StreamingHttpResponse(iter_ndjson(queryset.values(*fast.columns), fast), content_type='application/x-ndjson')
+
+
+@swagger_auto_schema(method="get", manual_parameters=FIELDSET_PARAMETERS + [PREFERRED_AGE_PARAMETER], responses={200: Explore_UserSerializer(many=True)})
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@use_replica()
 def explore_other_users(request):
     """Returns a list of all users (including full profile) except the logged-in user."""
-    users = User.objects.exclude(id=request.user.id).exclude(is_superuser=True)
-    serializer = Explore_UserSerializer(users, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    fields = parse_fieldset(request.query_params, Explore_UserSerializer)
+    paginator = KeysetPagination(ordering=('date_joined', 'id'))
+    users = Explore_UserSerializer.restrict(
+        User.objects.exclude(id=request.user.id).exclude(is_superuser=True)
+        .filter(preferred_age_q(request.user, request.query_params, field='profile__date_of_birth')),
+        fields, *paginator.ordering,
+    )
+    page = paginator.paginate_queryset(users, request)
+    serializer = Explore_UserSerializer(page, many=True, fields=fields)
+    return paginator.get_paginated_response(serializer.data)
 
 
 @swagger_auto_schema(
@@ -245,13 +421,18 @@ def last_joined_user_view(request):
     
     
 
-def calculate_match_percentage(user_profile, other_user_profile, user_preferences):
+def calculate_match_percentage(user_profile, other_user_profile, user_preferences, distance=None):
+    """
+    Scores how well `other_user_profile` fits `user_preferences`.
+
+    Pass `distance` (km) when it was already computed in bulk with haversine_km.
+    """
     match_score = 0
     total_score = 0
 
     # Compare Age
     if user_preferences.preferred_age_min and user_preferences.preferred_age_max:
-        if user_preferences.preferred_age_min <= other_user_profile.age <= user_preferences.preferred_age_max:
+        if user_preferences.preferred_age_min <= age_on(other_user_profile.date_of_birth, date.today()) <= user_preferences.preferred_age_max:
             match_score += 1
         total_score += 1
 
@@ -269,10 +450,11 @@ def calculate_match_percentage(user_profile, other_user_profile, user_preference
 
     # Compare Location (you can calculate distance if latitude/longitude is set)
     if user_profile.latitude and user_profile.longitude and other_user_profile.latitude and other_user_profile.longitude:
-        distance = geodesic(
-            (user_profile.latitude, user_profile.longitude),
-            (other_user_profile.latitude, other_user_profile.longitude)
-        ).km
+        if distance is None:
+            distance = calculate_distance(
+                user_profile.latitude, user_profile.longitude,
+                other_user_profile.latitude, other_user_profile.longitude,
+            )
         if distance <= 50:  # 50 km as a threshold for matching location
             match_score += 1
         total_score += 1
@@ -286,35 +468,146 @@ def calculate_match_percentage(user_profile, other_user_profile, user_preference
     return match_percentage
 
 
-@api_view(['GET'])
-def find_matches_allDetails(request):
+MAX_TOP_MATCHES = KeysetPagination.max_page_size
+
+
+def ranked_matches(user, query_params):
     """
-    Find matches for the logged-in user by comparing their profile and preferences with other users.
+    Top-K mode of the match list: returns `(body, status)` for `?limit=K[&min_score=S][&mutual=1]`.
+
+    Scores are computed live from the profile snapshot and ranked by score, then distance.
+    With `mutual`, the score is two-sided: it also counts how well the user fits
+    each candidate's own preferences.
     """
-    user = request.user
-    user_profile = UserProfile.objects.get(user=user)
-    user_preferences = UserPreference.objects.get(user=user)
+    inputs, error = ranked_matches_inputs(user, query_params)
+    if error:
+        return error
+    return score_ranked_matches(*inputs), 200
 
-    # Get all other users' profiles
-    other_users_profiles = UserProfile.objects.exclude(user=user)
 
-    matches = []
+def ranked_matches_inputs(user, query_params):
+    """
+    The database half of ranked_matches: validates the query and loads what
+    score_ranked_matches needs. Returns `(inputs, None)` or `(None, (body, status))`.
+    """
+    try:
+        limit = int(query_params.get('limit'))
+        min_score = float(query_params.get('min_score', 0))
+    except (TypeError, ValueError):
+        return None, ({"error": "limit must be an integer and min_score a number."}, 400)
+    if not 1 <= limit <= MAX_TOP_MATCHES or not 0 <= min_score <= 100:
+        return None, ({"error": f"limit must be between 1 and {MAX_TOP_MATCHES} and min_score between 0 and 100."}, 400)
+
+    try:
+        user_profile = UserProfile.objects.get(user=user)
+        user_preferences = UserPreference.objects.get(user=user)
+    except (UserProfile.DoesNotExist, UserPreference.DoesNotExist):
+        return None, ({"error": "Profile not found."}, 404)
+
+    snapshot = get_profile_snapshot()
+    mutual = query_params.get('mutual', '').lower() in ('1', 'true', 'yes')
+    preferences = snapshot.preference_columns() if mutual else None
+    return (snapshot, user_profile, user_preferences, preferences, limit, min_score), None
+
+
+def score_ranked_matches(snapshot, user_profile, user_preferences, preferences, limit, min_score):
+    """The CPU half of ranked_matches: ranks the snapshot (two-sided when `preferences` is given); runs no query."""
+    if preferences is not None:
+        top = snapshot.mutual_matches(user_profile, user_preferences, preferences, limit, min_score)
+        matches = [
+            {
+                "user_id": user_id,
+                "username": username,
+                "match_percentage": mutual,
+                "outgoing_percentage": outgoing,  # how well they fit my preferences
+                "incoming_percentage": incoming,  # how well I fit theirs
+                "distance": None if distance is None else round(distance, 2),
+                "profile_pic": pic_url,
+            }
+            for user_id, username, mutual, outgoing, incoming, pic_url, distance in top
+        ]
+        return {"matches": matches, "next": None}
+
+    top = snapshot.top_matches(user_profile, user_preferences, limit, min_score)
+    matches = [
+        {
+            "user_id": user_id,
+            "username": username,
+            "match_percentage": percentage,
+            "distance": None if distance is None else round(distance, 2),
+            "profile_pic": pic_url,
+        }
+        for user_id, username, percentage, pic_url, distance in top
+    ]
+    return {"matches": matches, "next": None}
+
+
+# Match-list key -> (MatchHistory columns it reads, value from the values() row)
+STORED_MATCH_FIELDS = {
+    "user_id": (('matched_user_id',), lambda row: row['matched_user_id']),
+    "username": (('matched_user__username',), lambda row: row['matched_user__username']),
+    "match_percentage": (('match_percentage',), lambda row: row['match_percentage']),
+    "profile_pic": (
+        ('matched_user__profile__profile_pic', 'matched_user__profile__profile_pic_variants'),
+        lambda row: variant_url(row['matched_user__profile__profile_pic'], row['matched_user__profile__profile_pic_variants'], 'thumb'),
+    ),
+}
+
+
+def stored_matches(user, fields):
+    """
+    The user's MatchHistory for the match list: `(values() rows, keys)`.
+
+    Only the columns the picked `fields` (parse_fieldset output, None for all)
+    need are selected, so e.g. leaving out profile_pic skips the profile join.
+    """
+    keys = [key for key in STORED_MATCH_FIELDS if fields is None or key in fields]
+    columns = {'id', 'match_percentage'}.union(*(STORED_MATCH_FIELDS[key][0] for key in keys))  # + the keyset
+    return MatchHistory.objects.filter(user=user).values(*sorted(columns)), keys
+
+
+def stored_match_entry(row, keys):
+    return {key: STORED_MATCH_FIELDS[key][1](row) for key in keys}
+
 
-    # Compare each user to the logged-in user
-    for other_user_profile in other_users_profiles:
-        match_percentage = calculate_match_percentage(user_profile, other_user_profile, user_preferences)
+def pick_match_fields(body, fields):
+    """Drops the keys not in `fields` from each live-ranked match in `body` (None keeps them all)."""
+    if fields is not None:
+        body['matches'] = [{key: value for key, value in match.items() if key in fields} for match in body['matches']]
+    return body
 
-        # If match is above a certain threshold, add to matches
-        if match_percentage > 0:  # You can define a minimum match percentage if needed
-            matches.append({
-                "user_id": other_user_profile.user.id,
-                "username": other_user_profile.user.username,
-                "match_percentage": match_percentage,
-                "profile_pic": other_user_profile.profile_pic.url if other_user_profile.profile_pic else None,
-            })
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=FIELDSET_PARAMETERS + [
+        openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description="Return only the best N matches, scored live"),
+        openapi.Parameter('min_score', openapi.IN_QUERY, type=openapi.TYPE_NUMBER, description="With limit: minimum match percentage"),
+        openapi.Parameter('mutual', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN, description="With limit: rank by two-sided compatibility"),
+    ],
+)
+@api_view(['GET'])
+@use_replica()
+def find_matches_allDetails(request):
+    """
+    Find matches for the logged-in user by comparing their profile and preferences with other users.
+
+    Scores are precomputed into MatchHistory (see account_app.matching), so this only reads them.
+    With `limit`, the best matches are ranked live instead (see ranked_matches).
+    """
+    fields = parse_fieldset(request.query_params, MatchSerializer)
+    if 'limit' in request.query_params:
+        body, status_code = ranked_matches(request.user, request.query_params)
+        if status_code == 200:
+            body = pick_match_fields(body, fields)
+        return Response(body, status=status_code)
+
+    rows, keys = stored_matches(request.user, fields)
+    # Best matches first; id breaks ties so the keyset stays unique
+    paginator = KeysetPagination(ordering=('-match_percentage', 'id'))
+    matches = [stored_match_entry(row, keys) for row in paginator.paginate_queryset(rows, request)]
 
     # Return the list of matches
-    return Response({"matches": matches})
+    return Response({"matches": matches, "next": paginator.get_next_link()})
 
 
 from .serializers import PreferredEducationSerializer, PreferredLocationSerializer
@@ -369,7 +662,8 @@ def logout(request):
             return Response({"detail": "Refresh token is required"}, status=400)
 
         token = RefreshToken(refresh_token)
-        token.blacklist()  # This will blacklist the token (assuming the blacklist app is enabled)
+        revoke_token(token)
+        revoke_token(request.auth)  # the access token used for this request
 
         return Response({"detail": "Successfully logged out"}, status=200)
     except Exception as e:
@@ -7,7 +7,9 @@ import dotenv
 def main():
     dotenv.load_dotenv()
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Config.settings')
+    # `manage.py test` runs with the test settings unless DJANGO_SETTINGS_MODULE or --settings says otherwise
+    default_settings = 'Config.test_settings' if sys.argv[1:2] == ['test'] else 'Config.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', default_settings)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc: